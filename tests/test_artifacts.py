@@ -0,0 +1,87 @@
+import pandas as pd
+import pytest
+
+from zsb.artifacts import read_artifact, write_artifact
+
+METADATAS = [
+    {"topic": "a", "difficulty": "easy"},
+    {"topic": "b", "difficulty": None},
+    None,
+    {"topic": "a"},
+    {"difficulty": "hard", "topic": "c"},
+]
+
+
+@pytest.mark.parametrize("extension", ["jsonl", "parquet", "arrow"])
+def test_encoded_metadata_round_trip(tmp_path, extension):
+    df = pd.DataFrame(
+        {
+            "prompt": [f"prompt {i}" for i in range(len(METADATAS))],
+            "metadata": METADATAS,
+        }
+    )
+    path = tmp_path / f"artifact.{extension}"
+    write_artifact(df, path, encode_metadata=True)
+    read = read_artifact(path)
+    assert read.columns.tolist() == ["prompt", "metadata"]
+    assert read["prompt"].tolist() == df["prompt"].tolist()
+    assert read["metadata"].tolist() == METADATAS
+
+
+@pytest.mark.parametrize("extension", ["jsonl", "parquet", "arrow"])
+def test_encoded_metadata_with_vocabularies(tmp_path, extension):
+    df = pd.DataFrame({"prompt": ["p", "q"], "metadata": [{"topic": "b"}, {}]})
+    path = tmp_path / f"artifact.{extension}"
+    write_artifact(
+        df, path, encode_metadata=True, vocabularies={"topic": ["a", "b"], "other": []}
+    )
+    assert read_artifact(path)["metadata"].tolist() == [{"topic": "b"}, {}]
+
+
+def test_unhashable_metadata_is_refused(tmp_path):
+    df = pd.DataFrame({"prompt": ["p"], "metadata": [{"topics": ["a", "b"]}]})
+    with pytest.raises(ValueError, match="topics"):
+        write_artifact(df, tmp_path / "artifact.jsonl", encode_metadata=True)
+
+
+@pytest.mark.parametrize("suffix", ["jsonl", "jsonl.gz", "jsonl.zst"])
+def test_jsonl_round_trip(tmp_path, suffix):
+    df = pd.DataFrame(
+        {
+            "prompt": ["a prompt\nwith a newline", "çà 中文\u2028"],
+            "judgement": [3, 5],
+            "metadata": [{"topic": "a"}, None],
+        }
+    )
+    path = tmp_path / f"artifact.{suffix}"
+    write_artifact(df, path)
+    read = read_artifact(path)
+    assert read.columns.tolist() == df.columns.tolist()
+    assert read.to_dict("records") == df.to_dict("records")
+
+
+@pytest.mark.parametrize("extension", ["parquet", "arrow"])
+def test_columnar_round_trip_matches_jsonl(tmp_path, extension):
+    df = pd.DataFrame(
+        {
+            "prompt": [f"prompt {i}" for i in range(len(METADATAS))],
+            "metadata": METADATAS,
+            "judgement": [1, 2, 3, 4, 5],
+        }
+    )
+    write_artifact(df, tmp_path / "artifact.jsonl")
+    jsonl = read_artifact(tmp_path / "artifact.jsonl")
+    path = tmp_path / f"artifact.{extension}"
+    write_artifact(jsonl, path)
+    read = read_artifact(path)
+    assert read.columns.tolist() == df.columns.tolist()
+    assert read["metadata"].tolist() == METADATAS
+    # attributes keep their order of first appearance
+    assert list(read["metadata"][0]) == list(METADATAS[0])
+    write_artifact(read, tmp_path / "converted.jsonl")
+    assert read_artifact(tmp_path / "converted.jsonl").to_dict("records") == (
+        jsonl.to_dict("records")
+    )
+    projected = read_artifact(path, columns=["metadata", "prompt"])
+    assert projected.columns.tolist() == ["metadata", "prompt"]
+    assert projected["metadata"].tolist() == METADATAS
@@ -0,0 +1,49 @@
+import random
+
+import numpy as np
+import pytest
+
+from zsb.catalog import CombinationSpace
+from zsb.tasks import available_tasks
+from zsb.utils import get_all_possible_combinations
+
+SUBTOPICS = {"a": ["a1", "a2"], "b": ["b1"], "c": ["c1", "c2", "c3"]}
+
+TASK_ATTRIBUTES = {
+    "topic": ["a", "b", "c", "a"],
+    "subtopic": {"_depends_on": "topic", "callable": lambda topic: SUBTOPICS[topic]},
+    "language": ["en", "pt"],
+    "style": {
+        "_depends_on": "language",
+        "callable": lambda language: ["formal", "casual"] if language == "en" else [],
+    },
+}
+
+
+def test_indexing_matches_all_combinations():
+    combinations = get_all_possible_combinations(TASK_ATTRIBUTES)
+    space = CombinationSpace(TASK_ATTRIBUTES)
+    assert len(space) == len(combinations)
+    for i, combination in enumerate(combinations):
+        assert space[i] == combination
+    assert space[:] == combinations
+    assert space[-1] == combinations[-1]
+    with pytest.raises(IndexError):
+        space[len(combinations)]
+
+
+def test_indexing_matches_all_combinations_of_a_task():
+    task_attributes = available_tasks["general_translation_en_de"].task_attributes
+    combinations = get_all_possible_combinations(task_attributes)
+    space = CombinationSpace(task_attributes)
+    assert len(space) == len(combinations)
+    indices = np.random.default_rng(0).integers(0, len(space), 500)
+    for i in indices:
+        assert space[int(i)] == combinations[i]
+
+
+def test_shuffled_matches_shuffling_all_combinations():
+    combinations = get_all_possible_combinations(TASK_ATTRIBUTES)
+    random.Random(124).shuffle(combinations)
+    space = CombinationSpace(TASK_ATTRIBUTES).shuffled(random.Random(124))
+    assert space[:] == combinations
@@ -0,0 +1,30 @@
+from io import BytesIO
+
+from PIL import Image as PILImage
+
+from zsb.images import ImageStore, encode_jpeg
+
+
+def make_image() -> PILImage.Image:
+    return PILImage.linear_gradient("L").convert("RGB")
+
+
+def test_encode_jpeg_matches_pil_default_quality():
+    image = make_image()
+    buffered = BytesIO()
+    image.save(buffered, format="jpeg")
+    assert encode_jpeg(image) == buffered.getvalue()
+
+
+def test_image_store_deduplicates(tmp_path):
+    store = ImageStore(tmp_path)
+    image_id = store.put(make_image())
+    assert store.put(make_image()) == image_id
+    assert [p.name for p in tmp_path.rglob("*") if p.is_file()] == [f"{image_id}.jpg"]
+    assert store.data_url(image_id).startswith("data:image/jpeg;base64,")
+
+
+def test_image_store_root_is_absolute(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = ImageStore("images")
+    assert store.root == tmp_path / "images"
@@ -0,0 +1,138 @@
+from collections.abc import Sequence
+from types import SimpleNamespace
+
+import litellm
+import pytest
+
+import zsb.models
+from zsb.models import VLLM, LiteLLM, MockModel
+
+MODEL_ARGS = {"proper_model_args": {"model": "gpt-4o"}, "sampling_params": {}}
+
+
+def mock_response(content: str) -> SimpleNamespace:
+    return SimpleNamespace(
+        choices=[
+            SimpleNamespace(
+                message=SimpleNamespace(content=content), finish_reason="stop"
+            )
+        ],
+        usage=SimpleNamespace(prompt_tokens=1, completion_tokens=1),
+    )
+
+
+def test_litellm_does_not_retry_permanent_errors(monkeypatch):
+    calls = 0
+
+    def completion(**kwargs):
+        nonlocal calls
+        calls += 1
+        raise litellm.BadRequestError("bad request", "gpt-4o", "openai")
+
+    monkeypatch.setattr(zsb.models, "completion", completion)
+    with pytest.raises(litellm.BadRequestError):
+        LiteLLM(MODEL_ARGS).generate("prompt")
+    assert calls == 1
+
+
+def test_litellm_retries_transient_errors(monkeypatch):
+    calls = 0
+
+    def completion(**kwargs):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise litellm.RateLimitError("rate limited", "openai", "gpt-4o")
+        return mock_response("answer")
+
+    monkeypatch.setattr(zsb.models, "completion", completion)
+    monkeypatch.setattr(zsb.models, "completion_cost", lambda **kwargs: 0.0)
+    output, metrics = LiteLLM(MODEL_ARGS).generate_with_metrics("prompt")
+    assert output == "answer"
+    assert metrics.retries == 1
+
+
+def test_mock_model_is_deterministic():
+    model_args = {"proper_model_args": {"seed": 1}, "sampling_params": {}}
+    outputs = MockModel(model_args).batch_generate(["a", "b"])
+    assert MockModel(model_args).batch_generate(["a", "b"]) == outputs
+
+
+def test_litellm_restores_stop_on_stop_finish():
+    stop = ["<END OF REFERENCE>"]
+    output = "<START OF REFERENCE>\n<b>bold</b>\n"
+    restored = LiteLLM.restore_stop(output, stop, "stop")
+    assert restored == output + stop[0]
+    assert LiteLLM.restore_stop(restored, stop, "stop") == restored
+    assert LiteLLM.restore_stop(output, stop, "length") == output
+
+
+class DataUrl(str):
+    """Data URL that counts how many of its instances are alive."""
+
+    live = 0
+
+    def __new__(cls, value: str) -> "DataUrl":
+        cls.live += 1
+        return super().__new__(cls, value)
+
+    def __del__(self) -> None:
+        DataUrl.live -= 1
+
+
+class LazyUrls(Sequence):
+    def __init__(self, n: int) -> None:
+        self.n = n
+
+    def __len__(self) -> int:
+        return self.n
+
+    def __getitem__(self, i):
+        return DataUrl(f"data:image/jpeg;base64,{i}")
+
+
+class FakeLLM:
+    def __init__(self) -> None:
+        self.peak_live_urls = 0
+
+    def chat(self, messages, sampling_params, use_tqdm=True):
+        self.peak_live_urls = max(self.peak_live_urls, DataUrl.live)
+        return [
+            SimpleNamespace(
+                outputs=[
+                    SimpleNamespace(text="answer", token_ids=[0], finish_reason="stop")
+                ],
+                prompt_token_ids=[0],
+                metrics=None,
+            )
+            for _ in messages
+        ]
+
+
+def test_vllm_encodes_images_in_windows():
+    model = VLLM.__new__(VLLM)
+    model.model = FakeLLM()
+    model.sampling_params = None
+    model.system_prompt = None
+    model.image_window_size = 8
+    model.run_metrics = []
+    model.run_seconds = 0.0
+    generations = model.batch_generate(["prompt"] * 50, LazyUrls(50))
+    assert generations == ["answer"] * 50
+    assert model.model.peak_live_urls == 8
+    assert DataUrl.live == 0
+
+
+def test_vllm_close_releases_the_engine():
+    model = VLLM.__new__(VLLM)
+    model.model = FakeLLM()
+    model.close()
+    assert not hasattr(model, "model")
+
+
+def test_run_summary_covers_every_batch():
+    model = MockModel({"proper_model_args": {"seed": 1}, "sampling_params": {}})
+    model.batch_generate(["a", "b"])
+    model.batch_generate(["c"])
+    assert len(model.last_metrics) == 1
+    assert model.log_run_summary()["requests"] == 3
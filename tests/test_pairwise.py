@@ -0,0 +1,50 @@
+import numpy as np
+
+from zsb.pairwise import fit_bradley_terry, reconcile_orders, swiss_pairs
+
+
+def test_bradley_terry_orders_models():
+    # 0 beats 1 and 2 most of the time, 1 beats 2 most of the time
+    wins = np.array([[0, 8, 9], [2, 0, 7], [1, 3, 0]])
+    log_strengths = fit_bradley_terry(wins)
+    assert np.isclose(log_strengths.mean(), 0)
+    assert log_strengths[0] > log_strengths[1] > log_strengths[2]
+
+
+def test_bradley_terry_matches_win_rate_of_two_models():
+    # 0 beat 1 three times and lost once
+    wins = np.array([[0, 3], [1, 0]])
+    log_strengths = fit_bradley_terry(wins, prior=0)
+    p_win = 1 / (1 + np.exp(log_strengths[1] - log_strengths[0]))
+    assert np.isclose(p_win, 0.75)
+
+
+def test_bradley_terry_keeps_undefeated_models_finite():
+    wins = np.array([[0, 5], [0, 0]])
+    log_strengths = fit_bradley_terry(wins)
+    assert np.isfinite(log_strengths).all()
+    assert log_strengths[0] > log_strengths[1]
+
+
+def test_reconcile_orders():
+    judgements = np.array(["A", "A", "B", "B"])
+    judgements_swapped = np.array(["A", "B", "B", "A"])
+    a_places = np.array([0, 1, 0, 1])
+    verdicts, stats = reconcile_orders(judgements, judgements_swapped, a_places)
+    assert verdicts.tolist() == ["win", "tie", "loss", "tie"]
+    assert stats["n_items"] == 4
+    assert stats["order_consistency"] == 0.5
+    assert stats["win_rate_A"] == 0.25
+    assert stats["tie_rate"] == 0.5
+    assert stats["win_rate_B"] == 0.25
+    # the answer shown first won in the first order of items 0 and 3, and in the swapped
+    # order of items 2 and 3
+    assert stats["first_position_win_rate"] == 0.5
+
+
+def test_swiss_pairs_shift_offset_on_odd_rounds():
+    scores = np.array([4.0, 3.0, 2.0, 1.0, 0.0])
+    assert swiss_pairs(scores, 0) == [(0, 1), (2, 3)]
+    assert swiss_pairs(scores, 1) == [(1, 2), (3, 4)]
+    # without pairs left below the leader, odd rounds fall back to the even pairing
+    assert swiss_pairs(scores, 1, available={(0, 1)}) == [(0, 1)]
@@ -0,0 +1,24 @@
+import json
+
+import pytest
+
+from zsb.tasks import available_tasks
+
+FEEDBACK = 'The answer returns {"key": "value"} and escapes it as {\\"key\\": \\"value\\"}.'
+
+
+@pytest.mark.parametrize("task", available_tasks.values(), ids=available_tasks.keys())
+def test_judge_stops_only_match_the_end(task):
+    outputs = {
+        "da": json.dumps({"feedback": FEEDBACK, "result": "4"}),
+        "relative": json.dumps({"feedback": FEEDBACK, "result": "A"}),
+    }
+    for kind, output in outputs.items():
+        for stop in task.stop_sequences.get(kind, []):
+            assert output.find(stop) in [-1, len(output) - len(stop)]
+
+
+def test_da_feedback_with_json_is_parsed():
+    task = available_tasks["general_purpose_chat_english"]
+    output = json.dumps({"feedback": FEEDBACK, "result": "4"})
+    assert task.parse_da_prompt_output(output) == (4, FEEDBACK)
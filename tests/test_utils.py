@@ -0,0 +1,19 @@
+import pytest
+
+from zsb.utils import iter_jsonl, read_lines, write_lines
+
+LINES = ["first line", "a line\nwith a newline", "", "çà 中文"]
+
+
+@pytest.mark.parametrize("suffix", ["txt", "txt.gz", "txt.zst"])
+def test_lines_round_trip(tmp_path, suffix):
+    path = tmp_path / f"lines.{suffix}"
+    write_lines(path, LINES, escape_newline=True)
+    assert read_lines(path, unescape_newline=True) == LINES
+
+
+@pytest.mark.parametrize("suffix", ["jsonl", "jsonl.gz", "jsonl.zst"])
+def test_iter_jsonl_skips_empty_lines(tmp_path, suffix):
+    path = tmp_path / f"records.{suffix}"
+    write_lines(path, ['{"a": 1}', "", '{"a": 2}'])
+    assert list(iter_jsonl(path)) == [{"a": 1}, {"a": 2}]
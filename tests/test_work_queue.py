@@ -0,0 +1,63 @@
+import time
+
+from zsb.work_queue import WorkQueue
+
+
+def make_queue(tmp_path, n_items: int = 10, chunk_size: int = 4) -> WorkQueue:
+    queue = WorkQueue(tmp_path / "queue.db")
+    queue.init(n_items, chunk_size, {"stage": "da_eval"})
+    return queue
+
+
+def test_chunks_cover_items(tmp_path):
+    queue = make_queue(tmp_path)
+    chunks = [queue.lease("worker", 60) for _ in range(3)]
+    assert [(c["start"], c["end"]) for c in chunks] == [(0, 4), (4, 8), (8, 10)]
+    assert queue.lease("worker", 60) is None
+    assert queue.progress()["leased"] == 3
+    assert queue.config() == {"stage": "da_eval"}
+
+
+def test_expired_lease_is_handed_out_again(tmp_path):
+    queue = make_queue(tmp_path, n_items=4)
+    chunk = queue.lease("dead", 0.2)
+    assert queue.lease("alive", 60) is None
+    time.sleep(0.3)
+    retry = queue.lease("alive", 60)
+    assert retry["chunk_id"] == chunk["chunk_id"]
+    assert retry["attempts"] == 1
+    # the first worker lost its lease, and its late results are not kept
+    assert not queue.heartbeat(chunk["chunk_id"], "dead", 60)
+    assert queue.complete(retry["chunk_id"], "alive", ["result"])
+    assert not queue.complete(chunk["chunk_id"], "dead", ["late result"])
+    assert queue.results() == ["result"]
+    assert queue.progress()["done"] == 1
+
+
+def test_heartbeat_keeps_lease(tmp_path):
+    queue = make_queue(tmp_path, n_items=4)
+    chunk = queue.lease("worker", 0.2)
+    for _ in range(3):
+        time.sleep(0.1)
+        assert queue.heartbeat(chunk["chunk_id"], "worker", 0.2)
+    assert queue.lease("other", 60) is None
+
+
+def test_chunk_fails_after_max_attempts(tmp_path):
+    queue = make_queue(tmp_path, n_items=4)
+    for _ in range(2):
+        assert queue.lease("worker", 0, max_attempts=2) is not None
+        time.sleep(0.01)
+    assert queue.lease("worker", 0, max_attempts=2) is None
+    assert queue.progress()["failed"] == 1
+
+
+def test_retry_failed_resets_attempts(tmp_path):
+    queue = make_queue(tmp_path, n_items=4)
+    assert queue.lease("worker", 0, max_attempts=1) is not None
+    time.sleep(0.01)
+    assert queue.lease("worker", 0, max_attempts=1) is None
+    assert queue.retry_failed() == 1
+    assert queue.progress()["pending"] == 1
+    retry = queue.lease("worker", 60, max_attempts=1)
+    assert retry["attempts"] == 0
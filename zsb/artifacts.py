@@ -0,0 +1,579 @@
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from zsb.tracing import traced
+from zsb.utils import LineWriter, PathInput, iter_jsonl
+
+METADATA_PREFIX = "metadata."
+
+FORMAT_SUFFIXES = {
+    ".parquet": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+}
+
+FORMAT_EXTENSIONS = {"jsonl": "jsonl", "parquet": "parquet", "arrow": "arrow"}
+
+MANIFEST_NAME = "manifest.json"
+
+# rows serialized at once when writing jsonl artifacts
+JSONL_CHUNK_SIZE = 10000
+
+METADATA_CODES_COLUMN = "metadata_codes"
+
+# attributes missing from each row's metadata (null for rows without metadata), so that they
+# are told apart from attributes whose value is None
+METADATA_MISSING_COLUMN = "metadata_missing"
+
+COLUMN_ORDER_KEY = b"zsb.columns"
+
+ATTRIBUTE_DICTIONARY_KEY = b"zsb.attribute_dictionary"
+
+ATTRIBUTE_DICTIONARY_SUFFIX = ".attributes.json"
+
+ATTRIBUTE_DICTIONARY_FORMAT = 1
+
+# codes of attributes missing from a row's metadata, and of rows without metadata
+MISSING_CODE = -1
+
+NO_METADATA_CODE = -2
+
+_MISSING = object()
+
+_NO_METADATA = object()
+
+
+def artifact_format(path: PathInput) -> str:
+    """Infers the artifact format (parquet or arrow) from the path suffix.
+
+    Any other suffix is treated as jsonl, which may be compressed (e.g., .jsonl.gz).
+    """
+    suffix = Path(path).suffix
+    return FORMAT_SUFFIXES.get(suffix, "jsonl")
+
+
+def attribute_dictionary(
+    metadatas: list[dict], vocabularies: dict[str, list] = None
+) -> dict:
+    """Builds a versioned dictionary of the attribute values of a list of metadata.
+
+    Args:
+        metadatas: Metadata of each row (attribute values must be hashable, e.g., strings or
+            None). Rows without metadata (None) are skipped.
+        vocabularies: Values of each attribute to start from (e.g., the vocabularies of a
+            task's AttributeCatalog, so that datasets of the same task share codes). Values
+            missing from them are appended in order of appearance.
+    Returns:
+        Dictionary with the format, a version (content hash of the vocabularies), and the
+        vocabulary of each attribute, whose positions are the codes of its values.
+    Raises:
+        ValueError: If an attribute value is not hashable (e.g., a list).
+    """
+    vocabularies = {k: list(v) for k, v in (vocabularies or {}).items()}
+    known = {k: set(v) for k, v in vocabularies.items()}
+    for metadata in metadatas:
+        for k, v in (metadata or {}).items():
+            try:
+                is_new = v not in known.setdefault(k, set())
+            except TypeError:
+                raise ValueError(
+                    f"Cannot encode the value {v!r} of metadata attribute {k}: "
+                    "only hashable values (e.g., strings) can be encoded."
+                ) from None
+            if is_new:
+                known[k].add(v)
+                vocabularies.setdefault(k, []).append(v)
+    version = hashlib.sha256(
+        json.dumps(vocabularies, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()[:16]
+    return {
+        "format": ATTRIBUTE_DICTIONARY_FORMAT,
+        "version": version,
+        "vocabularies": vocabularies,
+    }
+
+
+def encode_metadata_codes(
+    metadatas: list[dict], dictionary: dict
+) -> dict[str, np.ndarray]:
+    """Integer codes of the attribute values of each row.
+
+    The code is MISSING_CODE where a row's metadata lacks the attribute, and NO_METADATA_CODE
+    (for every attribute) where a row has no metadata (None).
+    """
+    codes = {}
+    for k, vocabulary in dictionary["vocabularies"].items():
+        index = {v: i for i, v in enumerate(vocabulary)}
+        codes[k] = np.array(
+            [
+                (
+                    NO_METADATA_CODE
+                    if m is None
+                    else index[m[k]] if k in m else MISSING_CODE
+                )
+                for m in metadatas
+            ],
+            dtype=np.int32,
+        )
+    return codes
+
+
+def decode_metadata_codes(
+    codes: dict[str, np.ndarray], dictionary: dict
+) -> list[dict | None]:
+    """Metadata of each row from their integer codes (see encode_metadata_codes)."""
+    if dictionary.get("format") != ATTRIBUTE_DICTIONARY_FORMAT:
+        raise ValueError(
+            f"Unsupported attribute dictionary format {dictionary.get('format')}."
+        )
+    keys = list(codes)
+    columns = []
+    has_missing = False
+    for k in keys:
+        column_codes = np.asarray(codes[k])
+        has_missing = has_missing or bool((column_codes < 0).any())
+        # the extra entries are what NO_METADATA_CODE (-2) and MISSING_CODE (-1) index
+        vocabulary = np.array(
+            dictionary["vocabularies"][k] + [_NO_METADATA, _MISSING], dtype=object
+        )
+        columns.append(vocabulary[column_codes])
+    if not has_missing:
+        return [dict(zip(keys, row)) for row in zip(*columns)]
+    return [
+        (
+            None
+            if _NO_METADATA in row
+            else {k: v for k, v in zip(keys, row) if v is not _MISSING}
+        )
+        for row in zip(*columns)
+    ]
+
+
+def metadata_to_table(df: pd.DataFrame, dictionary: dict = None) -> pa.Table:
+    """Converts an artifact to an arrow table, with one column per metadata attribute.
+
+    If an attribute dictionary is given, the metadata columns hold integer codes (null
+    where missing, NO_METADATA_CODE for rows without metadata), and the dictionary is saved
+    once in the schema metadata. Otherwise, the attributes missing from each row are listed
+    in a "metadata_missing" column. The original column order is saved in the schema metadata.
+    """
+    if "metadata" not in df.columns:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    table = pa.Table.from_pandas(df.drop(columns="metadata"), preserve_index=False)
+    schema_metadata = {
+        **(table.schema.metadata or {}),
+        COLUMN_ORDER_KEY: json.dumps(df.columns.tolist(), ensure_ascii=False),
+    }
+    metadatas = [m if isinstance(m, dict) else None for m in df["metadata"]]
+    if dictionary is not None:
+        for k, codes in encode_metadata_codes(metadatas, dictionary).items():
+            table = table.append_column(
+                METADATA_PREFIX + k, pa.array(codes, mask=codes == MISSING_CODE)
+            )
+        schema_metadata[ATTRIBUTE_DICTIONARY_KEY] = json.dumps(
+            dictionary, ensure_ascii=False
+        )
+        return table.replace_schema_metadata(schema_metadata)
+    # attributes in order of first appearance
+    keys = list(dict.fromkeys(k for m in metadatas if m is not None for k in m))
+    for k in keys:
+        table = table.append_column(
+            METADATA_PREFIX + k,
+            pa.array([None if m is None else m.get(k) for m in metadatas]),
+        )
+    table = table.append_column(
+        METADATA_MISSING_COLUMN,
+        pa.array(
+            [None if m is None else [k for k in keys if k not in m] for m in metadatas],
+            type=pa.list_(pa.string()),
+        ),
+    )
+    return table.replace_schema_metadata(schema_metadata)
+
+
+def table_to_metadata(table: pa.Table) -> pd.DataFrame:
+    """Converts an arrow table back to an artifact with a metadata column of dictionaries.
+
+    Integer-coded metadata is decoded with the attribute dictionary in the schema metadata.
+    Tables without a "metadata_missing" column leave null attributes out of each row's
+    dictionary.
+    """
+    metadata_columns = [c for c in table.column_names if c.startswith(METADATA_PREFIX)]
+    has_missing = METADATA_MISSING_COLUMN in table.column_names
+    df = table.drop(
+        metadata_columns + ([METADATA_MISSING_COLUMN] if has_missing else [])
+    ).to_pandas()
+    if not metadata_columns and not has_missing:
+        return df
+    keys = [c[len(METADATA_PREFIX) :] for c in metadata_columns]
+    schema_metadata = table.schema.metadata or {}
+    if ATTRIBUTE_DICTIONARY_KEY in schema_metadata:
+        dictionary = json.loads(schema_metadata[ATTRIBUTE_DICTIONARY_KEY])
+        codes = {
+            k: table.column(c).fill_null(MISSING_CODE).to_numpy()
+            for k, c in zip(keys, metadata_columns)
+        }
+        df["metadata"] = decode_metadata_codes(codes, dictionary)
+    elif has_missing:
+        values = zip(
+            table.column(METADATA_MISSING_COLUMN).to_pylist(),
+            *[table.column(c).to_pylist() for c in metadata_columns],
+        )
+        df["metadata"] = [
+            (
+                None
+                if missing is None
+                else {k: v for k, v in zip(keys, row) if k not in missing}
+            )
+            for missing, *row in values
+        ]
+    else:
+        values = zip(*[table.column(c).to_pylist() for c in metadata_columns])
+        df["metadata"] = [
+            {k: v for k, v in zip(keys, row) if v is not None} for row in values
+        ]
+    if COLUMN_ORDER_KEY in schema_metadata:
+        order = json.loads(schema_metadata[COLUMN_ORDER_KEY])
+        df = df[
+            [c for c in order if c in df.columns]
+            + [c for c in df.columns if c not in order]
+        ]
+    return df
+
+
+def attribute_dictionary_path(path: PathInput) -> Path:
+    """Path of the attribute dictionary of an integer-coded jsonl artifact."""
+    path = Path(path)
+    return path.with_name(path.name + ATTRIBUTE_DICTIONARY_SUFFIX)
+
+
+def jsonl_to_metadata(df: pd.DataFrame, path: PathInput) -> pd.DataFrame:
+    """Decodes the metadata codes of a jsonl artifact with its attribute dictionary."""
+    with open(attribute_dictionary_path(path), encoding="utf-8") as f:
+        dictionary = json.load(f)
+    codes = np.array(df[METADATA_CODES_COLUMN].tolist(), dtype=np.int32).reshape(
+        len(df), len(dictionary["vocabularies"])
+    )
+    metadatas = decode_metadata_codes(
+        dict(zip(dictionary["vocabularies"], codes.T)), dictionary
+    )
+    position = df.columns.get_loc(METADATA_CODES_COLUMN)
+    df = df.drop(columns=METADATA_CODES_COLUMN)
+    df.insert(position, "metadata", metadatas)
+    return df
+
+
+def _schema_names(path: PathInput, format: str) -> list[str]:
+    if format == "parquet":
+        return pq.read_schema(path).names
+    with pa.memory_map(str(path)) as source:
+        return pa.ipc.open_file(source).schema.names
+
+
+@traced()
+def read_artifact(
+    path: PathInput, columns: list[str] = None, shard: str = None
+) -> pd.DataFrame:
+    """Reads a prompts, answers or judgements artifact into a DataFrame.
+
+    Args:
+        path: Path to a parquet (.parquet), arrow (.arrow or .feather) or jsonl file, or
+            to a sharded artifact directory.
+        columns: Columns to read (all by default). Columnar formats only read these
+            columns from disk. Asking for "metadata" reads all metadata attributes.
+        shard: Only read shard "i/N" of the artifact (see read_shard).
+    Returns:
+        The artifact, with metadata as a column of dictionaries.
+    """
+    if shard is not None:
+        df = read_shard(path, *parse_shard(shard))
+        return df if columns is None else df[columns]
+    if Path(path).is_dir():
+        return read_sharded_artifact(path, columns)
+    format = artifact_format(path)
+    if format == "jsonl":
+        df = pd.DataFrame(list(iter_jsonl(path)))
+        if METADATA_CODES_COLUMN in df.columns:
+            df = jsonl_to_metadata(df, path)
+        return df if columns is None else df[columns]
+    read_columns = None
+    if columns is not None:
+        read_columns = [c for c in columns if c != "metadata"]
+        if "metadata" in columns:
+            read_columns += [
+                c
+                for c in _schema_names(path, format)
+                if c.startswith(METADATA_PREFIX) or c == METADATA_MISSING_COLUMN
+            ]
+    if format == "parquet":
+        df = table_to_metadata(pq.read_table(path, columns=read_columns))
+    else:
+        with pa.memory_map(str(path)) as source:
+            table = pa.ipc.open_file(source).read_all()
+            if read_columns is not None:
+                table = table.select(read_columns)
+            df = table_to_metadata(table)
+    return df if columns is None else df[columns]
+
+
+@traced()
+def write_artifact(
+    df: pd.DataFrame,
+    path: PathInput,
+    format: str = None,
+    shard: str = None,
+    encode_metadata: bool = False,
+    vocabularies: dict[str, list] = None,
+) -> None:
+    """Writes a prompts, answers or judgements artifact.
+
+    jsonl keeps metadata as nested objects. parquet (zstd-compressed) and arrow (IPC)
+    store each metadata attribute as its own "metadata.<attribute>" column.
+
+    With encode_metadata, metadata is stored as integer codes against a versioned attribute
+    dictionary (see attribute_dictionary), saved once per file: in the schema metadata for
+    parquet and arrow, and next to the file ("<path>.attributes.json") for jsonl, whose rows
+    hold a "metadata_codes" list instead of a "metadata" object. read_artifact decodes it back
+    to the same metadata dictionaries (None for rows without metadata). Attribute values must
+    be hashable (see attribute_dictionary).
+
+    Args:
+        df: The artifact.
+        path: Output path.
+        format: One of jsonl, parquet or arrow. Inferred from the path by default
+            (shards default to jsonl).
+        shard: Write the artifact as shard "i/N" of the sharded directory at path.
+        encode_metadata: Whether to store metadata as integer codes.
+        vocabularies: Values of each attribute to number first (e.g., those of the task's
+            AttributeCatalog), so that codes are stable across datasets of the same task.
+    """
+    if shard is not None:
+        write_shard(
+            df,
+            path,
+            *parse_shard(shard),
+            format or "jsonl",
+            encode_metadata=encode_metadata,
+            vocabularies=vocabularies,
+        )
+        return
+    if format is None:
+        format = artifact_format(path)
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    dictionary = None
+    if encode_metadata and "metadata" in df.columns:
+        metadatas = [m if isinstance(m, dict) else None for m in df["metadata"]]
+        dictionary = attribute_dictionary(metadatas, vocabularies)
+        if not dictionary["vocabularies"]:
+            # no attributes to encode
+            dictionary = None
+    if format == "jsonl":
+        dictionary_path = attribute_dictionary_path(path)
+        if dictionary is None:
+            # a stale dictionary would make the file look integer-coded
+            dictionary_path.unlink(missing_ok=True)
+            _write_jsonl(df, path)
+            return
+        codes = encode_metadata_codes(metadatas, dictionary)
+        rows = np.stack(list(codes.values()), axis=1).tolist()
+        position = df.columns.get_loc("metadata")
+        df = df.drop(columns="metadata")
+        df.insert(position, METADATA_CODES_COLUMN, rows)
+        _write_json(dictionary, dictionary_path)
+        _write_jsonl(df, path)
+        return
+    table = metadata_to_table(df, dictionary)
+    if format == "parquet":
+        pq.write_table(table, path, compression="zstd")
+    elif format == "arrow":
+        with pa.OSFile(str(path), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    else:
+        raise ValueError(f"Unknown artifact format {format}.")
+
+
+def parse_shard(shard: str) -> tuple[int, int]:
+    """Parses a shard specification of the form "i/N" (0-indexed)."""
+    shard_i, n_shards = (int(x) for x in shard.split("/"))
+    assert 0 <= shard_i < n_shards, f"Invalid shard {shard}."
+    return shard_i, n_shards
+
+
+def shard_name(shard_i: int, n_shards: int, format: str) -> str:
+    return f"shard-{shard_i:05d}-of-{n_shards:05d}.{FORMAT_EXTENSIONS[format]}"
+
+
+def _sha256(path: PathInput) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def _write_jsonl(df: pd.DataFrame, path: PathInput) -> None:
+    # serialize in chunks rather than building the whole file in memory
+    with LineWriter(path, escape_return_char=False) as writer:
+        for start in range(0, len(df), JSONL_CHUNK_SIZE):
+            chunk = df.iloc[start : start + JSONL_CHUNK_SIZE].to_json(
+                orient="records", lines=True, force_ascii=False
+            )
+            # newlines inside values are escaped by to_json
+            for line in chunk.rstrip("\n").split("\n"):
+                writer.write(line)
+
+
+def _write_json(obj: dict, path: Path) -> None:
+    # a unique temporary file, since several workers may write the same file at once
+    with tempfile.NamedTemporaryFile(
+        "w", encoding="utf-8", dir=path.parent, suffix=".tmp", delete=False
+    ) as f:
+        json.dump(obj, f, indent=4)
+    os.replace(f.name, path)
+
+
+def artifact_hash(path: PathInput) -> str:
+    """Content hash of an artifact file, or of the manifest of a sharded artifact directory."""
+    path = Path(path)
+    if path.is_dir():
+        return _sha256(path / MANIFEST_NAME)
+    return _sha256(path)
+
+
+def read_manifest(path: PathInput) -> dict:
+    with open(Path(path) / MANIFEST_NAME, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_shard(
+    df: pd.DataFrame,
+    path: PathInput,
+    shard_i: int,
+    n_shards: int,
+    format: str = "jsonl",
+    encode_metadata: bool = False,
+    vocabularies: dict[str, list] = None,
+) -> None:
+    """Writes one shard of a sharded artifact directory.
+
+    Each shard is described by a small json file next to it, and the manifest is written
+    once all shards of the directory are present, so shards can be written by independent
+    workers. Integer-coded shards (see write_artifact) each carry their attribute dictionary.
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    name = shard_name(shard_i, n_shards, format)
+    write_artifact(
+        df,
+        path / name,
+        format,
+        encode_metadata=encode_metadata,
+        vocabularies=vocabularies,
+    )
+    shard_info = {
+        "shard": shard_i,
+        "path": name,
+        "n_rows": len(df),
+        "sha256": _sha256(path / name),
+        "schema": {
+            field.name: str(field.type) for field in metadata_to_table(df).schema
+        },
+    }
+    _write_json(shard_info, (path / name).with_suffix(".json"))
+    write_manifest(path, n_shards, format)
+
+
+def write_manifest(path: PathInput, n_shards: int, format: str) -> bool:
+    """Writes the manifest of a sharded artifact directory if all its shards are present.
+
+    Returns:
+        Whether the manifest was written.
+    """
+    path = Path(path)
+    shard_infos = []
+    for shard_i in range(n_shards):
+        info_path = (path / shard_name(shard_i, n_shards, format)).with_suffix(".json")
+        if not info_path.exists():
+            return False
+        with open(info_path, encoding="utf-8") as f:
+            shard_infos.append(json.load(f))
+    schema = {}
+    for info in shard_infos:
+        schema.update(info["schema"])
+    manifest = {
+        "format": format,
+        "n_shards": n_shards,
+        "n_rows": sum(info["n_rows"] for info in shard_infos),
+        "schema": schema,
+        "shards": [
+            {k: info[k] for k in ["path", "n_rows", "sha256"]} for info in shard_infos
+        ],
+    }
+    _write_json(manifest, path / MANIFEST_NAME)
+    return True
+
+
+def write_sharded_artifact(
+    df: pd.DataFrame,
+    path: PathInput,
+    n_shards: int,
+    format: str = "jsonl",
+    encode_metadata: bool = False,
+    vocabularies: dict[str, list] = None,
+) -> None:
+    """Splits an artifact into n_shards contiguous shards and writes them to a directory."""
+    for shard_i, indices in enumerate(np.array_split(np.arange(len(df)), n_shards)):
+        write_shard(
+            df.iloc[indices],
+            path,
+            shard_i,
+            n_shards,
+            format,
+            encode_metadata=encode_metadata,
+            vocabularies=vocabularies,
+        )
+
+
+def read_sharded_artifact(
+    path: PathInput, columns: list[str] = None, verify: bool = False
+) -> pd.DataFrame:
+    """Reads and concatenates all shards of a sharded artifact directory.
+
+    Args:
+        path: The sharded artifact directory.
+        columns: Columns to read (all by default).
+        verify: Whether to check the shards' content hashes against the manifest.
+    """
+    path = Path(path)
+    manifest = read_manifest(path)
+    shards = []
+    for shard in manifest["shards"]:
+        if verify and _sha256(path / shard["path"]) != shard["sha256"]:
+            raise ValueError(f"Shard {shard['path']} does not match the manifest.")
+        shards.append(read_artifact(path / shard["path"], columns))
+    return pd.concat(shards, ignore_index=True)
+
+
+def read_shard(path: PathInput, shard_i: int, n_shards: int) -> pd.DataFrame:
+    """Reads shard i of N of an artifact.
+
+    If the artifact is a sharded directory with N shards, the corresponding shard file is read.
+    Otherwise, the artifact is split into N contiguous shards.
+    """
+    path = Path(path)
+    if path.is_dir():
+        manifest = read_manifest(path)
+        if manifest["n_shards"] == n_shards:
+            return read_artifact(path / manifest["shards"][shard_i]["path"])
+    df = read_artifact(path)
+    indices = np.array_split(np.arange(len(df)), n_shards)[shard_i]
+    return df.iloc[indices].reset_index(drop=True)
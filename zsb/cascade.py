@@ -0,0 +1,100 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+from zsb.models import DEFAULT_MODEL_ARGS, Model, instantiate_model
+
+
+def load_judge(
+    judge: dict, system_prompt: str, stop: list[str] = None, temperature: float = None
+) -> Model:
+    """Instantiates a judge from a spec with model_name, model_type and optionally model_args.
+
+    If temperature is given, it overrides the temperature of the judge's model_args.
+    """
+    model_args = copy.deepcopy(judge.get("model_args", DEFAULT_MODEL_ARGS))
+    model_args["proper_model_args"]["model"] = judge["model_name"]
+    model_args["system_prompt"] = system_prompt
+    model_args["sampling_params"]["stop"] = stop
+    if temperature is not None:
+        model_args["sampling_params"]["temperature"] = temperature
+    return instantiate_model(judge["model_type"], model_args)
+
+
+def escalate_da(
+    scores: np.ndarray, max_disagreement: float = 0, borderline_scores: list = []
+) -> np.ndarray:
+    """Which items the cheap judge is not confident about.
+
+    Args:
+        scores: (n_items, n_samples) scores of the cheap judge, with NaN for unparsed samples.
+        max_disagreement: Items whose samples differ by more than this are escalated.
+        borderline_scores: Items whose median score is one of these are escalated.
+    Returns:
+        Boolean mask of the items to escalate, which also includes items with unparsed samples.
+    """
+    unparsed = np.isnan(scores).any(axis=1)
+    spread = np.where(unparsed, 0, np.ptp(np.nan_to_num(scores), axis=1))
+    medians = np.where(unparsed, np.nan, np.median(np.nan_to_num(scores), axis=1))
+    borderline = np.isin(medians, borderline_scores)
+    return unparsed | (spread > max_disagreement) | borderline
+
+
+def escalate_pairwise(judgements: np.ndarray) -> np.ndarray:
+    """Which items have unparsed or disagreeing samples of the cheap judge.
+
+    Args:
+        judgements: (n_items, n_samples) preferred answers ("A" or "B") of the cheap judge,
+            with None for unparsed samples.
+    """
+    unparsed = pd.isna(judgements).any(axis=1)
+    disagree = (judgements != judgements[:, :1]).any(axis=1)
+    return unparsed | disagree
+
+
+def sample_calibration(
+    escalated: np.ndarray, size: int, random_seed: int = 42
+) -> np.ndarray:
+    """Samples items that were not escalated, to also be judged by the strong judge."""
+    rng = np.random.default_rng(random_seed)
+    confident = np.flatnonzero(~escalated)
+    chosen = rng.choice(confident, size=min(size, len(confident)), replace=False)
+    calibration = np.zeros(len(escalated), dtype=bool)
+    calibration[chosen] = True
+    return calibration
+
+
+def cascade_stats(
+    cheap: np.ndarray,
+    strong: np.ndarray,
+    escalated: np.ndarray,
+    calibration: np.ndarray,
+) -> dict[str, float]:
+    """Escalation rate and agreement between the cascade and the strong judge.
+
+    The agreement is measured on the calibration items (confident items that were also judged by
+    the strong judge), and extrapolated to the whole set: escalated items agree by construction,
+    so the expected agreement is escalation_rate + (1 - escalation_rate) * calibration agreement.
+
+    Args:
+        cheap: Final judgements of the cheap judge.
+        strong: Judgements of the strong judge (only used where escalated or calibration).
+    """
+    stats = {
+        "n_items": len(escalated),
+        "escalation_rate": float(escalated.mean()),
+        "n_calibration": int(calibration.sum()),
+    }
+    if not calibration.any():
+        return stats
+    cheap, strong = cheap[calibration], strong[calibration]
+    agreement = float((cheap == strong).mean())
+    stats["calibration_agreement"] = agreement
+    stats["expected_agreement"] = (
+        stats["escalation_rate"] + (1 - stats["escalation_rate"]) * agreement
+    )
+    if np.issubdtype(cheap.dtype, np.number):
+        stats["calibration_mean_abs_diff"] = float(np.abs(cheap - strong).mean())
+        stats["calibration_mean_diff"] = float((cheap - strong).mean())
+    return stats
@@ -0,0 +1,179 @@
+import random
+from typing import Callable
+
+import numpy as np
+
+
+class AttributeCatalog:
+    """Integer-coded view of a task's attributes (see Task.task_attributes).
+
+    Each attribute gets a vocabulary of its distinct values, so that a combination of attribute
+    values can be stored as a tuple of integer codes (in the order of names) and
+    decoded to strings only when a prompt is rendered. The options of each dependent attribute
+    (e.g., the subtopics of each topic) are compiled into a flat table of codes with one
+    (start, end) offset per value of the attribute it depends on.
+
+    Attributes:
+        names: Attribute names, independent attributes first (the key order of
+            get_all_possible_combinations).
+        vocabularies: Distinct values of each attribute, in order of first appearance.
+        options: Codes of the options of each independent attribute (duplicates included, so
+            that combinations are enumerated like get_all_possible_combinations).
+        dependencies: For each dependent attribute, the attribute it depends on, and the
+            offsets and flat codes of its options for each code of that attribute.
+    """
+
+    def __init__(
+        self, task_attributes: dict[str, list[str] | dict[str, str | Callable]]
+    ) -> None:
+        # independent attributes first, like get_all_possible_combinations
+        self.names = [
+            name for name, v in task_attributes.items() if not isinstance(v, dict)
+        ] + [name for name, v in task_attributes.items() if isinstance(v, dict)]
+        self.vocabularies = {}
+        self.codes = {}
+        self.options = {}
+        self.dependencies = {}
+        for name, values in task_attributes.items():
+            if not isinstance(values, dict):
+                self.options[name] = self._intern(name, values)
+        for name, values in task_attributes.items():
+            if isinstance(values, dict):
+                parent = values["_depends_on"]
+                table = [
+                    self._intern(name, values["callable"](parent_value))
+                    for parent_value in self.vocabularies[parent]
+                ]
+                offsets = np.cumsum([0] + [len(codes) for codes in table])
+                flat_codes = np.concatenate(table) if table else np.zeros(0, int)
+                self.dependencies[name] = (parent, offsets, flat_codes)
+
+    def _intern(self, name: str, values: list[str]) -> np.ndarray:
+        vocabulary = self.vocabularies.setdefault(name, [])
+        codes = self.codes.setdefault(name, {})
+        for value in values:
+            if value not in codes:
+                codes[value] = len(vocabulary)
+                vocabulary.append(value)
+        return np.array([codes[value] for value in values], dtype=np.int64)
+
+    def encode(self, combination: dict[str, str]) -> tuple[int, ...]:
+        return tuple(self.codes[name][combination[name]] for name in self.names)
+
+    def decode(self, codes: tuple[int, ...]) -> dict[str, str]:
+        return {
+            name: self.vocabularies[name][code] for name, code in zip(self.names, codes)
+        }
+
+    def dependent_options(self, name: str, parent_code: int) -> np.ndarray:
+        """Codes of the options of a dependent attribute given the code of its parent."""
+        _, offsets, flat_codes = self.dependencies[name]
+        return flat_codes[offsets[parent_code] : offsets[parent_code + 1]]
+
+
+class CombinationSpace:
+    """All combinations of a task's attribute values, without enumerating them.
+
+    Indexing follows the order of get_all_possible_combinations (independent attributes in
+    itertools.product order, then the dependent attributes of each), so
+    CombinationSpace(task_attributes)[i] == get_all_possible_combinations(task_attributes)[i].
+    Combination i is decoded from i with a mixed-radix walk over the attributes, where the
+    weight of each option of an attribute is the number of options of the attributes that
+    depend on it.
+
+    Args:
+        task_attributes: The task attributes, or an already compiled AttributeCatalog.
+        order: Optional indices into the space (e.g., a permutation), to view it in that order.
+    """
+
+    def __init__(
+        self,
+        task_attributes: dict | AttributeCatalog,
+        order: np.ndarray = None,
+    ) -> None:
+        if isinstance(task_attributes, AttributeCatalog):
+            self.catalog = task_attributes
+        else:
+            self.catalog = AttributeCatalog(task_attributes)
+        self.order = None if order is None else np.asarray(order, dtype=np.int64)
+        catalog = self.catalog
+        self.independent = list(catalog.options)
+        self.dependent = list(catalog.dependencies)
+        # weight of each option of each independent attribute
+        self.weights = []
+        for name in self.independent:
+            weights = np.ones(len(catalog.options[name]), dtype=np.int64)
+            for parent, offsets, _ in catalog.dependencies.values():
+                if parent == name:
+                    weights *= np.diff(offsets)[catalog.options[name]]
+            self.weights.append(weights)
+        totals = [int(w.sum()) for w in self.weights]
+        # number of combinations under each choice of the attributes after each attribute
+        self.subtree_sizes = [
+            int(np.prod(totals[i + 1 :], dtype=object)) for i in range(len(totals))
+        ]
+        self.size = int(np.prod(totals, dtype=object)) if totals else 0
+
+    def __len__(self) -> int:
+        return self.size if self.order is None else len(self.order)
+
+    def codes_at(self, indices: np.ndarray) -> np.ndarray:
+        """Codes of the combinations at several indices, as an (n, n_attributes) matrix."""
+        indices = np.asarray(indices, dtype=np.int64)
+        if self.order is not None:
+            indices = self.order[indices]
+        catalog = self.catalog
+        codes = {}
+        remainder = indices.copy()
+        # weight of the options chosen so far, which scales the size of each subtree
+        scale = np.ones_like(indices)
+        for name, weights, subtree_size in zip(
+            self.independent, self.weights, self.subtree_sizes
+        ):
+            # cumulative weight before each option of this attribute
+            starts = np.concatenate([[0], np.cumsum(weights)[:-1]])
+            option = (
+                np.searchsorted(starts, remainder // (scale * subtree_size), "right")
+                - 1
+            )
+            remainder -= scale * subtree_size * starts[option]
+            scale *= weights[option]
+            codes[name] = catalog.options[name][option]
+        # the remainder indexes the product of the dependent attributes (last fastest)
+        radices = [
+            np.diff(offsets)[codes[parent]]
+            for parent, offsets, _ in catalog.dependencies.values()
+        ]
+        for k in reversed(range(len(self.dependent))):
+            name = self.dependent[k]
+            parent, offsets, flat_codes = catalog.dependencies[name]
+            codes[name] = flat_codes[offsets[codes[parent]] + remainder % radices[k]]
+            remainder //= radices[k]
+        return np.stack([codes[name] for name in catalog.names], axis=1)
+
+    def __getitem__(self, i: int | slice) -> dict[str, str] | list[dict[str, str]]:
+        if isinstance(i, slice):
+            indices = np.asarray(range(len(self))[i])
+            return [self.catalog.decode(codes) for codes in self.codes_at(indices)]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("Combination index out of range.")
+        return self.catalog.decode(self.codes_at([i])[0])
+
+    def shuffled(self, rng) -> "CombinationSpace":
+        """View of the space in random order.
+
+        Args:
+            rng: A random.Random or the random module, whose shuffle is applied to the indices.
+                This yields the same order as shuffling the list of all combinations with the
+                same random state.
+        """
+        order = list(range(self.size))
+        rng.shuffle(order)
+        return CombinationSpace(self.catalog, order)
+
+    def sample(self, n: int, rng: random.Random) -> list[dict[str, str]]:
+        """Samples n combinations uniformly (with replacement), without enumerating the space."""
+        indices = [rng.randrange(len(self)) for _ in range(n)]
+        return [self.catalog.decode(codes) for codes in self.codes_at(indices)]
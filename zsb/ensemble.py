@@ -0,0 +1,91 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+
+def majority_vote(scores: np.ndarray) -> np.ndarray:
+    """Most frequent score of each row, ignoring missing (NaN) scores.
+
+    Ties are broken in favor of the tied score closest to the row's median, and then the lowest.
+
+    Args:
+        scores: (n_rows, n_judges) matrix of scores.
+    """
+    majority = np.full(len(scores), np.nan)
+    has_scores = (~np.isnan(scores)).any(axis=1)
+    if not has_scores.any():
+        return majority
+    scores = scores[has_scores]
+    values = np.unique(scores[~np.isnan(scores)])
+    # (n_rows, n_values) vote counts
+    counts = (scores[:, :, None] == values[None, None, :]).sum(axis=1)
+    medians = np.nanmedian(scores, axis=1)
+    is_mode = counts == counts.max(axis=1, keepdims=True)
+    distances = np.where(is_mode, np.abs(values[None, :] - medians[:, None]), np.inf)
+    majority[has_scores] = values[distances.argmin(axis=1)]
+    return majority
+
+
+def aggregate_judgements(scores: np.ndarray) -> dict[str, np.ndarray]:
+    """Aggregated scores and judge agreement of each row.
+
+    Args:
+        scores: (n_rows, n_judges) matrix of scores, with NaN for judgements that could not be
+            parsed, which are left out.
+    Returns:
+        Columns ensemble_mean, ensemble_median and ensemble_majority (aggregated scores),
+        ensemble_std and ensemble_range (spread of the scores), ensemble_agreement (fraction of
+        judges that gave the majority score) and ensemble_n_judges (parsed judgements).
+    """
+    n_judges = (~np.isnan(scores)).sum(axis=1)
+    has_scores = n_judges > 0
+    mean = np.full(len(scores), np.nan)
+    median = np.full(len(scores), np.nan)
+    std = np.full(len(scores), np.nan)
+    score_range = np.full(len(scores), np.nan)
+    mean[has_scores] = np.nanmean(scores[has_scores], axis=1)
+    median[has_scores] = np.nanmedian(scores[has_scores], axis=1)
+    std[has_scores] = np.nanstd(scores[has_scores], axis=1)
+    score_range[has_scores] = np.nanmax(scores[has_scores], axis=1) - np.nanmin(
+        scores[has_scores], axis=1
+    )
+    majority = majority_vote(scores)
+    agreement = np.where(
+        has_scores,
+        (scores == majority[:, None]).sum(axis=1) / np.maximum(n_judges, 1),
+        np.nan,
+    )
+    return {
+        "ensemble_mean": mean,
+        "ensemble_median": median,
+        "ensemble_majority": majority,
+        "ensemble_std": std,
+        "ensemble_range": score_range,
+        "ensemble_agreement": agreement,
+        "ensemble_n_judges": n_judges,
+    }
+
+
+def judge_agreement(scores: np.ndarray, judge_names: list[str]) -> pd.DataFrame:
+    """Agreement between each pair of judges, over the rows both judges parsed.
+
+    Reports the Pearson and Spearman correlations of their scores, the rate of exact matches and
+    the mean absolute difference.
+    """
+    rows = []
+    for i, j in itertools.combinations(range(len(judge_names)), 2):
+        both = ~np.isnan(scores[:, i]) & ~np.isnan(scores[:, j])
+        a, b = pd.Series(scores[both, i]), pd.Series(scores[both, j])
+        rows.append(
+            {
+                "judge_A": judge_names[i],
+                "judge_B": judge_names[j],
+                "n": int(both.sum()),
+                "pearson": a.corr(b),
+                "spearman": a.rank().corr(b.rank()),
+                "exact_match": (a == b).mean(),
+                "mean_abs_diff": (a - b).abs().mean(),
+            }
+        )
+    return pd.DataFrame(rows)
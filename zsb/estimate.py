@@ -0,0 +1,200 @@
+import random
+
+import numpy as np
+import pandas as pd
+
+from zsb.artifacts import read_artifact
+from zsb.catalog import CombinationSpace
+from zsb.tasks.base import Task
+from zsb.telemetry import TELEMETRY_PREFIX
+from zsb.utils import PathInput
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+def count_tokens(
+    texts: list[str], tokenizer: str = "tiktoken", model_name: str = None
+) -> np.ndarray:
+    """Counts the tokens of texts in a single batched call.
+
+    Args:
+        texts: Texts to tokenize.
+        tokenizer: "tiktoken" (cl100k_base, a good proxy for most API models), "hf" (the
+            model's own tokenizer, for vllm models) or "chars" (4 characters per token).
+            Falls back to "chars" if tiktoken is not installed.
+        model_name: HF model name, for the "hf" tokenizer.
+    """
+    if tokenizer == "hf":
+        from transformers import AutoTokenizer
+
+        hf_tokenizer = AutoTokenizer.from_pretrained(model_name)
+        input_ids = hf_tokenizer(texts, add_special_tokens=False)["input_ids"]
+        return np.array([len(ids) for ids in input_ids])
+    if tokenizer == "tiktoken" and tiktoken is not None:
+        encoding = tiktoken.get_encoding("cl100k_base")
+        return np.array([len(ids) for ids in encoding.encode_ordinary_batch(texts)])
+    return np.array([len(text) for text in texts]) / 4
+
+
+def model_pricing(model_name: str) -> tuple[float, float] | None:
+    """USD per input and output token of a model according to litellm, if it is known."""
+    try:
+        from litellm import model_cost
+    except ImportError:
+        return None
+    if model_name not in model_cost:
+        return None
+    costs = model_cost[model_name]
+    return costs.get("input_cost_per_token", 0), costs.get("output_cost_per_token", 0)
+
+
+def sample_combinations(
+    task_attributes: dict, n: int, rng: random.Random
+) -> list[dict[str, str]]:
+    """Samples attribute combinations uniformly, without enumerating them all."""
+    return CombinationSpace(task_attributes).sample(n, rng)
+
+
+def render_prompts(
+    stage: str,
+    task_obj: Task,
+    data: pd.DataFrame = None,
+    n_prompts: int = None,
+    use_ref: bool = False,
+    rng: random.Random = None,
+) -> tuple[str, list[str]]:
+    """Renders the prompts a script would send, as (system prompt, user prompts).
+
+    Args:
+        stage: "prompts" (generate_prompts.py, n_prompts meta-prompts), "answers"
+            (generate_answers.py on data) or "da_eval" (generate_da_eval.py on data).
+    """
+    if stage == "prompts":
+        combinations = sample_combinations(task_obj.task_attributes, n_prompts, rng)
+        meta_prompt = task_obj.meta_prompt["user_prompt"]
+        if isinstance(meta_prompt, str):
+            return task_obj.meta_prompt["system_prompt"], [meta_prompt] * n_prompts
+        return task_obj.meta_prompt["system_prompt"], [
+            meta_prompt.substitute(**c) for c in combinations
+        ]
+    if stage == "answers":
+        return None, data["prompt"].tolist()
+    if use_ref:
+        judge_prompt = task_obj.ref_da_judge_prompt["user_prompt"]
+    else:
+        judge_prompt = task_obj.da_judge_prompt["user_prompt"]
+    return task_obj.da_judge_prompt["system_prompt"], [
+        judge_prompt.substitute(prompt=prompt, answer=answer, reference=reference)
+        for prompt, answer, reference in zip(
+            data["prompt"].tolist(), data["answer"].tolist(), data["reference"].tolist()
+        )
+    ]
+
+
+def busy_seconds(starts: np.ndarray, ends: np.ndarray) -> float:
+    """Total time covered by at least one of the intervals [start, end).
+
+    Unlike the span from the first start to the last end, gaps between batches, shards or
+    runs (e.g., a run resumed the next day) are not counted.
+    """
+    order = np.argsort(starts)
+    starts, ends = starts[order], np.maximum.accumulate(ends[order])
+    # an interval starts a new busy period if it starts after all earlier intervals ended
+    new_period = np.concatenate([[True], starts[1:] > ends[:-1]])
+    period = np.cumsum(new_period) - 1
+    period_starts = starts[new_period]
+    period_ends = np.zeros(len(period_starts))
+    np.maximum.at(period_ends, period, ends)
+    return float((period_ends - period_starts).sum())
+
+
+def telemetry_stats(telemetry_paths: list[PathInput]) -> dict:
+    """Average completion tokens and wall-clock seconds per request of past runs.
+
+    The wall-clock time of each file is the time during which at least one of its requests
+    was running (see busy_seconds), so files may gather several batches, shards or runs.
+    Files saved before requests recorded their start time only contribute token counts.
+
+    Args:
+        telemetry_paths: Outputs of past runs saved with --save_telemetry.
+    """
+    completion_tokens = []
+    seconds_per_request = []
+    for path in telemetry_paths:
+        telemetry = read_artifact(path)
+        telemetry = telemetry[
+            [c for c in telemetry.columns if c.startswith(TELEMETRY_PREFIX)]
+        ]
+        tokens = telemetry[f"{TELEMETRY_PREFIX}completion_tokens"].dropna()
+        if tokens.empty:
+            continue
+        completion_tokens.append(tokens)
+        if f"{TELEMETRY_PREFIX}start_time" not in telemetry.columns:
+            continue
+        timed = telemetry[
+            [f"{TELEMETRY_PREFIX}start_time", f"{TELEMETRY_PREFIX}latency"]
+        ].dropna()
+        if timed.empty:
+            continue
+        starts = timed[f"{TELEMETRY_PREFIX}start_time"].to_numpy(dtype=float)
+        ends = starts + timed[f"{TELEMETRY_PREFIX}latency"].to_numpy(dtype=float)
+        seconds_per_request.append(busy_seconds(starts, ends) / len(timed))
+    if not completion_tokens:
+        return {}
+    stats = {"completion_tokens": float(pd.concat(completion_tokens).mean())}
+    if seconds_per_request:
+        stats["seconds_per_request"] = float(np.mean(seconds_per_request))
+    return stats
+
+
+def estimate_run(
+    system_prompt: str,
+    prompts: list[str],
+    n_requests: int,
+    max_tokens: int,
+    pricing: tuple[float, float] = None,
+    history: dict = {},
+    tokens_per_second: float = None,
+    tokenizer: str = "tiktoken",
+    model_name: str = None,
+) -> dict:
+    """Projects the tokens, cost and wall-clock of n_requests prompts like the given sample.
+
+    Output tokens are projected from past telemetry if available, and bounded by max_tokens.
+    The wall-clock is extrapolated from past telemetry, or from tokens_per_second.
+    """
+    prompt_tokens = count_tokens(prompts, tokenizer, model_name)
+    if system_prompt:
+        prompt_tokens = (
+            prompt_tokens + count_tokens([system_prompt], tokenizer, model_name)[0]
+        )
+    estimate = {
+        "requests": n_requests,
+        "prompt_tokens": float(prompt_tokens.mean() * n_requests),
+        "max_completion_tokens": float(max_tokens * n_requests),
+    }
+    if "completion_tokens" in history:
+        estimate["completion_tokens"] = (
+            min(history["completion_tokens"], max_tokens) * n_requests
+        )
+    if pricing is not None:
+        estimate["max_cost"] = (
+            estimate["prompt_tokens"] * pricing[0]
+            + estimate["max_completion_tokens"] * pricing[1]
+        )
+        if "completion_tokens" in estimate:
+            estimate["cost"] = (
+                estimate["prompt_tokens"] * pricing[0]
+                + estimate["completion_tokens"] * pricing[1]
+            )
+    if "seconds_per_request" in history:
+        estimate["seconds"] = history["seconds_per_request"] * n_requests
+    elif tokens_per_second:
+        completion_tokens = estimate.get(
+            "completion_tokens", estimate["max_completion_tokens"]
+        )
+        estimate["seconds"] = completion_tokens / tokens_per_second
+    return estimate
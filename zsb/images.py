@@ -0,0 +1,251 @@
+import base64
+import hashlib
+import itertools
+import math
+import os
+import tempfile
+from collections.abc import Iterable, Iterator, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image as PILImage
+from PIL.Image import Image, Resampling
+
+from zsb.utils import PathInput
+
+# PIL's default, which images inlined as data URLs were encoded with
+DEFAULT_JPEG_QUALITY = 75
+
+# stats returned by preprocess_image
+PREPROCESSING_STATS = [
+    "orig_width",
+    "orig_height",
+    "width",
+    "height",
+    "bytes",
+    "orig_visual_tokens",
+    "visual_tokens",
+]
+
+
+def encode_jpeg(image: Image, quality: int = DEFAULT_JPEG_QUALITY) -> bytes:
+    """Encodes a PIL Image as JPEG bytes."""
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    buffered = BytesIO()
+    image.save(buffered, format="jpeg", quality=quality)
+    return buffered.getvalue()
+
+
+def estimate_visual_tokens(width: int, height: int, patch_size: int = 28) -> int:
+    """Estimates the visual tokens of an image for a VLM that tiles it in patch_size patches."""
+    return math.ceil(width / patch_size) * math.ceil(height / patch_size)
+
+
+def resize_image(image: Image, max_side: int = None, max_pixels: int = None) -> Image:
+    """Downscales an image, keeping its aspect ratio, to fit max_side and max_pixels."""
+    width, height = image.size
+    scale = 1.0
+    if max_side is not None:
+        scale = min(scale, max_side / max(width, height))
+    if max_pixels is not None:
+        scale = min(scale, math.sqrt(max_pixels / (width * height)))
+    if scale >= 1.0:
+        return image
+    new_size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    return image.resize(new_size, Resampling.LANCZOS)
+
+
+def preprocess_image(
+    image: Image | dict,
+    max_side: int = None,
+    max_pixels: int = None,
+    quality: int = DEFAULT_JPEG_QUALITY,
+    patch_size: int = 28,
+) -> tuple[bytes, dict[str, int]]:
+    """Decodes, optionally downscales, and JPEG-encodes an image.
+
+    The image may be a PIL Image or an undecoded HF image ({"bytes": ..., "path": ...}).
+
+    Returns:
+        The JPEG bytes and a dictionary with the original and final sizes, the encoded bytes,
+        and the estimated visual tokens before and after resizing.
+    """
+    if isinstance(image, dict):
+        if image.get("bytes") is not None:
+            image = PILImage.open(BytesIO(image["bytes"]))
+        else:
+            image = PILImage.open(image["path"])
+    orig_width, orig_height = image.size
+    image = resize_image(image, max_side, max_pixels)
+    data = encode_jpeg(image, quality)
+    width, height = image.size
+    stats = {
+        "orig_width": orig_width,
+        "orig_height": orig_height,
+        "width": width,
+        "height": height,
+        "bytes": len(data),
+        "orig_visual_tokens": estimate_visual_tokens(
+            orig_width, orig_height, patch_size
+        ),
+        "visual_tokens": estimate_visual_tokens(width, height, patch_size),
+    }
+    return data, stats
+
+
+class ImageStore:
+    """Content-addressed image store.
+
+    Images are saved once to disk as JPEG files named after the sha256 of their bytes,
+    so rows only need to keep the image id. Data URLs are built lazily, when a request is
+    dispatched to a model, and the most recently used ones are kept in memory.
+
+    Args:
+        root: Directory where images are stored.
+        cache_size: Maximum number of data URLs kept in memory.
+    """
+
+    def __init__(self, root: PathInput, cache_size: int = 256) -> None:
+        # absolute, since rows record it and may be read from another working directory
+        self.root = Path(root).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.data_url = lru_cache(maxsize=cache_size)(self._data_url)
+
+    def path(self, image_id: str) -> Path:
+        return self.root / image_id[:2] / f"{image_id}.jpg"
+
+    def put_bytes(self, data: bytes) -> str:
+        image_id = hashlib.sha256(data).hexdigest()
+        path = self.path(image_id)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # a unique temporary file, since several workers may add the same image at once
+            with tempfile.NamedTemporaryFile(
+                dir=path.parent, suffix=".tmp", delete=False
+            ) as f:
+                f.write(data)
+            os.replace(f.name, path)
+        return image_id
+
+    def put(self, image: Image) -> str:
+        return self.put_bytes(encode_jpeg(image))
+
+    def _data_url(self, image_id: str) -> str:
+        img_str = base64.b64encode(self.path(image_id).read_bytes()).decode()
+        return f"data:image/jpeg;base64,{img_str}"
+
+    def data_urls(self, image_ids: Sequence[str]) -> "LazyDataUrls":
+        return LazyDataUrls(image_ids, self)
+
+
+class LazyDataUrls(Sequence):
+    """Sequence of data URLs that are only built when accessed."""
+
+    def __init__(self, image_ids: Sequence[str], store: ImageStore) -> None:
+        self.image_ids = image_ids
+        self.store = store
+
+    def __len__(self) -> int:
+        return len(self.image_ids)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return LazyDataUrls(self.image_ids[i], self.store)
+        return self.store.data_url(self.image_ids[i])
+
+
+class DatasetImages(Sequence):
+    """Sequence of image ids over a HF dataset split.
+
+    Images are only decoded and added to the store the first time their index is accessed.
+    """
+
+    def __init__(self, dataset, store: ImageStore, column: str = "image") -> None:
+        self.dataset = dataset
+        self.store = store
+        self.column = column
+        self._image_ids = {}
+
+    def __len__(self) -> int:
+        return len(self.dataset)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i not in self._image_ids:
+            self._image_ids[i] = self.store.put(self.dataset[i][self.column])
+        return self._image_ids[i]
+
+
+class MetadataImages(Sequence):
+    """Sequence of image data URLs for rows whose metadata references images.
+
+    Supports rows with an "image_id" (and the "image_store" it lives in), and older rows
+    that inline the data URL in "image_str".
+
+    Args:
+        metadatas: Metadata of each row.
+        image_store_path: Overrides the image store recorded in the metadata.
+    """
+
+    def __init__(self, metadatas: Sequence[dict], image_store_path: str = None) -> None:
+        self.metadatas = list(metadatas)
+        self.image_store_path = image_store_path
+        self._stores = {}
+
+    def __len__(self) -> int:
+        return len(self.metadatas)
+
+    def _store(self, root: str) -> ImageStore:
+        if root not in self._stores:
+            self._stores[root] = ImageStore(root)
+        return self._stores[root]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        metadata = self.metadatas[i]
+        if "image_id" not in metadata:
+            return metadata["image_str"]
+        root = self.image_store_path or metadata["image_store"]
+        return self._store(root).data_url(metadata["image_id"])
+
+
+def preprocess_images(
+    images: Iterable[Image | dict],
+    store: ImageStore,
+    max_side: int = None,
+    max_pixels: int = None,
+    quality: int = DEFAULT_JPEG_QUALITY,
+    patch_size: int = 28,
+    num_workers: int = None,
+    chunk_size: int = 16,
+) -> Iterator[tuple[str, dict[str, int]]]:
+    """Preprocesses images in a process pool and adds them to the store.
+
+    Images are consumed lazily, a few chunks at a time, so this works with streamed datasets.
+
+    Yields:
+        The image id and the preprocessing stats of each image (see preprocess_image), in order.
+    """
+    process_fn = partial(
+        preprocess_image,
+        max_side=max_side,
+        max_pixels=max_pixels,
+        quality=quality,
+        patch_size=patch_size,
+    )
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    window_size = num_workers * chunk_size * 4
+    images = iter(images)
+    with ProcessPoolExecutor(num_workers) as executor:
+        while True:
+            window = list(itertools.islice(images, window_size))
+            if not window:
+                break
+            for data, stats in executor.map(process_fn, window, chunksize=chunk_size):
+                yield store.put_bytes(data), stats
@@ -0,0 +1,109 @@
+import json
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from zsb.models import Model
+from zsb.utils import PathInput
+
+
+class LengthHistory:
+    """Output lengths (in tokens) observed in past runs, per (task, stage, model) key.
+
+    Stored as a json file that keeps the most recent max_samples lengths of each key. Several
+    processes (e.g., --shard workers) can share the file: save re-reads it and only adds the
+    lengths recorded by this process, and the file is replaced atomically.
+    """
+
+    def __init__(self, path: PathInput, max_samples: int = 10000) -> None:
+        self.path = Path(path)
+        self.max_samples = max_samples
+        self.lengths = self._load()
+        # lengths recorded by this process, not saved yet
+        self.new_lengths = {}
+
+    def _load(self) -> dict[str, list[int]]:
+        if not self.path.exists():
+            return {}
+        with open(self.path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def record(self, key: str, lengths: list[int]) -> None:
+        lengths = [int(n) for n in lengths]
+        self.new_lengths[key] = self.new_lengths.get(key, []) + lengths
+        self.lengths[key] = (self.lengths.get(key, []) + lengths)[-self.max_samples :]
+
+    def quantile(self, key: str, q: float, min_samples: int = 50) -> float | None:
+        """Quantile q of the lengths of key, or None if there are fewer than min_samples."""
+        lengths = self.lengths.get(key, [])
+        if len(lengths) < min_samples:
+            return None
+        return float(np.quantile(lengths, q))
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # add to the lengths saved meanwhile by other processes
+        self.lengths = self._load()
+        for key, lengths in self.new_lengths.items():
+            lengths = self.lengths.get(key, []) + lengths
+            self.lengths[key] = lengths[-self.max_samples :]
+        self.new_lengths = {}
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", dir=self.path.parent, suffix=".tmp", delete=False
+        ) as f:
+            json.dump(self.lengths, f)
+        os.replace(f.name, self.path)
+
+
+def adaptive_batch_generate(
+    model: Model,
+    insts: list[str],
+    history: LengthHistory,
+    key: str,
+    imgs: list[str] = None,
+    quantile: float = 0.99,
+    headroom: float = 1.25,
+    min_tokens: int = 64,
+) -> list[str]:
+    """batch_generate with max_tokens set from the output lengths of past runs of key.
+
+    max_tokens is set to the quantile of past lengths times headroom (capped by the model's
+    configured max_tokens), which lets vllm fit more sequences in its KV cache and lowers API
+    cost ceilings. Outputs truncated by this budget are re-issued with a budget 4 times larger,
+    up to the configured max_tokens, so the outputs match those of a run with the configured
+    budget. The final output lengths are added to the history.
+    """
+    max_tokens = model.max_tokens
+    budget = history.quantile(key, quantile)
+    if budget is None:
+        budget = max_tokens
+    budget = int(min(max(budget * headroom, min_tokens), max_tokens))
+    if imgs is None:
+        imgs = [None] * len(insts)
+    generations = [None] * len(insts)
+    metrics = [None] * len(insts)
+    pending = list(range(len(insts)))
+    try:
+        while pending:
+            print(f"Generating {len(pending)} outputs with max_tokens={budget}.")
+            model.max_tokens = budget
+            outputs = model.batch_generate(
+                [insts[i] for i in pending], [imgs[i] for i in pending]
+            )
+            for i, output, request_metrics in zip(pending, outputs, model.last_metrics):
+                generations[i] = output
+                metrics[i] = request_metrics
+            if budget >= max_tokens:
+                break
+            pending = [i for i in pending if metrics[i].finish_reason == "length"]
+            budget = min(budget * 4, max_tokens)
+    finally:
+        model.max_tokens = max_tokens
+    model.last_metrics = metrics
+    history.record(
+        key, [m.completion_tokens for m in metrics if m.completion_tokens is not None]
+    )
+    history.save()
+    return generations
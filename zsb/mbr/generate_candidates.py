@@ -1,7 +1,7 @@
-import pandas as pd
 from datasets import load_dataset
 from jsonargparse import CLI
 
+from zsb.artifacts import read_artifact
 from zsb.models import instantiate_model
 from zsb.utils import write_lines
 
@@ -21,7 +21,7 @@ def main(
 ):
     # load queries
     if dataset_type == "jsonl":
-        queries = pd.read_json(dataset_path, lines=True)["prompt"]
+        queries = read_artifact(dataset_path, columns=["prompt"])["prompt"]
     elif dataset_type == "hf":
         queries = load_dataset(dataset_path, lang)["test"]["prompt"]
     queries = [q for q in queries for _ in range(n_candidates)]
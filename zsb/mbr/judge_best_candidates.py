@@ -2,6 +2,7 @@ import pandas as pd
 from datasets import load_dataset
 from jsonargparse import CLI
 
+from zsb.artifacts import read_artifact, write_artifact
 from zsb.models import instantiate_model
 from zsb.tasks.multilingual_general_purpose_chat import GeneralPurposeChatEnglish
 from zsb.utils import read_lines
@@ -22,7 +23,7 @@ def main(
 ):
     # load answers and task
     if dataset_type == "jsonl":
-        prompts = pd.read_json(dataset_path, lines=True)["prompt"]
+        prompts = read_artifact(dataset_path, columns=["prompt"])["prompt"]
     elif dataset_type == "hf":
         prompts = load_dataset(dataset_path, lang)["test"]["prompt"]
     answers = read_lines(answers_path, unescape_newline=True)
@@ -48,9 +49,7 @@ def main(
     final_data["feedback"] = list(parsed_feedbacks)
 
     # save
-    pd.DataFrame.from_dict(final_data).to_json(
-        output_path, lines=True, orient="records", force_ascii=False
-    )
+    write_artifact(pd.DataFrame.from_dict(final_data), output_path)
 
     return final_data
 
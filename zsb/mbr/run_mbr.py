@@ -1,7 +1,7 @@
-import pandas as pd
 from datasets import load_dataset
 from jsonargparse import CLI
 
+from zsb.artifacts import read_artifact
 from zsb.mbr.utils import run_mbr_matrix
 from zsb.models import instantiate_model
 from zsb.utils import read_lines, write_lines
@@ -27,7 +27,7 @@ def main(
 ):
     # load data
     if dataset_type == "jsonl":
-        prompts = pd.read_json(dataset_path, lines=True)["prompt"]
+        prompts = read_artifact(dataset_path, columns=["prompt"])["prompt"]
     elif dataset_type == "hf":
         prompts = load_dataset(dataset_path, lang)["test"]["prompt"]
     candidates = read_lines(candidates_path)
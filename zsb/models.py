@@ -1,7 +1,34 @@
-from litellm import completion
-from tenacity import Retrying, stop_after_attempt, wait_random_exponential
+import gc
+import json
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import litellm
+from litellm import completion, completion_cost
+from tenacity import (
+    Retrying,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_random_exponential,
+)
 from tqdm import tqdm
+import torch
 from vllm import LLM, SamplingParams
+from vllm.distributed.parallel_state import (
+    destroy_distributed_environment,
+    destroy_model_parallel,
+)
+
+from zsb.telemetry import RequestMetrics, format_summary, summarize_metrics
+from zsb.tracing import record_concurrent_spans, record_span, span, traced
+
+# greedy decoding, as in the scripts' defaults
+DEFAULT_MODEL_ARGS = {
+    "proper_model_args": {},
+    "sampling_params": {"temperature": 0, "max_tokens": 8192},
+}
 
 
 class Model:
@@ -10,23 +37,69 @@ class Model:
         model_args: dict = {"proper_model_args": {}, "sampling_params": {}},
         **kwargs,
     ) -> None:
-        pass
+        # metrics of every request since the model was loaded, for log_run_summary
+        self.run_metrics = []
+        self.run_seconds = 0.0
 
+    @traced("batch_generate")
     def batch_generate(self, insts: list[str], imgs: list[str] = None) -> list[str]:
         if imgs is None:
             imgs = [None] * len(insts)
-        generations = [
-            self.generate(inst, img)
+        batch_start = time.time()
+        outputs = [
+            self.timed_generate(inst, img, batch_start)
             for inst, img in tqdm(
                 zip(insts, imgs), desc="Generating...", total=len(insts)
             )
         ]
+        generations = [generation for generation, _ in outputs]
+        self.log_metrics([metrics for _, metrics in outputs], time.time() - batch_start)
         print(f"Example generation:\n\n{generations[-1]}")
         return generations
 
     def generate(self, inst: str, image_str: str) -> str:
         pass
 
+    def generate_with_metrics(
+        self, inst: str, image_str: str = None
+    ) -> tuple[str, RequestMetrics]:
+        """Generates an answer along with the metrics of the request.
+
+        Backends that can report more than the latency (e.g., tokens) override this method.
+        """
+        start = time.time()
+        generation = self.generate(inst, image_str)
+        return generation, RequestMetrics(latency=time.time() - start)
+
+    def timed_generate(
+        self, inst: str, image_str: str, batch_start: float
+    ) -> tuple[str, RequestMetrics]:
+        start = time.time()
+        generation, metrics = self.generate_with_metrics(inst, image_str)
+        metrics.queue_wait = start - batch_start
+        metrics.start_time = start
+        record_span(
+            "request",
+            start,
+            time.time(),
+            completion_tokens=metrics.completion_tokens,
+            retries=metrics.retries,
+        )
+        return generation, metrics
+
+    def log_metrics(self, metrics: list[RequestMetrics], wall_seconds: float) -> None:
+        """Keeps the metrics of the last batch in last_metrics and adds them to the run's."""
+        self.last_metrics = metrics
+        self.run_metrics.extend(metrics)
+        self.run_seconds += wall_seconds
+
+    def log_run_summary(self) -> dict:
+        """Prints the summary of all the requests since the model was loaded (e.g., at the end
+        of a script that generated several batches) and returns it."""
+        summary = summarize_metrics(self.run_metrics, self.run_seconds)
+        print(format_summary(summary))
+        return summary
+
     @staticmethod
     def generate_with_retries(
         retry_function,
@@ -35,6 +108,7 @@ class Model:
         retry_multiplier=1,
         retry_max_interval=10,
         retry_min_interval=4,
+        retry_exceptions=(Exception,),
     ):
         retryer = Retrying(
             stop=stop_after_attempt(retry_max_attempts),
@@ -43,10 +117,15 @@ class Model:
                 max=retry_max_interval,
                 min=retry_min_interval,
             ),
+            retry=retry_if_exception_type(retry_exceptions),
             reraise=True,
         )
         return retryer(retry_function, **model_args)
 
+    def close(self) -> None:
+        """Frees the resources held by the model (e.g., GPU memory)."""
+        pass
+
     @staticmethod
     def convert_string_to_message(
         inst: str, system_prompt: str = None, image_str: str = None
@@ -71,6 +150,9 @@ class Model:
 
 
 class VLLM(Model):
+    # prompts with images submitted at once (see batch_generate)
+    image_window_size = 256
+
     def __init__(
         self,
         model_args: dict = {
@@ -86,32 +168,115 @@ class VLLM(Model):
 
         model_args["proper_model_args"]["trust_remote_code"] = True
         sampling_args = model_args["sampling_params"]
-        self.model = LLM(**model_args["proper_model_args"])
+        if sampling_args.get("stop"):
+            # keep the stop sequence in the output, as the parsers expect it
+            sampling_args.setdefault("include_stop_str_in_output", True)
+        with span("load_model", model=model_args["proper_model_args"]["model"]):
+            self.model = LLM(**model_args["proper_model_args"])
         self.sampling_params = SamplingParams(**sampling_args)
 
         self.system_prompt = model_args.get("system_prompt", None)
 
+    @traced("batch_generate")
     def batch_generate(
         self, insts: list[str], image_strs: list[str] = None
     ) -> list[str]:
+        # messages with images are built a window at a time, so that only the data URLs of
+        # one window are encoded and held in memory at once
+        window_size = max(len(insts), 1)
         if image_strs is None:
             image_strs = [None] * len(insts)
-        messages = [
-            self.convert_string_to_message(inst, self.system_prompt, image_str)
-            for inst, image_str in zip(insts, image_strs)
-        ]
-        model_output = self.model.chat(messages, self.sampling_params, use_tqdm=True)
+        else:
+            window_size = self.image_window_size
+        batch_start = time.time()
+        model_output = []
+        for start in range(0, len(insts), window_size):
+            messages = [
+                self.convert_string_to_message(
+                    insts[i], self.system_prompt, image_strs[i]
+                )
+                for i in range(start, min(start + window_size, len(insts)))
+            ]
+            model_output.extend(
+                self.model.chat(messages, self.sampling_params, use_tqdm=True)
+            )
+            del messages
         generations = [output.outputs[0].text for output in model_output]
         assert len(generations) == len(insts), "Number of outputs must match inputs."
+        self.log_metrics(
+            [self.request_metrics(output) for output in model_output],
+            time.time() - batch_start,
+        )
+        record_concurrent_spans(
+            "request",
+            [
+                (
+                    output.metrics.arrival_time,
+                    output.metrics.finished_time,
+                    {"completion_tokens": len(output.outputs[0].token_ids)},
+                )
+                for output in model_output
+                if getattr(output, "metrics", None) is not None
+                and output.metrics.finished_time is not None
+            ],
+        )
         print(f"Example generation:\n\n{generations[-1]}")
         return generations
 
+    def close(self) -> None:
+        """Frees the GPU memory and model-parallel state of the engine.
+
+        Deleting the model is not enough for another vllm model to be loaded in the same process
+        (e.g., a second judge).
+        """
+        del self.model
+        gc.collect()
+        destroy_model_parallel()
+        destroy_distributed_environment()
+        torch.cuda.empty_cache()
+
+    @property
+    def max_tokens(self) -> int:
+        return self.sampling_params.max_tokens
+
+    @max_tokens.setter
+    def max_tokens(self, max_tokens: int) -> None:
+        self.sampling_params.max_tokens = max_tokens
+
+    @staticmethod
+    def request_metrics(output) -> RequestMetrics:
+        metrics = RequestMetrics(
+            prompt_tokens=len(output.prompt_token_ids or []),
+            completion_tokens=len(output.outputs[0].token_ids),
+            finish_reason=output.outputs[0].finish_reason,
+            retries=0,
+        )
+        # timings are only reported by some vllm versions and configurations
+        timings = getattr(output, "metrics", None)
+        if timings is not None and timings.finished_time is not None:
+            metrics.queue_wait = timings.time_in_queue
+            metrics.start_time = timings.arrival_time
+            metrics.latency = timings.finished_time - timings.arrival_time
+            if timings.first_token_time is not None:
+                metrics.ttft = timings.first_token_time - timings.arrival_time
+        return metrics
+
     @staticmethod
     def model_type():
         return "vllm"
 
 
 class LiteLLM(Model):
+    # errors that may go away by retrying; others (e.g., authentication, bad requests or
+    # exceeding the context window) are raised at once
+    TRANSIENT_ERRORS = (
+        litellm.RateLimitError,
+        litellm.Timeout,
+        litellm.APIConnectionError,
+        litellm.InternalServerError,
+        litellm.ServiceUnavailableError,
+    )
+
     def __init__(
         self,
         model_args={
@@ -131,24 +296,242 @@ class LiteLLM(Model):
             "temperature": temperature,
             "max_tokens": max_tokens,
         }
+        if model_args["sampling_params"].get("stop"):
+            self.model_args["stop"] = model_args["sampling_params"]["stop"]
         self.system_prompt = model_args.get("system_prompt", None)
 
+    @property
+    def max_tokens(self) -> int:
+        return self.model_args["max_tokens"]
+
+    @max_tokens.setter
+    def max_tokens(self, max_tokens: int) -> None:
+        self.model_args["max_tokens"] = max_tokens
+
     def generate(self, inst: str, image_str: str = None) -> str:
+        return self.generate_with_metrics(inst, image_str)[0]
+
+    def generate_with_metrics(
+        self, inst: str, image_str: str = None
+    ) -> tuple[str, RequestMetrics]:
+        """Generates an answer, retrying transient failures here so they can be counted.
+
+        Requests are not streamed, so the time to first token is not reported.
+        """
         messages = self.convert_string_to_message(inst, self.system_prompt, image_str)
         self.model_args["messages"] = messages
-        response = completion(**self.model_args, max_retries=200)
+        attempts = 0
+
+        def attempt(**model_args):
+            nonlocal attempts
+            attempts += 1
+            return completion(**model_args, max_retries=0)
+
+        start = time.time()
+        response = self.generate_with_retries(
+            attempt,
+            self.model_args,
+            retry_max_attempts=200,
+            retry_max_interval=60,
+            retry_min_interval=1,
+            retry_exceptions=self.TRANSIENT_ERRORS,
+        )
+        latency = time.time() - start
         model_output = response.choices[0].message.content
-        return model_output
+        metrics = RequestMetrics(
+            latency=latency,
+            retries=attempts - 1,
+            prompt_tokens=response.usage.prompt_tokens,
+            completion_tokens=response.usage.completion_tokens,
+            finish_reason=response.choices[0].finish_reason,
+        )
+        if "stop" in self.model_args:
+            model_output = self.restore_stop(
+                model_output, self.model_args["stop"], metrics.finish_reason
+            )
+        try:
+            metrics.cost = completion_cost(completion_response=response)
+        except Exception:
+            # models without pricing information
+            pass
+        return model_output, metrics
+
+    @staticmethod
+    def restore_stop(output: str, stop: list[str], finish_reason: str) -> str:
+        """Adds back the stop sequence that APIs remove from the output.
+
+        APIs report the finish reason "stop" when the output ended at a stop sequence, but not
+        which one matched, so it is only added back when there is a single stop sequence. Outputs
+        that ended for other reasons (e.g., "length") are left unchanged.
+        """
+        if (
+            output is None
+            or finish_reason != "stop"
+            or len(stop) != 1
+            or output.endswith(stop[0])
+        ):
+            return output
+        return output + stop[0]
 
     @staticmethod
     def model_type():
         return "litellm"
 
 
+class MockModel(Model):
+    """Model that returns deterministic outputs in the format requested by each prompt.
+
+    Judge prompts get json judgements (a score in the requested range, or "A"/"B" for relative
+    judgements), prometheus-style prompts get "Feedback: ... [RESULT] <score>", meta prompts get
+    each requested <START OF ...> section, and any other prompt gets a canned answer. Outputs
+    depend only on the seed and the prompt, so runs are reproducible.
+
+    Latency, failures and malformed outputs are simulated according to proper_model_args:
+        latency: Seconds per request (default 0).
+        latency_jitter: Uniform jitter added to the latency, in seconds (default 0).
+        tokens_per_second: If given, adds (output tokens / tokens_per_second) seconds per request.
+        failure_rate: Probability of a request raising an error, which is retried up to
+            max_retries times (default 0).
+        malformed_rate: Probability of returning a truncated, unparsable output (default 0).
+        max_concurrency: Number of concurrent requests in batch_generate (default 1).
+        seed: Seed of the outputs (default 0).
+    """
+
+    def __init__(
+        self,
+        model_args: dict = {
+            "proper_model_args": {},
+            "sampling_params": {"temperature": 0, "max_tokens": 8192},
+        },
+        **kwargs,
+    ) -> None:
+        super().__init__(model_args, **kwargs)
+        mock_args = model_args["proper_model_args"]
+        self.latency = mock_args.get("latency", 0)
+        self.latency_jitter = mock_args.get("latency_jitter", 0)
+        self.tokens_per_second = mock_args.get("tokens_per_second", None)
+        self.failure_rate = mock_args.get("failure_rate", 0)
+        self.malformed_rate = mock_args.get("malformed_rate", 0)
+        self.max_concurrency = mock_args.get("max_concurrency", 1)
+        self.max_retries = mock_args.get("max_retries", 3)
+        self.seed = mock_args.get("seed", 0)
+        self.max_tokens = model_args["sampling_params"].get("max_tokens", 8192)
+        self.stop = model_args["sampling_params"].get("stop") or []
+        self.system_prompt = model_args.get("system_prompt", None)
+
+    @traced("batch_generate")
+    def batch_generate(
+        self, insts: list[str], image_strs: list[str] = None
+    ) -> list[str]:
+        if self.max_concurrency <= 1:
+            return super().batch_generate(insts, image_strs)
+        if image_strs is None:
+            image_strs = [None] * len(insts)
+        batch_start = time.time()
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            outputs = list(
+                tqdm(
+                    executor.map(
+                        self.timed_generate,
+                        insts,
+                        image_strs,
+                        [batch_start] * len(insts),
+                    ),
+                    desc="Generating...",
+                    total=len(insts),
+                )
+            )
+        generations = [generation for generation, _ in outputs]
+        self.log_metrics([metrics for _, metrics in outputs], time.time() - batch_start)
+        print(f"Example generation:\n\n{generations[-1]}")
+        return generations
+
+    def generate(self, inst: str, image_str: str = None) -> str:
+        return self.generate_with_metrics(inst, image_str)[0]
+
+    def generate_with_metrics(
+        self, inst: str, image_str: str = None
+    ) -> tuple[str, RequestMetrics]:
+        attempts = 0
+
+        def attempt(inst: str) -> tuple[str, RequestMetrics]:
+            nonlocal attempts
+            attempts += 1
+            return self._generate(inst)
+
+        start = time.time()
+        output, metrics = self.generate_with_retries(
+            attempt,
+            {"inst": inst},
+            retry_max_attempts=self.max_retries,
+            retry_max_interval=0,
+            retry_min_interval=0,
+        )
+        metrics.latency = time.time() - start
+        metrics.retries = attempts - 1
+        return output, metrics
+
+    def _generate(self, inst: str) -> tuple[str, RequestMetrics]:
+        # outputs are seeded on the prompt, while latency and failures are not
+        rng = random.Random(f"{self.seed}-{self.system_prompt}-{inst}")
+        prompt = f"{self.system_prompt or ''}\n{inst}"
+        output = self.mock_output(prompt, rng)
+        if rng.random() < self.malformed_rate:
+            output = output[: len(output) // 2]
+        # cut after the first stop sequence, keeping it like vllm does
+        stop_ends = [output.find(s) + len(s) for s in self.stop if s in output]
+        if stop_ends:
+            output = output[: min(stop_ends)]
+        # tokens are approximated as 4 characters
+        finish_reason = "length" if len(output) > self.max_tokens * 4 else "stop"
+        output = output[: self.max_tokens * 4]
+        ttft = self.latency + random.uniform(0, self.latency_jitter)
+        delay = ttft
+        if self.tokens_per_second:
+            delay += len(output) / 4 / self.tokens_per_second
+        time.sleep(delay)
+        if random.random() < self.failure_rate:
+            raise RuntimeError("Simulated mock model failure.")
+        metrics = RequestMetrics(
+            ttft=ttft,
+            prompt_tokens=len(prompt) // 4,
+            completion_tokens=len(output) // 4,
+            finish_reason=finish_reason,
+        )
+        return output, metrics
+
+    @staticmethod
+    def mock_output(prompt: str, rng: random.Random) -> str:
+        if '"result"' in prompt:
+            if '"A" or "B"' in prompt:
+                result = rng.choice(["A", "B"])
+            else:
+                score_range = re.search(r"number from (\d+) to (\d+)", prompt)
+                low, high = map(int, score_range.groups()) if score_range else (1, 6)
+                result = str(rng.randint(low, high))
+            return json.dumps({"feedback": "Mock feedback.", "result": result})
+        if "[RESULT]" in prompt:
+            score_range = re.search(r"integer number between (\d+) and (\d+)", prompt)
+            low, high = map(int, score_range.groups()) if score_range else (1, 5)
+            return f"Feedback: Mock feedback. [RESULT] {rng.randint(low, high)}"
+        sections = list(dict.fromkeys(re.findall(r"<START OF ([^>]+)>", prompt)))
+        if sections:
+            return "\n".join(
+                f"<START OF {section}>\nMock {section.lower()} {rng.randint(0, 10**6)}.\n<END OF {section}>"
+                for section in sections
+            )
+        return f"Mock answer {rng.randint(0, 10**6)}."
+
+    @staticmethod
+    def model_type():
+        return "mock"
+
+
 def instantiate_model(model_type: str, model_args: dict) -> Model:
     available_models = {
         VLLM.model_type(): VLLM,
         LiteLLM.model_type(): LiteLLM,
+        MockModel.model_type(): MockModel,
     }
     try:
         instantiated_model = available_models[model_type](model_args=model_args)
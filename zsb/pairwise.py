@@ -0,0 +1,222 @@
+import itertools
+from string import Template
+
+import numpy as np
+
+ELO_SCALE = 400 / np.log(10)
+ELO_BASE = 1000
+
+
+def fit_bradley_terry(
+    wins: np.ndarray, prior: float = 0.5, max_iters: int = 1000, tol: float = 1e-8
+) -> np.ndarray:
+    """Fits Bradley-Terry strengths with the MM algorithm (Hunter, 2004).
+
+    Args:
+        wins: (n_models, n_models) matrix where wins[i, j] is the number of times i beat j.
+        prior: Pseudo-wins added in both directions to every pair that was compared,
+            which keeps the strengths of undefeated or winless models finite.
+    Returns:
+        Log-strengths, centered to have zero mean.
+    """
+    n_models = wins.shape[0]
+    games = wins + wins.T
+    wins = wins + prior * (games > 0)
+    games = wins + wins.T
+    total_wins = wins.sum(axis=1)
+    strengths = np.ones(n_models)
+    for _ in range(max_iters):
+        pair_sums = strengths[:, None] + strengths[None, :]
+        denominators = (games / pair_sums).sum(axis=1)
+        new_strengths = np.where(
+            denominators > 0, total_wins / np.maximum(denominators, 1e-12), strengths
+        )
+        new_strengths /= np.exp(np.log(new_strengths).mean())
+        converged = np.abs(new_strengths - strengths).max() < tol
+        strengths = new_strengths
+        if converged:
+            break
+    log_strengths = np.log(strengths)
+    return log_strengths - log_strengths.mean()
+
+
+def wins_matrix(
+    model_A: np.ndarray, model_B: np.ndarray, a_wins: np.ndarray, n_models: int
+) -> np.ndarray:
+    """Builds the wins matrix from arrays of comparisons (model indices and outcomes)."""
+    wins = np.zeros((n_models, n_models))
+    winners = np.where(a_wins, model_A, model_B)
+    losers = np.where(a_wins, model_B, model_A)
+    np.add.at(wins, (winners, losers), 1)
+    return wins
+
+
+def bootstrap_bradley_terry(
+    model_A: np.ndarray,
+    model_B: np.ndarray,
+    a_wins: np.ndarray,
+    n_models: int,
+    n_bootstrap: int = 200,
+    confidence: float = 0.95,
+    rng: np.random.Generator = None,
+) -> dict[str, np.ndarray | float]:
+    """Fits Bradley-Terry log-strengths and their bootstrap confidence intervals.
+
+    Returns:
+        Dictionary with the point "scores", "lower" and "upper" interval bounds, and
+        "rank_stability": the fraction of bootstrap resamples yielding the point ranking.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    scores = fit_bradley_terry(wins_matrix(model_A, model_B, a_wins, n_models))
+    ranking = np.argsort(-scores)
+    resample_indices = rng.integers(0, len(a_wins), size=(n_bootstrap, len(a_wins)))
+    boot_scores = np.stack(
+        [
+            fit_bradley_terry(
+                wins_matrix(model_A[idx], model_B[idx], a_wins[idx], n_models)
+            )
+            for idx in resample_indices
+        ]
+    )
+    alpha = (1 - confidence) / 2
+    same_ranking = (np.argsort(-boot_scores, axis=1) == ranking).all(axis=1)
+    return {
+        "scores": scores,
+        "lower": np.quantile(boot_scores, alpha, axis=0),
+        "upper": np.quantile(boot_scores, 1 - alpha, axis=0),
+        "rank_stability": float(same_ranking.mean()),
+    }
+
+
+def to_elo(log_strengths: np.ndarray) -> np.ndarray:
+    """Converts Bradley-Terry log-strengths to the Elo scale."""
+    return ELO_BASE + ELO_SCALE * log_strengths
+
+
+def swiss_pairs(
+    scores: np.ndarray, round_i: int, available: set[tuple[int, int]] = None
+) -> list[tuple[int, int]]:
+    """Pairs models with neighbouring scores, alternating the pairing offset every round.
+
+    Even rounds pair ranks (0, 1), (2, 3)... and odd rounds shift the offset to (1, 2), (3, 4)...,
+    leaving the leader out (odd rounds fall back to the even pairing if no pair is left).
+
+    Args:
+        available: Pairs (i, j), with i < j, that can still be compared (all by default).
+            Each model is paired with the closest-ranked unpaired model it can be compared to.
+    """
+    ranking = np.argsort(-scores).tolist()
+    if round_i % 2 == 1 and len(ranking) > 2:
+        pairs = _pair_neighbours(ranking[1:], available)
+        if pairs:
+            return pairs
+    return _pair_neighbours(ranking, available)
+
+
+def _pair_neighbours(
+    ranking: list[int], available: set[tuple[int, int]] = None
+) -> list[tuple[int, int]]:
+    pairs = []
+    paired = set()
+    for k, first in enumerate(ranking):
+        if first in paired:
+            continue
+        for second in ranking[k + 1 :]:
+            pair = (min(first, second), max(first, second))
+            if second not in paired and (available is None or pair in available):
+                pairs.append((first, second))
+                paired.update(pair)
+                break
+    return pairs
+
+
+def uncertainty_pairs(
+    scores: np.ndarray,
+    n_comparisons: np.ndarray,
+    n_pairs: int,
+    available: set[tuple[int, int]] = None,
+) -> list[tuple[int, int]]:
+    """Selects the pairs whose outcome is most uncertain and that were compared the least.
+
+    Uses the Bernoulli variance p * (1 - p) of the Bradley-Terry win probability, discounted
+    by the number of comparisons already made for the pair.
+
+    Args:
+        available: Pairs (i, j), with i < j, that can still be compared (all by default).
+    """
+    pairs = [
+        pair
+        for pair in itertools.combinations(range(len(scores)), 2)
+        if available is None or pair in available
+    ]
+    if not pairs:
+        return []
+    first, second = np.array(pairs).T
+    p_win = 1 / (1 + np.exp(scores[second] - scores[first]))
+    informativeness = p_win * (1 - p_win) / (1 + n_comparisons[first, second])
+    best = np.argsort(-informativeness)[:n_pairs]
+    return [pairs[i] for i in best]
+
+
+def sample_a_places(n: int, random_seed: int) -> np.ndarray:
+    """Assigns which answer is shown in position A for each of n items.
+
+    The assignment is a seeded permutation of a balanced array of 0s and 1s, so each
+    answer is shown first in (roughly) half of the items.
+    """
+    rng = np.random.default_rng(random_seed)
+    return rng.permutation(np.arange(n) % 2)
+
+
+def build_pairwise_prompts(
+    judge_prompt: Template,
+    prompts: np.ndarray,
+    answers_A: np.ndarray,
+    answers_B: np.ndarray,
+    a_places: np.ndarray,
+) -> list[str]:
+    """Renders the relative judge prompt, placing answer A first wherever a_places is 0."""
+    first = np.where(a_places == 0, answers_A, answers_B)
+    second = np.where(a_places == 0, answers_B, answers_A)
+    return [
+        judge_prompt.substitute(prompt=prompt, answer_A=answer_1, answer_B=answer_2)
+        for prompt, answer_1, answer_2 in zip(prompts, first, second)
+    ]
+
+
+def reconcile_orders(
+    judgements: np.ndarray,
+    judgements_swapped: np.ndarray,
+    a_places: np.ndarray,
+) -> tuple[np.ndarray, dict[str, float]]:
+    """Reconciles the verdicts of both presentation orders of each item.
+
+    Args:
+        judgements: Preferred answer ("A" or "B") when answer A was in position a_places.
+        judgements_swapped: Preferred answer when the positions were swapped.
+        a_places: Position of answer A in the first order.
+    Returns:
+        Array of verdicts from the point of view of answer A ("win", "tie" or "loss"),
+        where inconsistent verdicts count as ties, and a dictionary of consistency statistics.
+    """
+    judgements = np.asarray(judgements)
+    judgements_swapped = np.asarray(judgements_swapped)
+    consistent = judgements == judgements_swapped
+    verdicts = np.where(
+        consistent, np.where(judgements == "A", "win", "loss"), "tie"
+    ).astype(object)
+    # the answer shown first won if it was A shown first, or B shown second
+    first_won = (judgements == "A") == (a_places == 0)
+    first_won_swapped = (judgements_swapped == "A") == (a_places == 1)
+    stats = {
+        "n_items": len(verdicts),
+        "order_consistency": float(consistent.mean()),
+        "first_position_win_rate": float(
+            np.concatenate([first_won, first_won_swapped]).mean()
+        ),
+        "win_rate_A": float((verdicts == "win").mean()),
+        "tie_rate": float((verdicts == "tie").mean()),
+        "win_rate_B": float((verdicts == "loss").mean()),
+    }
+    return verdicts, stats
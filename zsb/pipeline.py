@@ -0,0 +1,424 @@
+import hashlib
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+import pandas as pd
+
+from zsb.artifacts import artifact_hash, read_artifact, write_artifact
+from zsb.estimate import estimate_run, model_pricing, render_prompts
+from zsb.models import DEFAULT_MODEL_ARGS
+from zsb.tasks import available_tasks
+from zsb.tracing import TRACE_PATH_ENV
+from zsb.utils import PathInput
+
+SCRIPTS_DIR = Path(__file__).parent / "scripts"
+
+# rows whose prompts are rendered and tokenized for dry-run estimates
+ESTIMATE_SAMPLE_SIZE = 200
+
+
+@dataclass
+class Stage:
+    """A pipeline stage, which produces a single artifact.
+
+    Attributes:
+        name: Unique name of the stage (e.g., "answers/gemma").
+        output_path: Artifact written by the stage.
+        params: Everything that determines the output besides the input artifacts (task, model,
+            sampling params...). Together with the hashes of the inputs, it makes up the stage's
+            fingerprint.
+        inputs: Upstream artifacts read by the stage.
+        command: Command that runs the stage in a subprocess, so that each model is loaded in a
+            fresh process.
+        function: Alternative to command, for light stages that run in the pipeline process.
+        model: Model config ({"model_name", "model_type", "model_args"}), if the stage uses one.
+        estimate: How to render the prompts sent to the model, for dry-run estimates: the
+            {"stage", "task", "use_ref"} arguments of zsb.estimate.render_prompts.
+    """
+
+    name: str
+    output_path: Path
+    params: dict
+    inputs: list[Path] = field(default_factory=list)
+    command: list[str] = None
+    function: Callable[[], object] = None
+    model: dict = None
+    estimate: dict = None
+
+    @property
+    def model_type(self) -> str | None:
+        return None if self.model is None else self.model["model_type"]
+
+    @property
+    def sidecar_path(self) -> Path:
+        return self.output_path.with_name(self.output_path.name + ".stage.json")
+
+    def fingerprint(self) -> str | None:
+        """Hash of the stage params and input artifacts, or None if an input is missing."""
+        if not all(path.exists() for path in self.inputs):
+            return None
+        fingerprint = {
+            "name": self.name,
+            "params": self.params,
+            "inputs": [artifact_hash(path) for path in self.inputs],
+        }
+        return hashlib.sha256(
+            json.dumps(fingerprint, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    def sidecar(self) -> dict | None:
+        if not self.sidecar_path.exists():
+            return None
+        with open(self.sidecar_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def is_up_to_date(self) -> bool:
+        sidecar = self.sidecar()
+        return (
+            self.output_path.exists()
+            and sidecar is not None
+            and sidecar["fingerprint"] == self.fingerprint()
+        )
+
+    def environment(self) -> dict:
+        """Environment of the stage's subprocess, with its own trace file if tracing is on.
+
+        Stages run concurrently, so a shared trace path would be overwritten: trace.json
+        becomes, e.g., trace.answers_gemma.json for stage answers/gemma.
+        """
+        environment = dict(os.environ)
+        if environment.get(TRACE_PATH_ENV):
+            trace_path = Path(environment[TRACE_PATH_ENV])
+            stage_name = self.name.replace("/", "_")
+            environment[TRACE_PATH_ENV] = str(
+                trace_path.with_name(
+                    f"{trace_path.stem}.{stage_name}{trace_path.suffix}"
+                )
+            )
+        return environment
+
+    def run(self) -> None:
+        print(f"Running stage {self.name}.")
+        start = time.time()
+        if self.command is not None:
+            subprocess.run(self.command, check=True, env=self.environment())
+        else:
+            self.function()
+        # the sidecar is only written once the stage succeeded
+        sidecar = {
+            "fingerprint": self.fingerprint(),
+            "params": self.params,
+            "seconds": time.time() - start,
+            "n_rows": len(read_artifact(self.output_path)),
+        }
+        with open(self.sidecar_path, "w", encoding="utf-8") as f:
+            json.dump(sidecar, f, indent=4)
+        print(f"Finished stage {self.name} in {sidecar['seconds']:.0f}s.")
+
+
+def load_config(path: PathInput) -> dict:
+    """Loads a yaml (or json) pipeline config."""
+    import yaml
+
+    with open(path, encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+def _model_config(config: dict) -> dict:
+    return {
+        "model_name": config["model_name"],
+        "model_type": config["model_type"],
+        "model_args": config.get("model_args", DEFAULT_MODEL_ARGS),
+    }
+
+
+def _script_command(script: str, **kwargs) -> list[str]:
+    command = [sys.executable, str(SCRIPTS_DIR / script)]
+    for key, value in kwargs.items():
+        if isinstance(value, (dict, list)):
+            value = json.dumps(value)
+        command += [f"--{key}", str(value)]
+    return command
+
+
+def build_stages(config: dict) -> list[list[Stage]]:
+    """Builds the pipeline stages from a config.
+
+    The config has the keys:
+        output_dir: Directory where all artifacts are written.
+        task: Name of the task.
+        format: Format of the artifacts (jsonl, parquet or arrow). Defaults to jsonl.
+        prompts: Either {"path": ...} for an existing benchmark, or {"n_prompts", "seed",
+            "model_name", "model_type", "model_args"} to generate one.
+        answers: Mapping from a name to the config ({"model_name", "model_type", "model_args"})
+            of each model to evaluate.
+        judge: Config of the judge, which may also have "use_ref".
+
+    Returns:
+        Stages grouped in levels, where the stages of a level only depend on earlier levels.
+    """
+    output_dir = Path(config["output_dir"])
+    task = config["task"]
+    extension = config.get("format", "jsonl")
+    levels = []
+    # prompts
+    prompts = config["prompts"]
+    if "path" in prompts:
+        prompts_path = Path(prompts["path"])
+    else:
+        prompts_path = output_dir / f"prompts.{extension}"
+        model = _model_config(prompts)
+        params = {
+            "task": task,
+            "n_prompts": prompts["n_prompts"],
+            "seed": prompts.get("seed", 124),
+            **model,
+        }
+        levels.append(
+            [
+                Stage(
+                    name="prompts",
+                    output_path=prompts_path,
+                    params=params,
+                    command=_script_command(
+                        "generate_prompts.py", output_path=prompts_path, **params
+                    ),
+                    model=model,
+                    estimate={"stage": "prompts", "task": task},
+                )
+            ]
+        )
+    # answers
+    answers_stages = []
+    for name, answers_config in config["answers"].items():
+        model = _model_config(answers_config)
+        answers_stages.append(
+            Stage(
+                name=f"answers/{name}",
+                output_path=output_dir / "answers" / f"{name}.{extension}",
+                params=model,
+                inputs=[prompts_path],
+                command=_script_command(
+                    "generate_answers.py",
+                    prompts_path=prompts_path,
+                    output_path=output_dir / "answers" / f"{name}.{extension}",
+                    **model,
+                ),
+                model=model,
+                estimate={"stage": "answers", "task": task},
+            )
+        )
+    levels.append(answers_stages)
+    # judgements
+    judge = _model_config(config["judge"])
+    use_ref = config["judge"].get("use_ref", False)
+    judgement_stages = []
+    for answers_stage in answers_stages:
+        name = answers_stage.name.split("/", 1)[1]
+        output_path = output_dir / "judgements" / f"{name}.{extension}"
+        params = {"task": task, "use_ref": use_ref, **judge}
+        judgement_stages.append(
+            Stage(
+                name=f"judgements/{name}",
+                output_path=output_path,
+                params=params,
+                inputs=[answers_stage.output_path],
+                command=_script_command(
+                    "generate_da_eval.py",
+                    answers_path=answers_stage.output_path,
+                    output_path=output_path,
+                    **params,
+                ),
+                model=judge,
+                estimate={"stage": "da_eval", "task": task, "use_ref": use_ref},
+            )
+        )
+    levels.append(judgement_stages)
+    # report
+    report_path = output_dir / f"report.{extension}"
+    judgement_paths = {
+        stage.name.split("/", 1)[1]: stage.output_path for stage in judgement_stages
+    }
+    levels.append(
+        [
+            Stage(
+                name="report",
+                output_path=report_path,
+                params={},
+                inputs=list(judgement_paths.values()),
+                function=lambda: write_artifact(
+                    summarize_judgements(judgement_paths), report_path
+                ),
+            )
+        ]
+    )
+    return levels
+
+
+def summarize_judgements(judgement_paths: dict[str, PathInput]) -> pd.DataFrame:
+    """Summarizes the DA judgements of each model, sorted by mean score.
+
+    Judgements without feedback are counted as unparsed (the task parsers fall back to
+    the lowest score when they fail).
+    """
+    rows = []
+    for name, path in judgement_paths.items():
+        judgements = read_artifact(path, columns=["judgement", "feedback"])
+        scores = judgements["judgement"].astype(float)
+        rows.append(
+            {
+                "model": name,
+                "n": len(scores),
+                "mean": scores.mean(),
+                "ci95": 1.96 * scores.std() / len(scores) ** 0.5,
+                "unparsed": judgements["feedback"].isna().mean(),
+            }
+        )
+    report = pd.DataFrame(rows).sort_values("mean", ascending=False)
+    print(report.to_string(index=False))
+    return report.reset_index(drop=True)
+
+
+def estimate_stage(
+    stage: Stage, n_requests: int, data: pd.DataFrame, rng: random.Random
+) -> dict:
+    """Cost and time estimate of a stage (see zsb.estimate.estimate_run).
+
+    Args:
+        n_requests: Number of prompts of the benchmark.
+        data: Sample of the rows the stage's prompts are rendered from, with the columns
+            "prompt", "answer" and "reference" ("" where they are not known yet, e.g., answers
+            that will be generated by an earlier stage).
+    The time is extrapolated from the stage's last run, if there was one.
+    """
+    if stage.model is None:
+        return {"stage": stage.name}
+    system_prompt, prompts = render_prompts(
+        stage.estimate["stage"],
+        available_tasks[stage.estimate["task"]],
+        data,
+        min(ESTIMATE_SAMPLE_SIZE, n_requests),
+        stage.estimate.get("use_ref", False),
+        rng,
+    )
+    sampling_params = stage.model["model_args"].get("sampling_params", {})
+    pricing = None
+    if stage.model_type == "litellm":
+        pricing = model_pricing(stage.model["model_name"])
+    history = {}
+    sidecar = stage.sidecar()
+    if sidecar is not None and sidecar["n_rows"]:
+        history["seconds_per_request"] = sidecar["seconds"] / sidecar["n_rows"]
+    estimate = estimate_run(
+        system_prompt,
+        prompts,
+        n_requests,
+        sampling_params.get("max_tokens", 0),
+        pricing,
+        history,
+    )
+    return {"stage": stage.name, **estimate}
+
+
+def _estimate_data(path: Path, n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """Sample of the rows of an artifact, or empty rows if it does not exist yet."""
+    if not path.exists():
+        return pd.DataFrame({"prompt": [""], "answer": [""], "reference": [""]})
+    data = read_artifact(path)
+    data = data.sample(min(n_rows, len(data)), random_state=seed)
+    for column in ["prompt", "answer", "reference"]:
+        if column not in data.columns:
+            data[column] = ""
+    return data.fillna("")
+
+
+def dry_run(levels: list[list[Stage]], config: dict) -> pd.DataFrame:
+    """Lists the stages that would run, with cost and time estimates."""
+    prompts = config["prompts"]
+    if "path" in prompts:
+        n_prompts = len(read_artifact(prompts["path"], columns=["prompt"]))
+    else:
+        n_prompts = prompts["n_prompts"]
+    rng = random.Random(0)
+    estimates = []
+    stale_outputs = set()
+    for level in levels:
+        for stage in level:
+            # a stage also reruns if one of its inputs will be regenerated
+            if stage.is_up_to_date() and not stale_outputs.intersection(stage.inputs):
+                estimates.append({"stage": stage.name, "up_to_date": True})
+                continue
+            stale_outputs.add(stage.output_path)
+            data = None
+            if stage.inputs:
+                data = _estimate_data(stage.inputs[0], ESTIMATE_SAMPLE_SIZE)
+            estimate = estimate_stage(stage, n_prompts, data, rng)
+            estimates.append({**estimate, "up_to_date": False})
+    estimates = pd.DataFrame(estimates)
+    print(estimates.to_string(index=False))
+    return estimates
+
+
+def run_pipeline(
+    levels: list[list[Stage]], max_workers: int = 4, force: bool = False
+) -> None:
+    """Runs the stages that are not up to date, each as soon as the stages it depends on finish.
+
+    A stage depends on the stages that produce its inputs, so, e.g., the judgements of a model
+    start as soon as its answers are ready. Stages that call APIs run concurrently (up to
+    max_workers), while stages that load a model on the local GPUs run one at a time.
+    Whether a stage is up to date is only checked once its dependencies finished.
+    """
+    stages = [stage for level in levels for stage in level]
+    for stage in stages:
+        stage.output_path.parent.mkdir(parents=True, exist_ok=True)
+    producers = {stage.output_path: stage.name for stage in stages}
+    dependencies = {
+        stage.name: {producers[path] for path in stage.inputs if path in producers}
+        for stage in stages
+    }
+    pending = list(stages)
+    finished = set()
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers + 1) as executor:
+        while pending or running:
+            skipped = False
+            for stage in list(pending):
+                if not dependencies[stage.name] <= finished:
+                    continue
+                if not force and stage.is_up_to_date():
+                    print(f"Skipping stage {stage.name}, which is up to date.")
+                    pending.remove(stage)
+                    finished.add(stage.name)
+                    skipped = True
+                    continue
+                if stage.model_type == "vllm":
+                    if any(s.model_type == "vllm" for s in running.values()):
+                        continue
+                elif (
+                    sum(s.model_type != "vllm" for s in running.values()) >= max_workers
+                ):
+                    continue
+                pending.remove(stage)
+                running[executor.submit(stage.run)] = stage
+            if not running:
+                # skipped stages may have unblocked others
+                if skipped:
+                    continue
+                assert not pending, "Stages with unmet dependencies: " + ", ".join(
+                    stage.name for stage in pending
+                )
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                future.result()
+                finished.add(stage.name)
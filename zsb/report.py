@@ -0,0 +1,193 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from zsb.artifacts import read_artifact
+from zsb.stats import (
+    bootstrap_counts,
+    grouped_bootstrap_means,
+    holm_adjust,
+    sign_flip_test,
+)
+from zsb.utils import PathInput
+
+
+def load_judgements(
+    judgement_paths: dict[str, PathInput], drop_unparsed: bool = False
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Loads the DA judgements of several models, aligned by prompt.
+
+    Args:
+        judgement_paths: Judgements artifact of each model.
+        drop_unparsed: Whether to leave out judgements that could not be parsed (those without
+            feedback), instead of keeping the parser's fallback score.
+    Returns:
+        (n_prompts, n_models) scores, with NaN where a model has no judgement for a prompt,
+        and the flattened metadata of each prompt (one column per attribute).
+    """
+    scores = {}
+    metadatas = {}
+    for name, path in judgement_paths.items():
+        judgements = read_artifact(path)
+        model_scores = judgements["judgement"].astype(float)
+        if drop_unparsed:
+            model_scores = model_scores.where(judgements["feedback"].notna())
+        scores[name] = model_scores.groupby(judgements["prompt"]).mean()
+        if "metadata" in judgements.columns:
+            for prompt, metadata in zip(judgements["prompt"], judgements["metadata"]):
+                metadatas.setdefault(prompt, metadata)
+    scores = pd.DataFrame(scores)
+    metadata = pd.DataFrame.from_records(
+        [metadatas.get(prompt) or {} for prompt in scores.index], index=scores.index
+    )
+    return scores, metadata
+
+
+def attribute_groups(
+    metadata: pd.DataFrame, attributes: list[str] = None, max_values: int = 50
+) -> tuple[np.ndarray, list[tuple[str, str]]]:
+    """Membership of each prompt in the group of all prompts and in each attribute value.
+
+    Args:
+        attributes: Metadata attributes to break down (by default, all attributes with at most
+            max_values distinct values).
+    Returns:
+        (n_prompts, n_groups) boolean matrix, and the (attribute, value) of each group, where the
+        first group is ("all", "all").
+    """
+    if attributes is None:
+        attributes = [
+            c for c in metadata.columns if metadata[c].nunique() <= max_values
+        ]
+    groups = [np.ones(len(metadata), dtype=bool)]
+    labels = [("all", "all")]
+    for attribute in attributes:
+        values = metadata[attribute].astype(str).where(metadata[attribute].notna())
+        for value in sorted(values.dropna().unique()):
+            groups.append((values == value).to_numpy())
+            labels.append((attribute, value))
+    return np.stack(groups, axis=1), labels
+
+
+def score_breakdown(
+    scores: pd.DataFrame,
+    groups: np.ndarray,
+    labels: list[tuple[str, str]],
+    counts: np.ndarray,
+    confidence: float = 0.95,
+) -> pd.DataFrame:
+    """Mean score and bootstrap confidence interval of each model in each group."""
+    values = scores.to_numpy()
+    boot_means = grouped_bootstrap_means(values, groups, counts)
+    alpha = (1 - confidence) / 2
+    lower, upper = np.nanquantile(boot_means, [alpha, 1 - alpha], axis=0)
+    present = ~np.isnan(values)
+    sizes = groups.T.astype(int) @ present.astype(int)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = (groups.T.astype(float) @ np.nan_to_num(values)) / sizes
+    rows = []
+    for g, (attribute, value) in enumerate(labels):
+        for m, model in enumerate(scores.columns):
+            rows.append(
+                {
+                    "attribute": attribute,
+                    "value": value,
+                    "model": model,
+                    "n": int(sizes[g, m]),
+                    "mean": means[g, m],
+                    "ci_lower": lower[g, m],
+                    "ci_upper": upper[g, m],
+                }
+            )
+    return pd.DataFrame(rows)
+
+
+def paired_comparisons(
+    scores: pd.DataFrame,
+    counts: np.ndarray,
+    confidence: float = 0.95,
+    n_permutations: int = 10000,
+    rng: np.random.Generator = None,
+) -> pd.DataFrame:
+    """Paired differences between each pair of models on the prompts both were judged on.
+
+    Reports the mean difference, its bootstrap confidence interval, and the p-value of a
+    paired sign-flip permutation test, also adjusted for multiple comparisons (Holm).
+    """
+    pairs = list(itertools.combinations(scores.columns, 2))
+    if not pairs:
+        return pd.DataFrame()
+    differences = np.stack([scores[a] - scores[b] for a, b in pairs], axis=1)
+    all_prompts = np.ones((len(scores), 1), dtype=bool)
+    boot_means = grouped_bootstrap_means(differences, all_prompts, counts)[:, 0]
+    alpha = (1 - confidence) / 2
+    lower, upper = np.nanquantile(boot_means, [alpha, 1 - alpha], axis=0)
+    p_values = sign_flip_test(differences, n_permutations, rng)
+    return pd.DataFrame(
+        {
+            "model_A": [a for a, _ in pairs],
+            "model_B": [b for _, b in pairs],
+            "n": (~np.isnan(differences)).sum(axis=0),
+            "mean_diff": np.nanmean(differences, axis=0),
+            "ci_lower": lower,
+            "ci_upper": upper,
+            "p_value": p_values,
+            "p_holm": holm_adjust(p_values),
+        }
+    )
+
+
+def build_report(
+    judgement_paths: dict[str, PathInput],
+    attributes: list[str] = None,
+    max_values: int = 50,
+    drop_unparsed: bool = False,
+    confidence: float = 0.95,
+    n_bootstrap: int = 1000,
+    n_permutations: int = 10000,
+    random_seed: int = 42,
+) -> dict[str, pd.DataFrame]:
+    """Per-model and per-attribute score breakdowns and paired comparisons between models.
+
+    All bootstrap intervals share a single matrix of resample counts over prompts, so the
+    intervals of all models, groups and differences come from the same resamples.
+
+    Returns:
+        Dictionary with the "models" (overall scores), "attributes" (scores per attribute
+        value) and "comparisons" (paired differences) tables.
+    """
+    rng = np.random.default_rng(random_seed)
+    scores, metadata = load_judgements(judgement_paths, drop_unparsed)
+    groups, labels = attribute_groups(metadata, attributes, max_values)
+    counts = bootstrap_counts(len(scores), n_bootstrap, rng)
+    breakdown = score_breakdown(scores, groups, labels, counts, confidence)
+    overall = breakdown[breakdown["attribute"] == "all"].drop(
+        columns=["attribute", "value"]
+    )
+    return {
+        "models": overall.sort_values("mean", ascending=False).reset_index(drop=True),
+        "attributes": breakdown[breakdown["attribute"] != "all"].reset_index(drop=True),
+        "comparisons": paired_comparisons(
+            scores, counts, confidence, n_permutations, rng
+        ),
+    }
+
+
+def report_html(report: dict[str, pd.DataFrame]) -> str:
+    """Renders a report as a standalone HTML page, with attribute scores pivoted by model."""
+    attributes = report["attributes"]
+    pivoted = attributes.pivot_table(
+        index=["attribute", "value"], columns="model", values="mean", sort=False
+    )
+    sections = [
+        ("Models", report["models"].to_html(index=False, float_format="%.3f")),
+        (
+            "Comparisons",
+            report["comparisons"].to_html(index=False, float_format="%.3f"),
+        ),
+        ("Mean score by attribute", pivoted.to_html(float_format="%.3f")),
+        ("Attributes", attributes.to_html(index=False, float_format="%.3f")),
+    ]
+    body = "\n".join(f"<h2>{title}</h2>\n{table}" for title, table in sections)
+    return f"<html>\n<head><meta charset='utf-8'></head>\n<body>\n{body}\n</body>\n</html>\n"
@@ -0,0 +1,252 @@
+import random
+import tempfile
+import timeit
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+from jsonargparse import CLI
+from PIL import Image
+
+from zsb.artifacts import read_artifact, write_artifact
+from zsb.catalog import CombinationSpace
+from zsb.images import encode_jpeg
+from zsb.mbr.utils import run_mbr_matrix
+from zsb.models import MockModel, instantiate_model
+from zsb.tasks import available_tasks
+from zsb.tasks.base import Task
+from zsb.utils import load_image
+
+DATA_DIR = Path(__file__).parents[2] / "data"
+
+BENCHMARK_KEYS = ["benchmark", "task", "size"]
+
+
+def time_function(
+    function: Callable[[], object], repeats: int, min_seconds: float = 0.2
+) -> float:
+    """Best wall-clock time of one call of function over repeats, in seconds.
+
+    Like timeit, each repeat times as many calls as it takes to last at least min_seconds, so
+    that fast functions (e.g., rendering 50 prompts in well under a millisecond) are not timed
+    below the resolution and jitter of the clock.
+    """
+    timer = timeit.Timer(function)
+    number = 1
+    seconds = timer.timeit(number)
+    while seconds < min_seconds:
+        number *= 2
+        seconds = timer.timeit(number)
+    # the calibrating run counts as the first repeat
+    return min([seconds, *timer.repeat(repeats - 1, number)]) / number
+
+
+def task_data_path(task: str) -> Path:
+    """Bundled benchmark closest to a task (e.g., translation_en_de for general_translation_en_de)."""
+    candidates = [
+        task.replace("general_purpose_chat", "general_capabilities"),
+        task.replace("general_translation", "translation"),
+    ]
+    for candidate in candidates:
+        if (DATA_DIR / f"{candidate}.jsonl").exists():
+            return DATA_DIR / f"{candidate}.jsonl"
+    return DATA_DIR / "general_capabilities_english.jsonl"
+
+
+def benchmark_combinations(
+    combinations: CombinationSpace, repeats: int, n_decode: int = 100000
+):
+    """Times shuffling the combination space and decoding its first n_decode combinations."""
+    indices = np.arange(min(len(combinations), n_decode))
+    yield "combinations_shuffle_decode", len(combinations), time_function(
+        lambda: combinations.shuffled(random.Random(0)).codes_at(indices), repeats
+    )
+
+
+def benchmark_task(
+    task_obj: Task,
+    combinations: CombinationSpace,
+    data: pd.DataFrame,
+    size: int,
+    repeats: int,
+):
+    """Times template rendering and output parsing of a task on size rows."""
+    rng = random.Random(0)
+    combinations = rng.choices(combinations, k=size)
+    meta_prompt = task_obj.meta_prompt["user_prompt"]
+    if isinstance(meta_prompt, str):
+        render_meta = lambda: [meta_prompt for _ in combinations]
+    else:
+        render_meta = lambda: [meta_prompt.substitute(**c) for c in combinations]
+    yield "render_meta_prompt", size, time_function(render_meta, repeats)
+    meta_prompts = render_meta()
+    system_prompt = task_obj.meta_prompt["system_prompt"]
+    meta_outputs = [
+        MockModel.mock_output(f"{system_prompt}\n{p}", rng) for p in meta_prompts
+    ]
+    yield "parse_meta_prompt", size, time_function(
+        lambda: [task_obj.parse_meta_prompt_output(o) for o in meta_outputs], repeats
+    )
+    rows = data.sample(size, replace=True, random_state=0)
+    judge_prompt = task_obj.da_judge_prompt["user_prompt"]
+    render_judge = lambda: [
+        judge_prompt.substitute(prompt=prompt, answer=reference, reference=reference)
+        for prompt, reference in zip(rows["prompt"], rows["reference"])
+    ]
+    try:
+        judge_prompts = render_judge()
+    except KeyError:
+        # the judge prompt of this task needs other fields
+        return
+    yield "render_judge_prompt", size, time_function(render_judge, repeats)
+    system_prompt = task_obj.da_judge_prompt["system_prompt"]
+    judge_outputs = [
+        MockModel.mock_output(f"{system_prompt}\n{p}", rng) for p in judge_prompts
+    ]
+    yield "parse_da_prompt", size, time_function(
+        lambda: [task_obj.parse_da_prompt_output(o) for o in judge_outputs], repeats
+    )
+
+
+def benchmark_io(data: pd.DataFrame, size: int, repeats: int):
+    rows = data.sample(size, replace=True, random_state=0).reset_index(drop=True)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for format in ["jsonl", "parquet"]:
+            path = Path(tmp_dir) / f"artifact.{format}"
+            yield f"write_{format}", size, time_function(
+                lambda: write_artifact(rows, path), repeats
+            )
+            yield f"read_{format}", size, time_function(
+                lambda: read_artifact(path), repeats
+            )
+
+
+def benchmark_mbr(data: pd.DataFrame, size: int, n_candidates: int, repeats: int):
+    """Times MBR over size sources with n_candidates each, with a mock metric."""
+    rows = data.sample(size, replace=True, random_state=0)
+    sources = rows["prompt"].tolist()
+    candidates = np.repeat(rows["reference"].to_numpy(), n_candidates).tolist()
+    model = instantiate_model(
+        "mock", {"proper_model_args": {"model": "mock"}, "sampling_params": {}}
+    )
+    yield "mbr", size, time_function(
+        lambda: run_mbr_matrix(
+            candidates, sources, n_candidates, model, "prometheus", True
+        ),
+        repeats,
+    )
+
+
+def benchmark_images(size: int, repeats: int, side: int = 1024):
+    rng = np.random.default_rng(0)
+    images = [
+        Image.fromarray(rng.integers(0, 256, (side, side, 3), dtype=np.uint8))
+        for _ in range(min(size, 16))
+    ]
+    images = [images[i % len(images)] for i in range(size)]
+    yield "encode_jpeg", size, time_function(
+        lambda: [encode_jpeg(image) for image in images], repeats
+    )
+    yield "load_image", size, time_function(
+        lambda: [load_image(image) for image in images], repeats
+    )
+
+
+def compare_to_baseline(
+    results: pd.DataFrame,
+    baseline: pd.DataFrame,
+    tolerance: float,
+    noise_floor_us: float,
+) -> pd.DataFrame:
+    """Adds the ratio to the baseline time of each benchmark and flags regressions.
+
+    A benchmark regressed if its time per item is more than tolerance slower than the baseline,
+    and by more than noise_floor_us microseconds.
+    """
+    baseline = baseline[BENCHMARK_KEYS + ["seconds"]].rename(
+        columns={"seconds": "baseline_seconds"}
+    )
+    results = results.merge(baseline, on=BENCHMARK_KEYS, how="left")
+    results["ratio"] = results["seconds"] / results["baseline_seconds"]
+    baseline_us_per_item = results["baseline_seconds"] / results["size"] * 1e6
+    results["regression"] = (results["ratio"] > 1 + tolerance) & (
+        results["us_per_item"] - baseline_us_per_item > noise_floor_us
+    )
+    return results
+
+
+def main(
+    output_path: str,
+    baseline_path: str = None,
+    tasks: list[str] = None,
+    sizes: list[int] = [100, 1000],
+    repeats: int = 3,
+    n_candidates: int = 8,
+    n_images: int = 16,
+    tolerance: float = 0.2,
+    noise_floor_us: float = 1.0,
+):
+    """Times each stage of the pipeline with a mock model, for every task and dataset size.
+
+    Benchmarks: shuffling and decoding the combination space, meta-prompt rendering and
+    parsing, judge prompt rendering and parsing (on the bundled data of the task), jsonl and
+    parquet I/O, MBR, and image encoding. Each time is the best of repeats, each of which lasts at
+    least 0.2 seconds (see time_function). If baseline_path (the output of an earlier run) is
+    given, benchmarks more than tolerance and noise_floor_us microseconds per item slower than
+    the baseline are flagged, and the script exits with an error.
+    """
+    tasks = tasks or list(available_tasks)
+    results = []
+    # per-task benchmarks
+    for task in tasks:
+        task_obj = available_tasks[task]
+        data = read_artifact(task_data_path(task))
+        combinations = CombinationSpace(task_obj.task_attributes)
+        benchmarks = [*benchmark_combinations(combinations, repeats)]
+        for size in sizes:
+            benchmarks += benchmark_task(task_obj, combinations, data, size, repeats)
+        for benchmark, n, seconds in benchmarks:
+            results.append(
+                {
+                    "benchmark": benchmark,
+                    "task": task,
+                    "size": n,
+                    "seconds": seconds,
+                }
+            )
+    # task-agnostic benchmarks
+    data = read_artifact(DATA_DIR / "general_capabilities_english.jsonl")
+    for size in sizes:
+        benchmarks = [
+            *benchmark_io(data, size, repeats),
+            *benchmark_mbr(data, max(size // n_candidates, 1), n_candidates, repeats),
+        ]
+        for benchmark, n, seconds in benchmarks:
+            results.append(
+                {"benchmark": benchmark, "task": None, "size": n, "seconds": seconds}
+            )
+    for benchmark, n, seconds in benchmark_images(n_images, repeats):
+        results.append(
+            {"benchmark": benchmark, "task": None, "size": n, "seconds": seconds}
+        )
+    results = pd.DataFrame(results)
+    results["us_per_item"] = results["seconds"] / results["size"] * 1e6
+    if baseline_path is not None:
+        results = compare_to_baseline(
+            results, read_artifact(baseline_path), tolerance, noise_floor_us
+        )
+    print(results.to_string(index=False))
+    write_artifact(results, output_path)
+    if baseline_path is not None and results["regression"].any():
+        regressions = results[results["regression"]]
+        raise SystemExit(
+            f"{len(regressions)} benchmarks regressed by more than {tolerance:.0%}:\n"
+            f"{regressions[BENCHMARK_KEYS + ['ratio']].to_string(index=False)}"
+        )
+
+    return results
+
+
+if __name__ == "__main__":
+    CLI([main], as_positional=False)
@@ -0,0 +1,98 @@
+import random
+
+import pandas as pd
+from jsonargparse import CLI
+
+from zsb.artifacts import read_artifact
+from zsb.estimate import estimate_run, model_pricing, render_prompts, telemetry_stats
+from zsb.tasks import available_tasks
+from zsb.utils import iter_jsonl
+
+
+def main(
+    stage: str,
+    model_name: str,
+    model_type: str,
+    task: str = None,
+    input_paths: list[str] = [],
+    manifest_path: str = None,
+    n_prompts: int = None,
+    use_ref: bool = False,
+    model_args: dict = {
+        "proper_model_args": {},
+        "sampling_params": {"temperature": 0, "max_tokens": 8192},
+    },
+    telemetry_paths: list[str] = [],
+    tokens_per_second: float = None,
+    sample_size: int = 200,
+    tokenizer: str = "tiktoken",
+    seed: int = 0,
+):
+    """Estimates the tokens, cost and wall-clock of running a script before running it.
+
+    stage is the script to estimate: "prompts" (generate_prompts.py with n_prompts), "answers"
+    (generate_answers.py on each of input_paths) or "da_eval" (generate_da_eval.py on each of
+    input_paths, or on each entry of a generate_da_eval_batch.py manifest). Prompts are rendered
+    and tokenized on a sample of sample_size rows per input. Output lengths and time per request
+    come from the outputs of past runs saved with --save_telemetry (telemetry_paths), otherwise
+    max_tokens is used as an upper bound and time is estimated from tokens_per_second.
+    """
+    assert stage in ["prompts", "answers", "da_eval"], "Unknown stage."
+    assert (
+        stage != "prompts" or n_prompts is not None
+    ), "n_prompts is required for the prompts stage."
+    rng = random.Random(seed)
+    max_tokens = model_args["sampling_params"].get("max_tokens", 8192)
+    pricing = model_pricing(model_name) if model_type == "litellm" else None
+    history = telemetry_stats(telemetry_paths)
+    tokenizer_model = model_name if tokenizer == "hf" else None
+    # list what the script would run on
+    if manifest_path is not None:
+        entries = list(iter_jsonl(manifest_path))
+        entries = [
+            (e["task"], e["answers_path"], e.get("use_ref", use_ref)) for e in entries
+        ]
+    else:
+        entries = [(task, path, use_ref) for path in input_paths or [None]]
+    estimates = []
+    for entry_task, path, entry_use_ref in entries:
+        task_obj = None if stage == "answers" else available_tasks[entry_task]
+        if stage == "prompts":
+            data, n_requests = None, n_prompts
+            n_sample = min(sample_size, n_prompts)
+        else:
+            columns = (
+                ["prompt"] if stage == "answers" else ["prompt", "answer", "reference"]
+            )
+            data = read_artifact(path, columns=columns)
+            n_requests = len(data)
+            data = data.sample(min(sample_size, n_requests), random_state=seed)
+            n_sample = None
+        system_prompt, prompts = render_prompts(
+            stage, task_obj, data, n_sample, entry_use_ref, rng
+        )
+        estimate = estimate_run(
+            system_prompt,
+            prompts,
+            n_requests,
+            max_tokens,
+            pricing,
+            history,
+            tokens_per_second,
+            tokenizer,
+            tokenizer_model,
+        )
+        estimates.append({"task": entry_task, "path": path, **estimate})
+    estimates = pd.DataFrame(estimates)
+    if len(estimates) > 1:
+        total = estimates.drop(columns=["task", "path"]).sum(min_count=1)
+        estimates.loc[len(estimates)] = {"task": "total", "path": None, **total}
+    print(estimates.to_string(index=False))
+    if pricing is None and model_type == "litellm":
+        print(f"No pricing found for {model_name} in litellm.")
+
+    return estimates
+
+
+if __name__ == "__main__":
+    CLI([main], as_positional=False)
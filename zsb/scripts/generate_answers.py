@@ -1,7 +1,10 @@
 import pandas as pd
 from jsonargparse import CLI
 
+from zsb.artifacts import read_artifact, write_artifact
+from zsb.lengths import LengthHistory, adaptive_batch_generate
 from zsb.models import instantiate_model
+from zsb.telemetry import metrics_columns
 
 
 def main(
@@ -13,19 +16,42 @@ def main(
         "proper_model_args": {},
         "sampling_params": {"temperature": 0, "max_tokens": 8192},
     },
+    shard: str = None,
+    save_telemetry: bool = False,
+    length_history_path: str = None,
+    task: str = None,
 ):
+    """Generates answers to prompts.
+
+    With length_history_path, max_tokens is set from the answer lengths of past runs of the
+    same task and model (see adaptive_batch_generate), so task is required.
+    """
+    assert (
+        length_history_path is None or task is not None
+    ), "task is required with length_history_path."
     # load queries
-    queries = pd.read_json(prompts_path, lines=True)
+    queries = read_artifact(prompts_path, shard=shard)
     # load model
     model_args["proper_model_args"]["model"] = model_name
     model = instantiate_model(model_type, model_args)
     # generate answers
-    answers = model.batch_generate(queries["prompt"].tolist())
+    if length_history_path is None:
+        answers = model.batch_generate(queries["prompt"].tolist())
+    else:
+        # set max_tokens from the output lengths of past runs on the same task
+        answers = adaptive_batch_generate(
+            model,
+            queries["prompt"].tolist(),
+            LengthHistory(length_history_path),
+            f"{task}|answers|{model_name}",
+        )
+    model.log_run_summary()
     queries["answer"] = answers
+    if save_telemetry:
+        for column, values in metrics_columns(model.last_metrics).items():
+            queries[column] = values
     # save prompts for later
-    pd.DataFrame.from_dict(queries).to_json(
-        output_path, lines=True, orient="records", force_ascii=False
-    )
+    write_artifact(pd.DataFrame.from_dict(queries), output_path, shard=shard)
 
     return queries
 
@@ -1,8 +1,15 @@
+import copy
+
 import pandas as pd
 from jsonargparse import CLI
 
+from zsb.artifacts import read_artifact, write_artifact
+from zsb.lengths import LengthHistory, adaptive_batch_generate
 from zsb.models import instantiate_model
 from zsb.tasks import available_tasks
+from zsb.telemetry import RequestMetrics, metrics_columns
+from zsb.tracing import span
+from zsb.utils import row_keys
 
 
 def main(
@@ -16,40 +23,114 @@ def main(
         "sampling_params": {"temperature": 0, "max_tokens": 8192},
     },
     use_ref: bool = False,
+    shard: str = None,
+    previous_judgements_path: str = None,
+    save_telemetry: bool = False,
+    length_history_path: str = None,
 ):
+    """Judges answers with direct assessment.
+
+    Each output row has a judge_key identifying its (prompt, answer, reference) and the judge
+    config. If previous_judgements_path is given (the output of an earlier run), only rows whose
+    key is not there are sent to the judge, and the other judgements are reused.
+    With save_telemetry, the metrics of each request (e.g., telemetry_latency) are added as
+    columns (empty for reused judgements). With length_history_path, max_tokens is set from the
+    judgement lengths of past runs of the same task and judge (see adaptive_batch_generate).
+    """
+    # the stop sequence is set below, so the default must not be mutated across calls
+    model_args = copy.deepcopy(model_args)
     # load answers and task
-    answers = pd.read_json(answers_path, lines=True)
+    answers = read_artifact(answers_path, shard=shard)
     task_obj = available_tasks[task]
     if use_ref:
         judge_prompt = task_obj.ref_da_judge_prompt["user_prompt"]
     else:
         judge_prompt = task_obj.da_judge_prompt["user_prompt"]
     system_prompt = task_obj.da_judge_prompt["system_prompt"]
-    # load judge
-    model_args["proper_model_args"]["model"] = model_name
-    model_args["system_prompt"] = system_prompt
-    model = instantiate_model(model_type, model_args)
-    prompts = [
-        judge_prompt.substitute(prompt=prompt, answer=answer, reference=reference)
-        for prompt, answer, reference in zip(
-            answers["prompt"].tolist(),
-            answers["answer"].tolist(),
-            answers["reference"].tolist(),
+    judge_config = {
+        "task": task,
+        "model_name": model_name,
+        "sampling_params": model_args.get("sampling_params", {}),
+        "system_prompt": system_prompt,
+        "judge_prompt": judge_prompt.template,
+    }
+    judge_keys = row_keys(
+        judge_config,
+        answers["prompt"].tolist(),
+        answers["answer"].tolist(),
+        answers["reference"].tolist(),
+    )
+    # reuse judgements of unchanged rows
+    previous = {}
+    if previous_judgements_path is not None:
+        previous_judgements = read_artifact(
+            previous_judgements_path, columns=["judge_key", "judgement", "feedback"]
         )
-    ]
+        previous = {
+            key: (judgement, feedback)
+            for key, judgement, feedback in zip(
+                previous_judgements["judge_key"].tolist(),
+                previous_judgements["judgement"].tolist(),
+                previous_judgements["feedback"].tolist(),
+            )
+        }
+    to_judge = [i for i, key in enumerate(judge_keys) if key not in previous]
+    print(
+        f"Judging {len(to_judge)} rows, reusing {len(judge_keys) - len(to_judge)} judgements."
+    )
+    with span("render_prompts", n=len(to_judge)):
+        prompts = [
+            judge_prompt.substitute(
+                prompt=answers["prompt"].iloc[i],
+                answer=answers["answer"].iloc[i],
+                reference=answers["reference"].iloc[i],
+            )
+            for i in to_judge
+        ]
     # generate judgements
-    judgements = model.batch_generate(prompts)
+    new_judgements = {}
+    new_metrics = {}
+    if prompts:
+        # load judge
+        model_args["proper_model_args"]["model"] = model_name
+        model_args["system_prompt"] = system_prompt
+        model_args["sampling_params"]["stop"] = task_obj.stop_sequences.get("da")
+        model = instantiate_model(model_type, model_args)
+        if length_history_path is None:
+            judgements = model.batch_generate(prompts)
+        else:
+            judgements = adaptive_batch_generate(
+                model,
+                prompts,
+                LengthHistory(length_history_path),
+                f"{task}|da_eval|{model_name}",
+            )
+        with span("parse_outputs", n=len(judgements)):
+            new_judgements = {
+                judge_keys[i]: task_obj.parse_da_prompt_output(j)
+                for i, j in zip(to_judge, judgements)
+            }
+        new_metrics = {
+            judge_keys[i]: metrics for i, metrics in zip(to_judge, model.last_metrics)
+        }
+        model.log_run_summary()
+        model.close()
     parsed_results, parsed_feedbacks = zip(
-        *[task_obj.parse_da_prompt_output(j) for j in judgements]
+        *[new_judgements.get(key) or previous[key] for key in judge_keys]
     )
     final_data = answers.to_dict(orient="list")
     final_data["judgement"] = list(parsed_results)
     final_data["feedback"] = list(parsed_feedbacks)
+    final_data["judge_key"] = judge_keys
+    if save_telemetry:
+        final_data.update(
+            metrics_columns(
+                [new_metrics.get(key, RequestMetrics()) for key in judge_keys]
+            )
+        )
 
     # save
-    pd.DataFrame.from_dict(final_data).to_json(
-        output_path, lines=True, orient="records", force_ascii=False
-    )
+    write_artifact(pd.DataFrame.from_dict(final_data), output_path, shard=shard)
 
     return final_data
 
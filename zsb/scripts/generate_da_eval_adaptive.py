@@ -0,0 +1,172 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from jsonargparse import CLI
+
+from zsb.artifacts import read_artifact, write_artifact
+from zsb.models import instantiate_model
+from zsb.stats import bootstrap_mean_ci, clt_mean_ci, ranking_confidence
+from zsb.tasks import available_tasks
+
+
+def main(
+    task: str,
+    model_name: str,
+    model_type: str,
+    answers_paths: list[str],
+    output_path: str,
+    summary_output_path: str,
+    model_names: list[str] = None,
+    target_ci_width: float = 0.2,
+    target_rank_confidence: float = None,
+    ci_method: str = "clt",
+    confidence: float = 0.95,
+    batch_size: int = 50,
+    min_prompts: int = 100,
+    max_prompts: int = None,
+    n_bootstrap: int = 1000,
+    use_ref: bool = False,
+    random_seed: int = 42,
+    model_args: dict = {
+        "proper_model_args": {},
+        "sampling_params": {"temperature": 0, "max_tokens": 8192},
+    },
+):
+    """Judges the answers of one or more models on prompts in random order until the means converge.
+
+    Prompts are judged in batches of batch_size (the answers of all models to the same prompts,
+    so their scores stay paired), and judging stops once at least min_prompts were judged and
+    the confidence interval of every model's mean is at most target_ci_width wide (with
+    ci_method "clt" or "bootstrap") and, if target_rank_confidence is given, the ranking of the
+    models holds in at least that fraction of bootstrap resamples.
+
+    The judged rows are saved to output_path, and the achieved precision (means, intervals,
+    ranking confidence, number of judged prompts and why judging stopped) to
+    summary_output_path. Since judging stops as soon as the targets are met, the intervals are
+    slightly optimistic, which min_prompts limits.
+    """
+    assert ci_method in ["clt", "bootstrap"], "ci_method must be clt or bootstrap."
+    rng = np.random.default_rng(random_seed)
+    # load answers and task object
+    answers = [read_artifact(p) for p in answers_paths]
+    assert all(
+        a["prompt"].tolist() == answers[0]["prompt"].tolist() for a in answers
+    ), "All answer files must have the same prompts, in the same order."
+    if model_names is None:
+        model_names = [Path(p).stem for p in answers_paths]
+    assert len(model_names) == len(
+        answers_paths
+    ), "model_names must have one name per answers file."
+    assert len(set(model_names)) == len(
+        model_names
+    ), "Model names must be unique (pass model_names if answers files share a name)."
+    n_prompts = len(answers[0])
+    # judge prompts in random order
+    order = rng.permutation(n_prompts)
+    if max_prompts is not None:
+        order = order[:max_prompts]
+    assert len(order) > 0, "No prompts to judge (empty answers or max_prompts=0)."
+    task_obj = available_tasks[task]
+    if use_ref:
+        judge_prompt = task_obj.ref_da_judge_prompt["user_prompt"]
+    else:
+        judge_prompt = task_obj.da_judge_prompt["user_prompt"]
+    # load judge
+    model_args["proper_model_args"]["model"] = model_name
+    model_args["system_prompt"] = task_obj.da_judge_prompt["system_prompt"]
+    model_args["sampling_params"]["stop"] = task_obj.stop_sequences.get("da")
+    model = instantiate_model(model_type, model_args)
+    scores = np.zeros((0, len(answers)))
+    rows = []
+    stop_reason = "exhausted prompts"
+    for start in range(0, len(order), batch_size):
+        batch = order[start : start + batch_size]
+        batch_prompts = [
+            judge_prompt.substitute(
+                prompt=a["prompt"].iloc[p],
+                answer=a["answer"].iloc[p],
+                reference=a["reference"].iloc[p],
+            )
+            for a in answers
+            for p in batch
+        ]
+        judgements = model.batch_generate(batch_prompts)
+        parsed = [task_obj.parse_da_prompt_output(j) for j in judgements]
+        scores = np.concatenate(
+            [scores, np.array([s for s, _ in parsed]).reshape(len(answers), -1).T]
+        )
+        for k, (a, name) in enumerate(zip(answers, model_names)):
+            for i, p in enumerate(batch):
+                judgement, feedback = parsed[k * len(batch) + i]
+                rows.append(
+                    {
+                        **a.iloc[p].to_dict(),
+                        "model": name,
+                        "prompt_index": int(p),
+                        "judge_order": start + i,
+                        "judgement": judgement,
+                        "feedback": feedback,
+                    }
+                )
+        # check convergence
+        if ci_method == "clt":
+            intervals = clt_mean_ci(scores, confidence)
+        else:
+            intervals = bootstrap_mean_ci(scores, confidence, n_bootstrap, rng)
+        ci_width = float((intervals[:, 1] - intervals[:, 0]).max())
+        rank_confidence = None
+        if len(answers) > 1:
+            rank_confidence = ranking_confidence(scores, n_bootstrap, rng)
+        print(
+            f"{len(scores)} prompts judged, widest CI {ci_width:.3f}"
+            + (
+                f", ranking confidence {rank_confidence:.3f}."
+                if rank_confidence is not None
+                else "."
+            )
+        )
+        converged = ci_width <= target_ci_width and (
+            target_rank_confidence is None
+            or rank_confidence is None
+            or rank_confidence >= target_rank_confidence
+        )
+        if len(scores) >= min_prompts and converged:
+            stop_reason = "converged"
+            print(f"Converged after {len(scores)} of {n_prompts} prompts.")
+            break
+    model.log_run_summary()
+
+    # save judgements
+    write_artifact(pd.DataFrame(rows), output_path)
+    # save summary
+    means = scores.mean(axis=0)
+    summary = {
+        "models": [
+            {
+                "model": model_names[k],
+                "mean": float(means[k]),
+                "ci_lower": float(intervals[k, 0]),
+                "ci_upper": float(intervals[k, 1]),
+            }
+            for k in np.argsort(-means)
+        ],
+        "ci_method": ci_method,
+        "confidence": confidence,
+        "ci_width": ci_width,
+        "target_ci_width": target_ci_width,
+        "rank_confidence": rank_confidence,
+        "target_rank_confidence": target_rank_confidence,
+        "n_judged_prompts": len(scores),
+        "n_prompts": n_prompts,
+        "stop_reason": stop_reason,
+    }
+    with open(summary_output_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=4, ensure_ascii=False)
+
+    return summary
+
+
+if __name__ == "__main__":
+    CLI([main], as_positional=False)
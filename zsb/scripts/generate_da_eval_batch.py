@@ -0,0 +1,97 @@
+import pandas as pd
+from jsonargparse import CLI
+
+from zsb.artifacts import read_artifact, write_artifact
+from zsb.models import instantiate_model
+from zsb.tasks import available_tasks
+from zsb.utils import iter_jsonl
+
+
+def main(
+    manifest_path: str,
+    model_name: str,
+    model_type: str,
+    model_args: dict = {
+        "proper_model_args": {},
+        "sampling_params": {"temperature": 0, "max_tokens": 8192},
+    },
+):
+    """Judges several (task, answers) pairs with a single judge instance.
+
+    The manifest is a jsonl file where each line has the keys "task", "answers_path",
+    "output_path" and, optionally, "use_ref". All judge prompts are submitted together,
+    and each judgement is parsed with its own task's parser and saved to its own output file.
+    """
+    # load manifest, answers and tasks
+    manifest = list(iter_jsonl(manifest_path))
+    entries = []
+    for entry in manifest:
+        task_obj = available_tasks[entry["task"]]
+        answers = read_artifact(entry["answers_path"])
+        if entry.get("use_ref", False):
+            judge_prompt = task_obj.ref_da_judge_prompt["user_prompt"]
+        else:
+            judge_prompt = task_obj.da_judge_prompt["user_prompt"]
+        if answers.empty:
+            # jsonl files without rows have no columns either
+            print(f"No answers in {entry['answers_path']}, writing an empty output.")
+            prompts = []
+        else:
+            prompts = [
+                judge_prompt.substitute(
+                    prompt=prompt, answer=answer, reference=reference
+                )
+                for prompt, answer, reference in zip(
+                    answers["prompt"].tolist(),
+                    answers["answer"].tolist(),
+                    answers["reference"].tolist(),
+                )
+            ]
+        entries.append(
+            {
+                "task_obj": task_obj,
+                "answers": answers,
+                "prompts": prompts,
+                "system_prompt": task_obj.da_judge_prompt["system_prompt"],
+                "output_path": entry["output_path"],
+            }
+        )
+    # load judge once
+    model_args["proper_model_args"]["model"] = model_name
+    model_args["system_prompt"] = None
+    # the judge is shared, so it stops at the stop sequences of any of the tasks
+    model_args["sampling_params"]["stop"] = list(
+        dict.fromkeys(
+            s for e in entries for s in e["task_obj"].stop_sequences.get("da", [])
+        )
+    )
+    model = instantiate_model(model_type, model_args)
+    # generate judgements, one batch per distinct system prompt
+    system_prompts = list(dict.fromkeys(e["system_prompt"] for e in entries))
+    for system_prompt in system_prompts:
+        group = [e for e in entries if e["system_prompt"] == system_prompt]
+        group_prompts = [p for e in group for p in e["prompts"]]
+        judgements = []
+        if group_prompts:
+            model.system_prompt = system_prompt
+            judgements = model.batch_generate(group_prompts)
+        offset = 0
+        for e in group:
+            e["judgements"] = judgements[offset : offset + len(e["prompts"])]
+            offset += len(e["prompts"])
+    model.log_run_summary()
+    # parse and save each entry with its own task
+    all_final_data = []
+    for e in entries:
+        parsed = [e["task_obj"].parse_da_prompt_output(j) for j in e["judgements"]]
+        final_data = e["answers"].to_dict(orient="list")
+        final_data["judgement"] = [result for result, _ in parsed]
+        final_data["feedback"] = [feedback for _, feedback in parsed]
+        write_artifact(pd.DataFrame.from_dict(final_data), e["output_path"])
+        all_final_data.append(final_data)
+
+    return all_final_data
+
+
+if __name__ == "__main__":
+    CLI([main], as_positional=False)
@@ -0,0 +1,130 @@
+import json
+
+import numpy as np
+import pandas as pd
+from jsonargparse import CLI
+
+from zsb.artifacts import read_artifact, write_artifact
+from zsb.cascade import cascade_stats, escalate_da, load_judge, sample_calibration
+from zsb.ensemble import majority_vote
+from zsb.tasks import available_tasks
+
+
+def main(
+    task: str,
+    cheap_judge: dict,
+    strong_judge: dict,
+    answers_path: str,
+    output_path: str,
+    use_ref: bool = False,
+    n_cheap_samples: int = 2,
+    cheap_temperature: float = 0.7,
+    max_disagreement: float = 0,
+    borderline_scores: list[float] = [],
+    calibration_size: int = 0,
+    random_seed: int = 42,
+    stats_output_path: str = None,
+):
+    """Judges answers with direct assessment by a cascade of a cheap and a strong judge.
+
+    The cheap judge (e.g., a small vllm model) scores every answer n_cheap_samples times, and
+    only the answers it is not confident about are sent to the strong judge: those with unparsed
+    samples, samples that differ by more than max_disagreement, or a median score in
+    borderline_scores. With several samples, the cheap judge samples with cheap_temperature
+    (instead of the temperature of its model_args) so that they can differ.
+    Judges are dictionaries with model_name, model_type and optionally model_args.
+
+    calibration_size confident answers are also sent to the strong judge, to measure how well
+    the cascade matches judging everything with the strong judge (see cascade_stats).
+
+    Output rows have the final judgement and feedback, whether the answer was escalated, the
+    cheap judge's judgements and, for escalated and calibration answers, the strong judgement.
+    """
+    # load answers and task
+    answers = read_artifact(answers_path)
+    task_obj = available_tasks[task]
+    if use_ref:
+        judge_prompt = task_obj.ref_da_judge_prompt["user_prompt"]
+    else:
+        judge_prompt = task_obj.da_judge_prompt["user_prompt"]
+    system_prompt = task_obj.da_judge_prompt["system_prompt"]
+    stop = task_obj.stop_sequences.get("da")
+    prompts = [
+        judge_prompt.substitute(prompt=prompt, answer=answer, reference=reference)
+        for prompt, answer, reference in zip(
+            answers["prompt"].tolist(),
+            answers["answer"].tolist(),
+            answers["reference"].tolist(),
+        )
+    ]
+    # judge everything with the cheap judge, with the samples of each prompt next to each
+    # other so that vllm reuses their cached prefix
+    model = load_judge(
+        cheap_judge,
+        system_prompt,
+        stop,
+        temperature=cheap_temperature if n_cheap_samples > 1 else None,
+    )
+    judgements = model.batch_generate(
+        [prompt for prompt in prompts for _ in range(n_cheap_samples)]
+    )
+    model.log_run_summary()
+    # free the GPUs for the strong judge
+    model.close()
+    parsed = [task_obj.parse_da_prompt_output(j) for j in judgements]
+    cheap_scores = np.array(
+        [np.nan if feedback is None else score for score, feedback in parsed]
+    ).reshape(len(prompts), n_cheap_samples)
+    # the cheap judgement is the majority of its samples (items with unparsed samples are
+    # always escalated), and its feedback is that of the first sample with the majority score
+    cheap_judgements = majority_vote(cheap_scores)
+    majority_samples = np.argmax(cheap_scores == cheap_judgements[:, None], axis=1)
+    cheap_feedbacks = np.array(
+        [feedback for _, feedback in parsed], dtype=object
+    ).reshape(len(prompts), n_cheap_samples)[np.arange(len(prompts)), majority_samples]
+    # escalate the uncertain judgements
+    escalated = escalate_da(cheap_scores, max_disagreement, borderline_scores)
+    calibration = sample_calibration(escalated, calibration_size, random_seed)
+    to_strong = np.flatnonzero(escalated | calibration)
+    print(
+        f"Escalating {escalated.sum()} of {len(prompts)} answers, "
+        f"plus {calibration.sum()} for calibration."
+    )
+    strong_scores = np.full(len(prompts), np.nan)
+    strong_feedbacks = [None] * len(prompts)
+    if len(to_strong):
+        model = load_judge(strong_judge, system_prompt, stop)
+        judgements = model.batch_generate([prompts[i] for i in to_strong])
+        model.log_run_summary()
+        for i, judgement in zip(to_strong, judgements):
+            strong_scores[i], strong_feedbacks[i] = task_obj.parse_da_prompt_output(
+                judgement
+            )
+    final_judgements = np.where(escalated, strong_scores, cheap_judgements)
+    stats = cascade_stats(cheap_judgements, strong_scores, escalated, calibration)
+    print(json.dumps(stats, indent=4))
+    if stats_output_path is not None:
+        with open(stats_output_path, "w", encoding="utf-8") as f:
+            json.dump(stats, f, indent=4)
+    final_data = answers.to_dict(orient="list")
+    final_data["judgement"] = final_judgements.astype(int).tolist()
+    final_data["feedback"] = [
+        strong_feedbacks[i] if escalated[i] else cheap_feedbacks[i]
+        for i in range(len(prompts))
+    ]
+    final_data["escalated"] = escalated.tolist()
+    final_data["cheap_judgements"] = [
+        [None if np.isnan(s) else int(s) for s in row] for row in cheap_scores
+    ]
+    final_data["strong_judgement"] = [
+        None if np.isnan(s) else int(s) for s in strong_scores
+    ]
+
+    # save
+    write_artifact(pd.DataFrame.from_dict(final_data), output_path)
+
+    return final_data
+
+
+if __name__ == "__main__":
+    CLI([main], as_positional=False)
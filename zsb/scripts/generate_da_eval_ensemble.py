@@ -0,0 +1,122 @@
+import copy
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from jsonargparse import CLI
+
+from zsb.artifacts import read_artifact, write_artifact
+from zsb.ensemble import aggregate_judgements, judge_agreement
+from zsb.models import DEFAULT_MODEL_ARGS
+from zsb.scripts.generate_da_eval import main as generate_da_eval
+
+
+def judge_name(judge: dict) -> str:
+    return judge.get("name", judge["model_name"].replace("/", "_"))
+
+
+def run_judge(
+    judge: dict,
+    task: str,
+    answers_path: str,
+    cache_dir: Path,
+    use_ref: bool,
+    save_telemetry: bool,
+) -> dict:
+    """Runs generate_da_eval.py for one judge, reusing its cached judgements of unchanged rows."""
+    cache_path = cache_dir / f"{judge_name(judge)}.jsonl"
+    return generate_da_eval(
+        task=task,
+        model_name=judge["model_name"],
+        model_type=judge["model_type"],
+        answers_path=answers_path,
+        output_path=str(cache_path),
+        model_args=copy.deepcopy(judge.get("model_args", DEFAULT_MODEL_ARGS)),
+        use_ref=use_ref,
+        previous_judgements_path=str(cache_path) if cache_path.exists() else None,
+        save_telemetry=save_telemetry,
+    )
+
+
+def main(
+    task: str,
+    judges: list[dict],
+    answers_path: str,
+    output_path: str,
+    cache_dir: str = None,
+    aggregation: str = "mean",
+    use_ref: bool = False,
+    max_workers: int = 4,
+    save_telemetry: bool = False,
+):
+    """Judges answers with direct assessment by an ensemble of judges.
+
+    Each judge is a dictionary with model_name, model_type, and optionally model_args and name
+    (defaults to the model name). Judges that call APIs run concurrently, while vllm judges run
+    one after the other in this process. The judgements of each judge are cached as
+    <cache_dir>/<name>.jsonl (cache_dir defaults to "<output_path>.judges"), and only rows that
+    are not in a judge's cache (see generate_da_eval.py) are sent to it, so adding a judge or
+    changing some answers only runs the missing judgements.
+
+    Output rows have judgement_<name> and feedback_<name> columns with each judge's judgement,
+    the aggregated scores and per-row agreement (ensemble_* columns, see aggregate_judgements),
+    and a judgement column with the aggregation (mean, median or majority) of the judges.
+    Judgements that could not be parsed are left out of the aggregates.
+    """
+    assert aggregation in ["mean", "median", "majority"], "Unknown aggregation."
+    names = [judge_name(judge) for judge in judges]
+    assert len(set(names)) == len(names), "Judge names must be unique."
+    cache_dir = Path(cache_dir or f"{output_path}.judges")
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    # run judges
+    judge_args = (task, answers_path, cache_dir, use_ref, save_telemetry)
+    results = {}
+    api_judges = [judge for judge in judges if judge["model_type"] != "vllm"]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            judge_name(judge): executor.submit(run_judge, judge, *judge_args)
+            for judge in api_judges
+        }
+        for judge in judges:
+            if judge["model_type"] == "vllm":
+                # generate_da_eval.py closes the judge, freeing the GPUs for the next one
+                results[judge_name(judge)] = run_judge(judge, *judge_args)
+        for name, future in futures.items():
+            results[name] = future.result()
+    # aggregate
+    final_data = read_artifact(answers_path).to_dict(orient="list")
+    scores = np.full((len(final_data["prompt"]), len(names)), np.nan)
+    for j, name in enumerate(names):
+        final_data[f"judgement_{name}"] = results[name]["judgement"]
+        final_data[f"feedback_{name}"] = results[name]["feedback"]
+        # unparsed judgements have no feedback
+        parsed = np.array([f is not None for f in results[name]["feedback"]])
+        scores[parsed, j] = np.array(results[name]["judgement"], dtype=float)[parsed]
+    ensemble = aggregate_judgements(scores)
+    final_data.update(ensemble)
+    final_data["judgement"] = ensemble[f"ensemble_{aggregation}"]
+    # report
+    judge_summary = pd.DataFrame(
+        {
+            "judge": names,
+            "mean": np.nanmean(scores, axis=0),
+            "unparsed": np.isnan(scores).mean(axis=0),
+        }
+    )
+    print(judge_summary.to_string(index=False))
+    if len(names) > 1:
+        print(judge_agreement(scores, names).to_string(index=False))
+    print(
+        f"Ensemble {aggregation}: {np.nanmean(final_data['judgement']):.3f}, "
+        f"mean agreement with the majority: {np.nanmean(ensemble['ensemble_agreement']):.3f}."
+    )
+
+    # save
+    write_artifact(pd.DataFrame.from_dict(final_data), output_path)
+
+    return final_data
+
+
+if __name__ == "__main__":
+    CLI([main], as_positional=False)
@@ -1,10 +1,14 @@
-import random
+import json
 
+import numpy as np
 import pandas as pd
 from jsonargparse import CLI
 
+from zsb.artifacts import read_artifact, write_artifact
 from zsb.models import instantiate_model
+from zsb.pairwise import build_pairwise_prompts, reconcile_orders, sample_a_places
 from zsb.tasks import available_tasks
+from zsb.telemetry import metrics_columns
 
 
 def main(
@@ -15,61 +19,85 @@ def main(
     answers_path_B: str,
     output_path: str,
     random_seed: int = 42,
+    both_orders: bool = False,
+    stats_output_path: str = None,
     model_args: dict = {
         "proper_model_args": {},
         "sampling_params": {"temperature": 0, "max_tokens": 8192},
     },
+    save_telemetry: bool = False,
 ):
     # load answers and task object
-    answers_A = pd.read_json(answers_path_A, lines=True)
-    answers_B = pd.read_json(answers_path_B, lines=True)
+    answers_A = read_artifact(answers_path_A)
+    answers_B = read_artifact(answers_path_B, columns=["answer"])
     task_obj = available_tasks[task]
     judge_prompt = task_obj.relative_judge_prompt["user_prompt"]
     system_prompt = task_obj.relative_judge_prompt["system_prompt"]
     # load model
     model_args["proper_model_args"]["model"] = model_name
     model_args["system_prompt"] = system_prompt
+    model_args["sampling_params"]["stop"] = task_obj.stop_sequences.get("relative")
+    if both_orders and model_type == "vllm":
+        model_args["proper_model_args"].setdefault("enable_prefix_caching", True)
     model = instantiate_model(model_type, model_args)
     # shuffle orders of A and B for each query (models may be biased to prefer one of them)
-    prompts = []
-    a_places = []
-    for (i, q_a), (j, q_b) in zip(answers_A.iterrows(), answers_B.iterrows()):
-        random.seed(random_seed * i)
-        order = [0, 1]
-        random.shuffle(order)
-        meta_user_prompt = q_a["prompt"]
-        a_answer = q_a["answer"]
-        b_answer = q_b["answer"]
-        answers = [a_answer, b_answer]
-        formatted_prompt = judge_prompt.substitute(
-            prompt=meta_user_prompt,
-            answer_A=answers[order[0]],
-            answer_B=answers[order[1]],
-        )
-        prompts.append(formatted_prompt)
-        a_places.append(order[0])
+    prompts = answers_A["prompt"].to_numpy()
+    a_answers = answers_A["answer"].to_numpy()
+    b_answers = answers_B["answer"].to_numpy()
+    a_places = sample_a_places(len(answers_A), random_seed)
+    # with both orders, each item is followed by its swapped orientation in the same batch,
+    # so that both share the cached prompt prefix
+    n_orders = 2 if both_orders else 1
+    all_a_places = a_places
+    if both_orders:
+        all_a_places = np.stack([a_places, 1 - a_places], axis=1).ravel()
+    judge_prompts = build_pairwise_prompts(
+        judge_prompt,
+        np.repeat(prompts, n_orders),
+        np.repeat(a_answers, n_orders),
+        np.repeat(b_answers, n_orders),
+        all_a_places,
+    )
     # generate answers
-    judgements = model.batch_generate(prompts)
-    parsed_results = []
-    parsed_feedbacks = []
-    for i, (j, a_place) in enumerate(zip(judgements, a_places)):
-        # get result
-        result, feedback = task_obj.parse_relative_prompt_output(j, a_place)
-        parsed_results.append(result)
-        parsed_feedbacks.append(feedback)
+    judgements = model.batch_generate(judge_prompts)
+    model.log_run_summary()
+    parsed_results, parsed_feedbacks = zip(
+        *[
+            task_obj.parse_relative_prompt_output(j, a_place)
+            for j, a_place in zip(judgements, all_a_places)
+        ]
+    )
     # save data
     final_data = answers_A.to_dict(orient="list")
-    final_data["answer_A"] = answers_A["answer"].tolist()
-    final_data["answer_B"] = answers_B["answer"].tolist()
+    final_data["answer_A"] = a_answers.tolist()
+    final_data["answer_B"] = b_answers.tolist()
     final_data.pop("answer")
-    final_data["judgement"] = parsed_results
-    final_data["feedback"] = parsed_feedbacks
-    final_data["real_a_place"] = a_places
+    final_data["judgement"] = list(parsed_results[::n_orders])
+    final_data["feedback"] = list(parsed_feedbacks[::n_orders])
+    final_data["real_a_place"] = a_places.tolist()
+    if save_telemetry:
+        final_data.update(metrics_columns(model.last_metrics[::n_orders]))
+    if both_orders:
+        final_data["judgement_swapped"] = list(parsed_results[1::2])
+        final_data["feedback_swapped"] = list(parsed_feedbacks[1::2])
+        if save_telemetry:
+            for column, values in metrics_columns(model.last_metrics[1::2]).items():
+                final_data[f"{column}_swapped"] = values
+        verdicts, stats = reconcile_orders(
+            final_data["judgement"], final_data["judgement_swapped"], a_places
+        )
+        final_data["verdict"] = verdicts.tolist()
+        print(
+            f"Order consistency: {stats['order_consistency']:.3f}, "
+            f"first position win rate: {stats['first_position_win_rate']:.3f}, "
+            f"A wins/ties/B wins: {stats['win_rate_A']:.3f}/{stats['tie_rate']:.3f}/{stats['win_rate_B']:.3f}."
+        )
+        if stats_output_path is not None:
+            with open(stats_output_path, "w", encoding="utf-8") as f:
+                json.dump(stats, f, indent=4)
 
     # save
-    pd.DataFrame.from_dict(final_data).to_json(
-        output_path, lines=True, orient="records", force_ascii=False
-    )
+    write_artifact(pd.DataFrame.from_dict(final_data), output_path)
 
     return final_data
 
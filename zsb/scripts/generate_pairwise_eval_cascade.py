@@ -0,0 +1,131 @@
+import json
+
+import numpy as np
+import pandas as pd
+from jsonargparse import CLI
+
+from zsb.artifacts import read_artifact, write_artifact
+from zsb.cascade import (
+    cascade_stats,
+    escalate_pairwise,
+    load_judge,
+    sample_calibration,
+)
+from zsb.pairwise import build_pairwise_prompts, sample_a_places
+from zsb.tasks import available_tasks
+
+
+def main(
+    task: str,
+    cheap_judge: dict,
+    strong_judge: dict,
+    answers_path_A: str,
+    answers_path_B: str,
+    output_path: str,
+    n_cheap_samples: int = 2,
+    calibration_size: int = 0,
+    random_seed: int = 42,
+    stats_output_path: str = None,
+):
+    """Compares two sets of answers with a cascade of a cheap and a strong relative judge.
+
+    The cheap judge (e.g., a small vllm model) compares every pair n_cheap_samples times,
+    alternating which answer is shown first, and only the pairs where its samples disagree
+    or could not be parsed are sent to the strong judge. Judges are dictionaries with
+    model_name, model_type and optionally model_args.
+
+    calibration_size confident pairs are also sent to the strong judge, to measure how well
+    the cascade matches judging everything with the strong judge (see cascade_stats).
+    """
+    # load answers and task object
+    answers_A = read_artifact(answers_path_A)
+    answers_B = read_artifact(answers_path_B, columns=["answer"])
+    task_obj = available_tasks[task]
+    judge_prompt = task_obj.relative_judge_prompt["user_prompt"]
+    system_prompt = task_obj.relative_judge_prompt["system_prompt"]
+    stop = task_obj.stop_sequences.get("relative")
+    prompts = answers_A["prompt"].to_numpy()
+    a_answers = answers_A["answer"].to_numpy()
+    b_answers = answers_B["answer"].to_numpy()
+    a_places = sample_a_places(len(answers_A), random_seed)
+    # cheap samples alternate the order of the answers, next to each other in the batch
+    cheap_a_places = (a_places[:, None] + np.arange(n_cheap_samples)) % 2
+    cheap_prompts = build_pairwise_prompts(
+        judge_prompt,
+        np.repeat(prompts, n_cheap_samples),
+        np.repeat(a_answers, n_cheap_samples),
+        np.repeat(b_answers, n_cheap_samples),
+        cheap_a_places.ravel(),
+    )
+    model = load_judge(cheap_judge, system_prompt, stop)
+    judgements = model.batch_generate(cheap_prompts)
+    model.log_run_summary()
+    # free the GPUs for the strong judge
+    model.close()
+    parsed = [
+        task_obj.parse_relative_prompt_output(j, a_place)
+        for j, a_place in zip(judgements, cheap_a_places.ravel())
+    ]
+    # unparsed judgements have no feedback
+    cheap_judgements = np.array(
+        [None if feedback is None else result for result, feedback in parsed],
+        dtype=object,
+    ).reshape(len(prompts), n_cheap_samples)
+    cheap_feedbacks = [feedback for _, feedback in parsed[::n_cheap_samples]]
+    # escalate the uncertain judgements
+    escalated = escalate_pairwise(cheap_judgements)
+    calibration = sample_calibration(escalated, calibration_size, random_seed)
+    to_strong = np.flatnonzero(escalated | calibration)
+    print(
+        f"Escalating {escalated.sum()} of {len(prompts)} pairs, "
+        f"plus {calibration.sum()} for calibration."
+    )
+    strong_judgements = np.full(len(prompts), None, dtype=object)
+    strong_feedbacks = [None] * len(prompts)
+    if len(to_strong):
+        model = load_judge(strong_judge, system_prompt, stop)
+        judgements = model.batch_generate(
+            build_pairwise_prompts(
+                judge_prompt,
+                prompts[to_strong],
+                a_answers[to_strong],
+                b_answers[to_strong],
+                a_places[to_strong],
+            )
+        )
+        model.log_run_summary()
+        for i, judgement in zip(to_strong, judgements):
+            strong_judgements[i], strong_feedbacks[i] = (
+                task_obj.parse_relative_prompt_output(judgement, a_places[i])
+            )
+    final_judgements = np.where(escalated, strong_judgements, cheap_judgements[:, 0])
+    stats = cascade_stats(
+        cheap_judgements[:, 0], strong_judgements, escalated, calibration
+    )
+    print(json.dumps(stats, indent=4))
+    if stats_output_path is not None:
+        with open(stats_output_path, "w", encoding="utf-8") as f:
+            json.dump(stats, f, indent=4)
+    # save data
+    final_data = answers_A.to_dict(orient="list")
+    final_data["answer_A"] = a_answers.tolist()
+    final_data["answer_B"] = b_answers.tolist()
+    final_data.pop("answer")
+    final_data["judgement"] = final_judgements.tolist()
+    final_data["feedback"] = [
+        strong_feedbacks[i] if escalated[i] else cheap_feedbacks[i]
+        for i in range(len(prompts))
+    ]
+    final_data["real_a_place"] = a_places.tolist()
+    final_data["escalated"] = escalated.tolist()
+    final_data["cheap_judgements"] = cheap_judgements.tolist()
+    final_data["strong_judgement"] = strong_judgements.tolist()
+
+    # save
+    write_artifact(pd.DataFrame.from_dict(final_data), output_path)
+
+    return final_data
+
+
+if __name__ == "__main__":
+    CLI([main], as_positional=False)
@@ -0,0 +1,218 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from jsonargparse import CLI
+
+from zsb.artifacts import read_artifact, write_artifact
+from zsb.models import instantiate_model
+from zsb.pairwise import (
+    bootstrap_bradley_terry,
+    build_pairwise_prompts,
+    sample_a_places,
+    swiss_pairs,
+    to_elo,
+    uncertainty_pairs,
+)
+from zsb.tasks import available_tasks
+
+
+def main(
+    task: str,
+    model_name: str,
+    model_type: str,
+    answers_paths: list[str],
+    output_path: str,
+    ranking_output_path: str,
+    model_names: list[str] = None,
+    pairing: str = "swiss",
+    pairs_per_round: int = None,
+    prompts_per_pair: int = 20,
+    max_rounds: int = 50,
+    max_comparisons: int = None,
+    min_rounds: int = 3,
+    patience: int = 3,
+    min_rank_stability: float = 0.9,
+    n_bootstrap: int = 200,
+    confidence: float = 0.95,
+    random_seed: int = 42,
+    model_args: dict = {
+        "proper_model_args": {},
+        "sampling_params": {"temperature": 0, "max_tokens": 8192},
+    },
+):
+    """Ranks several models with adaptively scheduled pairwise comparisons.
+
+    Each round, pairs of models are chosen either by Swiss pairing (neighbours in the current
+    ranking) or by Bradley-Terry uncertainty sampling, and are compared on prompts they have
+    not been compared on yet. All comparisons of a round are judged in one batch. A Bradley-Terry
+    model is refit after each round, and the tournament stops once the ranking has not changed for
+    `patience` rounds and its bootstrap rank stability is at least `min_rank_stability`.
+    """
+    assert pairing in ["swiss", "uncertainty"], "pairing must be swiss or uncertainty."
+    rng = np.random.default_rng(random_seed)
+    # load answers and task object
+    answers = [read_artifact(p, columns=["prompt", "answer"]) for p in answers_paths]
+    assert all(
+        a["prompt"].tolist() == answers[0]["prompt"].tolist() for a in answers
+    ), "All answer files must have the same prompts, in the same order."
+    if model_names is None:
+        model_names = [Path(p).stem for p in answers_paths]
+    assert len(model_names) == len(
+        answers_paths
+    ), "model_names must have one name per answers file."
+    assert len(set(model_names)) == len(
+        model_names
+    ), "Model names must be unique (pass model_names if answer files share a name)."
+    n_models = len(answers)
+    n_prompts = len(answers[0])
+    prompts = answers[0]["prompt"].to_numpy()
+    model_answers = np.array([a["answer"].tolist() for a in answers], dtype=object)
+    task_obj = available_tasks[task]
+    judge_prompt = task_obj.relative_judge_prompt["user_prompt"]
+    system_prompt = task_obj.relative_judge_prompt["system_prompt"]
+    # load model
+    model_args["proper_model_args"]["model"] = model_name
+    model_args["system_prompt"] = system_prompt
+    model_args["sampling_params"]["stop"] = task_obj.stop_sequences.get("relative")
+    model = instantiate_model(model_type, model_args)
+    # keep track of which prompts each pair has yet to be compared on
+    remaining_prompts = {
+        (i, j): rng.permutation(n_prompts).tolist()
+        for i in range(n_models)
+        for j in range(i + 1, n_models)
+    }
+    n_comparisons = np.zeros((n_models, n_models))
+    if pairs_per_round is None:
+        pairs_per_round = max(n_models // 2, 1)
+    comparisons = []
+    scores = np.zeros(n_models)
+    fit = None
+    rankings = []
+    n_rounds = 0
+    for round_i in range(max_rounds):
+        # schedule the comparisons of this round, among the pairs with prompts left
+        available = {pair for pair, remaining in remaining_prompts.items() if remaining}
+        if pairing == "swiss":
+            pairs = swiss_pairs(scores, round_i, available)
+        else:
+            pairs = uncertainty_pairs(scores, n_comparisons, pairs_per_round, available)
+        round_items = []
+        for i, j in pairs:
+            i, j = min(i, j), max(i, j)
+            remaining = remaining_prompts[(i, j)]
+            for _ in range(min(prompts_per_pair, len(remaining))):
+                round_items.append((i, j, remaining.pop()))
+        if max_comparisons is not None:
+            round_items = round_items[: max_comparisons - len(comparisons)]
+        if not round_items:
+            print("No comparisons left to schedule.")
+            break
+        n_rounds += 1
+        # shuffle orders of A and B for each comparison (models may be biased to prefer one of them)
+        items = np.array(round_items)
+        model_i, model_j, prompt_i = items[:, 0], items[:, 1], items[:, 2]
+        a_places = sample_a_places(len(items), random_seed + round_i)
+        round_prompts = build_pairwise_prompts(
+            judge_prompt,
+            prompts[prompt_i],
+            model_answers[model_i, prompt_i],
+            model_answers[model_j, prompt_i],
+            a_places,
+        )
+        judgements = model.batch_generate(round_prompts)
+        for (i, j, p), a_place, j_output in zip(round_items, a_places, judgements):
+            result, feedback = task_obj.parse_relative_prompt_output(
+                j_output, int(a_place)
+            )
+            if feedback is not None:
+                n_comparisons[i, j] += 1
+                n_comparisons[j, i] += 1
+            comparisons.append(
+                {
+                    "round": round_i,
+                    "prompt_index": p,
+                    "prompt": prompts[p],
+                    "model_A": model_names[i],
+                    "model_B": model_names[j],
+                    "answer_A": model_answers[i, p],
+                    "answer_B": model_answers[j, p],
+                    "judgement": result,
+                    "feedback": feedback,
+                    "real_a_place": int(a_place),
+                }
+            )
+        # refit the ranking, leaving out unparsed judgements (whose verdicts are random)
+        parsed = [c for c in comparisons if c["feedback"] is not None]
+        if not parsed:
+            print(f"Round {round_i}: no parsed judgements to fit a ranking on yet.")
+            continue
+        name_to_index = {name: k for k, name in enumerate(model_names)}
+        model_A = np.array([name_to_index[c["model_A"]] for c in parsed])
+        model_B = np.array([name_to_index[c["model_B"]] for c in parsed])
+        a_wins = np.array([c["judgement"] == "A" for c in parsed])
+        fit = bootstrap_bradley_terry(
+            model_A, model_B, a_wins, n_models, n_bootstrap, confidence, rng
+        )
+        scores = fit["scores"]
+        rankings.append(np.argsort(-scores).tolist())
+        print(
+            f"Round {round_i}: {len(comparisons)} comparisons ({len(parsed)} parsed), "
+            f"ranking {[model_names[k] for k in rankings[-1]]}, "
+            f"rank stability {fit['rank_stability']:.3f}."
+        )
+        stable = len(rankings) >= patience and all(
+            r == rankings[-1] for r in rankings[-patience:]
+        )
+        if (
+            round_i + 1 >= min_rounds
+            and stable
+            and fit["rank_stability"] >= min_rank_stability
+        ):
+            print(f"Ranking converged after {round_i + 1} rounds.")
+            break
+        if max_comparisons is not None and len(comparisons) >= max_comparisons:
+            print("Reached the maximum number of comparisons.")
+            break
+    model.log_run_summary()
+
+    # save comparisons
+    write_artifact(pd.DataFrame(comparisons), output_path)
+    # save ranking
+    exhaustive_comparisons = n_models * (n_models - 1) // 2 * n_prompts
+    ranking = {
+        "ranking": (
+            [
+                {
+                    "model": model_names[k],
+                    "bt_score": float(fit["scores"][k]),
+                    "bt_lower": float(fit["lower"][k]),
+                    "bt_upper": float(fit["upper"][k]),
+                    "elo": float(to_elo(fit["scores"])[k]),
+                    "elo_lower": float(to_elo(fit["lower"])[k]),
+                    "elo_upper": float(to_elo(fit["upper"])[k]),
+                }
+                for k in np.argsort(-fit["scores"])
+            ]
+            if fit is not None
+            else []
+        ),
+        "rank_stability": fit["rank_stability"] if fit is not None else None,
+        "confidence": confidence,
+        "n_rounds": n_rounds,
+        "n_comparisons": len(comparisons),
+        "n_parsed_comparisons": sum(c["feedback"] is not None for c in comparisons),
+        "n_exhaustive_comparisons": exhaustive_comparisons,
+    }
+    print(
+        f"Used {len(comparisons)} judge calls out of {exhaustive_comparisons} for an exhaustive comparison."
+    )
+    with open(ranking_output_path, "w", encoding="utf-8") as f:
+        json.dump(ranking, f, indent=4, ensure_ascii=False)
+
+    return ranking
+
+
+if __name__ == "__main__":
+    CLI([main], as_positional=False)
@@ -1,46 +1,55 @@
 import random
+import time
 
 import pandas as pd
 import tqdm
 from jsonargparse import CLI
 
+from zsb.artifacts import write_artifact
+from zsb.catalog import CombinationSpace
 from zsb.models import Model, instantiate_model
 from zsb.tasks import available_tasks
 from zsb.tasks.base import Task
-from zsb.utils import get_all_possible_combinations
+from zsb.telemetry import RequestMetrics, metrics_columns
+from zsb.tracing import span
 
 
 def generate_user_prompts_batched(
     task_obj: Task,
-    combinations: list[dict[str, str]],
+    combinations: CombinationSpace,
     model: Model,
     n_prompts: int,
-) -> list[str]:
+) -> tuple[list[dict], list[RequestMetrics]]:
+    """Returns the parsed prompts and the metrics of the requests that generated them."""
     system_prompt = task_obj.meta_prompt["system_prompt"]
     model.system_prompt = system_prompt
     generating = True
     failed_combinations = 0
     outputs = []
+    metrics = []
     remaining_combinatinos = n_prompts - len(outputs)
     progress_bar = tqdm.tqdm(total=n_prompts, desc="Generating prompts...")
     while generating:
         start_i = failed_combinations + len(outputs)
         end_i = start_i + remaining_combinatinos
         batch_combinations = combinations[start_i:end_i]
-        batch_prompts = [
-            task_obj.meta_prompt["user_prompt"].substitute(**c)
-            for c in batch_combinations
-        ]
+        with span("render_prompts", n=len(batch_combinations)):
+            batch_prompts = [
+                task_obj.meta_prompt["user_prompt"].substitute(**c)
+                for c in batch_combinations
+            ]
         partial_outputs = model.batch_generate(batch_prompts)
-        for i, o in enumerate(partial_outputs):
-            parsed_output = task_obj.parse_meta_prompt_output(o)
-            if not parsed_output:
-                failed_combinations += 1
-                continue
-            else:
-                parsed_output["metadata"] = batch_combinations[i]
-                outputs.append(parsed_output)
-                progress_bar.update(1)
+        with span("parse_outputs", n=len(partial_outputs)):
+            for i, o in enumerate(partial_outputs):
+                parsed_output = task_obj.parse_meta_prompt_output(o)
+                if not parsed_output:
+                    failed_combinations += 1
+                    continue
+                else:
+                    parsed_output["metadata"] = batch_combinations[i]
+                    outputs.append(parsed_output)
+                    metrics.append(model.last_metrics[i])
+                    progress_bar.update(1)
         if len(outputs) == n_prompts:
             print(
                 f"Generated {n_prompts} prompts, having failed {failed_combinations} combinations."
@@ -53,16 +62,18 @@ def generate_user_prompts_batched(
                 f"Failed to parse output for {failed_combinations} combinations. Retrying {remaining_combinatinos} combinations."
             )
 
-    return outputs
+    return outputs, metrics
 
 
 def generate_user_prompts_unbatched(
     task_obj: Task,
-    combinations: list[dict[str, str]],
+    combinations: CombinationSpace,
     model: Model,
     n_prompts: int,
-) -> list[str]:
+) -> tuple[list[dict], list[RequestMetrics]]:
+    """Returns the parsed prompts and the metrics of the requests that generated them."""
     outputs = []
+    metrics = []
     generating = True
     # create a progress bar to update for later
     i = 0
@@ -73,7 +84,10 @@ def generate_user_prompts_unbatched(
         system_prompt = task_obj.meta_prompt["system_prompt"]
         model.system_prompt = system_prompt
         user_prompt = task_obj.meta_prompt["user_prompt"].substitute(**combination)
-        model_output = model.generate(user_prompt)
+        model_output, request_metrics = model.timed_generate(
+            user_prompt, None, time.time()
+        )
+        model.log_metrics([request_metrics], request_metrics.latency)
         parsed_output = task_obj.parse_meta_prompt_output(model_output)
         if not parsed_output:
             print(f"Failed to parse output for query. Retrying another combination.")
@@ -81,12 +95,13 @@ def generate_user_prompts_unbatched(
         else:
             parsed_output["metadata"] = combination
             outputs.append(parsed_output)
+            metrics.append(request_metrics)
             progress_bar.update(1)
             i += 1
         if len(outputs) == n_prompts:
             generating = False
             break
-    return outputs
+    return outputs, metrics
 
 
 def main(
@@ -96,33 +111,57 @@ def main(
     model_type: str,
     output_path: str,
     seed: int = 124,
+    encode_metadata: bool = False,
     model_args: dict = {
         "proper_model_args": {},
         "sampling_params": {"temperature": 0, "max_tokens": 8192},
     },
+    save_telemetry: bool = False,
 ):
+    """Generates n_prompts user prompts of a task from random combinations of its attributes.
+
+    With encode_metadata, the metadata of the prompts is saved as integer codes against the
+    task's attribute vocabularies (see write_artifact), which read_artifact decodes back.
+    With save_telemetry, the metrics of the request that generated each prompt (e.g.,
+    telemetry_latency) are added as columns.
+    """
     random.seed(seed)
-    # Instantiate task, generate all possible combinations of attributes, and shuffle.
+    # Instantiate task, compile the space of all combinations of attributes, and shuffle.
+    # Combinations are indexed lazily and only decoded when a prompt is rendered.
     print(f"Generating task combinations for {task}.")
     task_obj = available_tasks[task]
-    task_combinations = get_all_possible_combinations(task_obj.task_attributes)
+    with span("combinations"):
+        task_combinations = CombinationSpace(task_obj.task_attributes)
     print(f"Generated {len(task_combinations)} unique task attribute combinations.")
     # Instantiate model that will be used to generate user prompts.
     model_args["proper_model_args"]["model"] = model_name
+    model_args["sampling_params"]["stop"] = task_obj.stop_sequences.get("meta")
     model = instantiate_model(model_type, model_args)
     if model.model_type() == "vllm":
-        random.shuffle(task_combinations)
-        simulated_user_prompts = generate_user_prompts_batched(
+        task_combinations = task_combinations.shuffled(random)
+        simulated_user_prompts, metrics = generate_user_prompts_batched(
             task_obj, task_combinations, model, n_prompts
         )
     else:
-        shuffled_combinations = random.sample(task_combinations, len(task_combinations))
-        simulated_user_prompts = generate_user_prompts_unbatched(
+        # same order as random.sample over the list of all combinations
+        shuffled_combinations = CombinationSpace(
+            task_combinations.catalog,
+            random.sample(range(len(task_combinations)), len(task_combinations)),
+        )
+        simulated_user_prompts, metrics = generate_user_prompts_unbatched(
             task_obj, shuffled_combinations, model, n_prompts
         )
+    model.log_run_summary()
+    prompts = pd.DataFrame.from_dict(simulated_user_prompts)
+    if save_telemetry:
+        for column, values in metrics_columns(metrics).items():
+            prompts[column] = values
     # save prompts for later
-    pd.DataFrame.from_dict(simulated_user_prompts).to_json(
-        output_path, lines=True, orient="records", force_ascii=False
+    write_artifact(
+        prompts,
+        output_path,
+        encode_metadata=encode_metadata,
+        vocabularies=task_combinations.catalog.vocabularies,
     )
 
     return simulated_user_prompts
@@ -0,0 +1,79 @@
+import json
+from pathlib import Path
+
+from jsonargparse import CLI
+
+from zsb.report import build_report, report_html
+
+
+def main(
+    judgements_paths: list[str],
+    model_names: list[str] = None,
+    output_path: str = None,
+    attributes: list[str] = None,
+    max_values: int = 50,
+    drop_unparsed: bool = False,
+    confidence: float = 0.95,
+    n_bootstrap: int = 1000,
+    n_permutations: int = 10000,
+    random_seed: int = 42,
+):
+    """Reports the DA scores of several models, overall and per metadata attribute.
+
+    Prints the mean score of each model with bootstrap confidence intervals, paired significance
+    tests between models, and the mean score of each model for each value of the metadata
+    attributes (all attributes with at most max_values values, by default). The full report is
+    saved to output_path as HTML if it ends in .html, or as json otherwise.
+    """
+    if model_names is None:
+        model_names = [Path(p).stem for p in judgements_paths]
+    assert len(model_names) == len(
+        judgements_paths
+    ), "model_names must have one name per judgements file."
+    assert len(set(model_names)) == len(
+        model_names
+    ), "Model names must be unique (pass model_names if judgements files share a name)."
+    report = build_report(
+        dict(zip(model_names, judgements_paths)),
+        attributes,
+        max_values,
+        drop_unparsed,
+        confidence,
+        n_bootstrap,
+        n_permutations,
+        random_seed,
+    )
+    print(report["models"].to_string(index=False, float_format="%.3f"))
+    if not report["comparisons"].empty:
+        print(report["comparisons"].to_string(index=False, float_format="%.3f"))
+    if not report["attributes"].empty:
+        print(
+            report["attributes"]
+            .pivot_table(
+                index=["attribute", "value"], columns="model", values="mean", sort=False
+            )
+            .to_string(float_format="%.3f")
+        )
+
+    # save
+    if output_path is not None:
+        if Path(output_path).suffix == ".html":
+            with open(output_path, "w", encoding="utf-8") as f:
+                f.write(report_html(report))
+        else:
+            with open(output_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        name: json.loads(table.to_json(orient="records"))
+                        for name, table in report.items()
+                    },
+                    f,
+                    indent=4,
+                    ensure_ascii=False,
+                )
+
+    return report
+
+
+if __name__ == "__main__":
+    CLI([main], as_positional=False)
@@ -0,0 +1,27 @@
+from jsonargparse import CLI
+
+from zsb.artifacts import read_manifest, read_sharded_artifact, write_artifact
+
+
+def main(
+    shards_path: str,
+    output_path: str,
+    verify: bool = True,
+):
+    """Merges a sharded artifact directory (e.g., written by several generate_answers.py
+    or generate_da_eval.py workers with --shard i/N) into a single artifact."""
+    manifest = read_manifest(shards_path)
+    data = read_sharded_artifact(shards_path, verify=verify)
+    assert (
+        len(data) == manifest["n_rows"]
+    ), "Number of rows does not match the manifest."
+    write_artifact(data, output_path)
+    print(
+        f"Merged {manifest['n_shards']} shards ({len(data)} rows) into {output_path}."
+    )
+
+    return data
+
+
+if __name__ == "__main__":
+    CLI([main], as_positional=False)
@@ -0,0 +1,30 @@
+from jsonargparse import CLI
+
+from zsb.pipeline import build_stages
+from zsb.pipeline import dry_run as estimate_pipeline
+from zsb.pipeline import load_config, run_pipeline
+
+
+def main(
+    config_path: str,
+    dry_run: bool = False,
+    force: bool = False,
+    max_workers: int = 4,
+):
+    """Runs a benchmark end-to-end (prompts -> answers -> judgements -> report) from a config.
+
+    Stages whose fingerprint (params and input artifact hashes) matches that of their last run
+    are skipped, unless force is set. With dry_run, only lists the stages that would run with
+    rough cost and time estimates. See zsb.pipeline.build_stages for the config format.
+    """
+    config = load_config(config_path)
+    levels = build_stages(config)
+    if dry_run:
+        return estimate_pipeline(levels, config)
+    run_pipeline(
+        levels, max_workers=config.get("max_workers", max_workers), force=force
+    )
+
+
+if __name__ == "__main__":
+    CLI([main], as_positional=False)
@@ -0,0 +1,138 @@
+import os
+import socket
+import time
+
+import pandas as pd
+from jsonargparse import CLI
+
+from zsb.artifacts import read_artifact, write_artifact
+from zsb.models import instantiate_model
+from zsb.tasks import available_tasks
+from zsb.work_queue import LeaseHeartbeat, WorkQueue
+
+
+def init(
+    queue_path: str,
+    input_path: str,
+    stage: str,
+    chunk_size: int = 64,
+    task: str = None,
+    use_ref: bool = False,
+):
+    """Creates a work queue over the rows of input_path.
+
+    stage is either "answers" (input_path has prompts, as in generate_answers.py) or "da_eval"
+    (input_path has answers, as in generate_da_eval.py, and task must be given).
+    """
+    assert stage in ["answers", "da_eval"], "stage must be answers or da_eval."
+    assert stage == "answers" or task is not None, "task is required for da_eval."
+    n_items = len(read_artifact(input_path, columns=["prompt"]))
+    queue = WorkQueue(queue_path)
+    queue.init(
+        n_items,
+        chunk_size,
+        {"input_path": input_path, "stage": stage, "task": task, "use_ref": use_ref},
+    )
+    progress = queue.progress()
+    print(f"Work queue has {sum(progress.values())} chunks ({progress}).")
+
+
+def work(
+    queue_path: str,
+    model_name: str,
+    model_type: str,
+    worker_id: str = None,
+    lease_seconds: float = 600,
+    max_attempts: int = 3,
+    poll_seconds: float = 30,
+    model_args: dict = {
+        "proper_model_args": {},
+        "sampling_params": {"temperature": 0, "max_tokens": 8192},
+    },
+):
+    """Processes chunks of the work queue until there are none left.
+
+    Can be run by any number of workers on any node that sees queue_path.
+    """
+    queue = WorkQueue(queue_path)
+    config = queue.config()
+    if worker_id is None:
+        worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    # load data and model once
+    data = read_artifact(config["input_path"])
+    model_args["proper_model_args"]["model"] = model_name
+    if config["stage"] == "answers":
+        prompts = data["prompt"].tolist()
+    else:
+        task_obj = available_tasks[config["task"]]
+        if config["use_ref"]:
+            judge_prompt = task_obj.ref_da_judge_prompt["user_prompt"]
+        else:
+            judge_prompt = task_obj.da_judge_prompt["user_prompt"]
+        model_args["system_prompt"] = task_obj.da_judge_prompt["system_prompt"]
+        model_args["sampling_params"]["stop"] = task_obj.stop_sequences.get("da")
+        prompts = [
+            judge_prompt.substitute(prompt=prompt, answer=answer, reference=reference)
+            for prompt, answer, reference in zip(
+                data["prompt"].tolist(),
+                data["answer"].tolist(),
+                data["reference"].tolist(),
+            )
+        ]
+    model = instantiate_model(model_type, model_args)
+    while True:
+        chunk = queue.lease(worker_id, lease_seconds, max_attempts)
+        if chunk is None:
+            progress = queue.progress()
+            if progress["pending"] == 0 and progress["leased"] == 0:
+                print(f"No chunks left: {progress}.")
+                model.log_run_summary()
+                break
+            # other workers hold the remaining chunks, wait in case their leases expire
+            time.sleep(poll_seconds)
+            continue
+        print(f"Worker {worker_id} processing chunk {chunk['chunk_id']}.")
+        try:
+            with LeaseHeartbeat(queue, chunk["chunk_id"], worker_id, lease_seconds):
+                outputs = model.batch_generate(prompts[chunk["start"] : chunk["end"]])
+        except Exception:
+            queue.release(chunk["chunk_id"], worker_id)
+            raise
+        if config["stage"] == "answers":
+            results = [{"answer": o} for o in outputs]
+        else:
+            results = [
+                dict(zip(["judgement", "feedback"], task_obj.parse_da_prompt_output(o)))
+                for o in outputs
+            ]
+        queue.complete(chunk["chunk_id"], worker_id, results)
+
+
+def retry_failed(queue_path: str):
+    """Hands the chunks that ran out of attempts out again, for workers started afterwards."""
+    n_chunks = WorkQueue(queue_path).retry_failed()
+    print(f"Reset {n_chunks} failed chunks.")
+
+
+def collect(queue_path: str, output_path: str):
+    """Merges the results of a finished work queue with its input rows."""
+    queue = WorkQueue(queue_path)
+    progress = queue.progress()
+    assert progress["failed"] == 0, (
+        f"Work queue has failed chunks: {progress}. Run retry_failed and start workers again."
+    )
+    assert (
+        progress["pending"] == 0 and progress["leased"] == 0
+    ), f"Work queue is not finished: {progress}."
+    data = read_artifact(queue.config()["input_path"])
+    results = pd.DataFrame(queue.results())
+    assert len(results) == len(data), "Number of results does not match the input."
+    for column in results.columns:
+        data[column] = results[column].tolist()
+    write_artifact(data, output_path)
+
+    return data
+
+
+if __name__ == "__main__":
+    CLI([init, work, retry_failed, collect], as_positional=False)
@@ -1,7 +1,10 @@
 import pandas as pd
 from jsonargparse import CLI
 
+from zsb.artifacts import read_artifact, write_artifact
+from zsb.images import MetadataImages
 from zsb.models import instantiate_model
+from zsb.telemetry import metrics_columns
 
 
 def main(
@@ -9,24 +12,29 @@ def main(
     model_type: str,
     prompts_path: str,
     output_path: str,
+    image_store_path: str = None,
     model_args: dict = {
         "proper_model_args": {},
         "sampling_params": {"temperature": 0, "max_tokens": 8192},
     },
+    shard: str = None,
+    save_telemetry: bool = False,
 ):
     # load queries
-    queries = pd.read_json(prompts_path, lines=True)
-    imgs = queries["metadata"].apply(lambda x: x["image_str"])
+    queries = read_artifact(prompts_path, shard=shard)
+    imgs = MetadataImages(queries["metadata"], image_store_path)
     # load model
     model_args["proper_model_args"]["model"] = model_name
     model = instantiate_model(model_type, model_args)
     # generate answers
     answers = model.batch_generate(queries["prompt"].tolist(), imgs)
+    model.log_run_summary()
     queries["answer"] = answers
+    if save_telemetry:
+        for column, values in metrics_columns(model.last_metrics).items():
+            queries[column] = values
     # save prompts for later
-    pd.DataFrame.from_dict(queries).to_json(
-        output_path, lines=True, orient="records", force_ascii=False
-    )
+    write_artifact(pd.DataFrame.from_dict(queries), output_path, shard=shard)
 
     return queries
 
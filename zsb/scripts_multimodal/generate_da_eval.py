@@ -1,8 +1,11 @@
 import pandas as pd
 from jsonargparse import CLI
 
+from zsb.artifacts import read_artifact, write_artifact
+from zsb.images import MetadataImages
 from zsb.models import instantiate_model
 from zsb.tasks import available_tasks
+from zsb.telemetry import metrics_columns
 
 
 def main(
@@ -11,20 +14,24 @@ def main(
     model_type: str,
     answers_path: str,
     output_path: str,
+    image_store_path: str = None,
     model_args: dict = {
         "proper_model_args": {},
         "sampling_params": {"temperature": 0, "max_tokens": 8192},
     },
+    shard: str = None,
+    save_telemetry: bool = False,
 ):
     # load answers, images and task
-    answers = pd.read_json(answers_path, lines=True)
-    imgs = answers["metadata"].apply(lambda x: x["image_str"])
+    answers = read_artifact(answers_path, shard=shard)
+    imgs = MetadataImages(answers["metadata"], image_store_path)
     task_obj = available_tasks[task]
     judge_prompt = task_obj.da_judge_prompt["user_prompt"]
     system_prompt = task_obj.da_judge_prompt["system_prompt"]
     # load judge
     model_args["proper_model_args"]["model"] = model_name
     model_args["system_prompt"] = system_prompt
+    model_args["sampling_params"]["stop"] = task_obj.stop_sequences.get("da")
     model = instantiate_model(model_type, model_args)
     prompts = [
         judge_prompt.substitute(prompt=prompt, answer=answer)
@@ -34,17 +41,18 @@ def main(
     ]
     # generate judgements
     judgements = model.batch_generate(prompts, imgs)
+    model.log_run_summary()
     parsed_results, parsed_feedbacks = zip(
         *[task_obj.parse_da_prompt_output(j) for j in judgements]
     )
     final_data = answers.to_dict(orient="list")
     final_data["judgement"] = list(parsed_results)
     final_data["feedback"] = list(parsed_feedbacks)
+    if save_telemetry:
+        final_data.update(metrics_columns(model.last_metrics))
 
     # save
-    pd.DataFrame.from_dict(final_data).to_json(
-        output_path, lines=True, orient="records", force_ascii=False
-    )
+    write_artifact(pd.DataFrame.from_dict(final_data), output_path, shard=shard)
 
     return final_data
 
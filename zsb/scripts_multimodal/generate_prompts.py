@@ -1,20 +1,22 @@
 import random
+from pathlib import Path
 
 import pandas as pd
 import tqdm
 from datasets import load_dataset
 from jsonargparse import CLI
-from PIL.Image import Image
 
+from zsb.artifacts import read_artifact, write_artifact
+from zsb.images import DatasetImages, ImageStore
 from zsb.models import Model, instantiate_model
 from zsb.tasks import available_tasks
 from zsb.tasks.base import Task
-from zsb.utils import load_image
 
 
 def generate_user_prompts_batched(
     task_obj: Task,
-    images: list[Image],
+    image_ids: list[str],
+    image_store: ImageStore,
     model: Model,
     n_prompts: int,
 ) -> list[str]:
@@ -28,19 +30,24 @@ def generate_user_prompts_batched(
     while generating:
         start_i = failed_combinations + len(outputs)
         end_i = start_i + remaining_combinatinos
-        batch_image_strs = images[start_i:end_i]
+        batch_image_ids = image_ids[start_i:end_i]
         batch_insts = [
             task_obj.meta_prompt["user_prompt"].substitute()
-            for _ in range(len(batch_image_strs))
+            for _ in range(len(batch_image_ids))
         ]
-        partial_outputs = model.batch_generate(batch_insts, batch_image_strs)
+        partial_outputs = model.batch_generate(
+            batch_insts, image_store.data_urls(batch_image_ids)
+        )
         for i, o in enumerate(partial_outputs):
             parsed_output = task_obj.parse_meta_prompt_output(o)
             if not parsed_output:
                 failed_combinations += 1
                 continue
             else:
-                parsed_output["metadata"] = {"image_str": batch_image_strs[i]}
+                parsed_output["metadata"] = {
+                    "image_id": batch_image_ids[i],
+                    "image_store": str(image_store.root),
+                }
                 outputs.append(parsed_output)
                 progress_bar.update(1)
         if len(outputs) == n_prompts:
@@ -60,7 +67,8 @@ def generate_user_prompts_batched(
 
 def generate_user_prompts_unbatched(
     task_obj: Task,
-    image_strs: list[str],
+    image_ids: list[str],
+    image_store: ImageStore,
     model: Model,
     n_prompts: int,
 ) -> list[str]:
@@ -73,15 +81,18 @@ def generate_user_prompts_unbatched(
     progress_bar = tqdm.tqdm(total=n_prompts, desc="Generating prompts...")
     # CHANGE TO SAMPLE AT EACH STEP OF FOR LOOP TO REPEAT IF FAILS
     while generating:
-        image_str = image_strs[i]
+        image_id = image_ids[i]
         user_prompt = task_obj.meta_prompt["user_prompt"].substitute()
-        model_output = model.generate(user_prompt, image_str)
+        model_output = model.generate(user_prompt, image_store.data_url(image_id))
         parsed_output = task_obj.parse_meta_prompt_output(model_output)
         if not parsed_output:
             print(f"Failed to parse output for query. Retrying another combination.")
             continue
         else:
-            parsed_output["metadata"] = {"image_str": image_str}
+            parsed_output["metadata"] = {
+                "image_id": image_id,
+                "image_store": str(image_store.root),
+            }
             outputs.append(parsed_output)
             progress_bar.update(1)
             i += 1
@@ -98,6 +109,8 @@ def main(
     model_name: str,
     model_type: str,
     output_path: str,
+    image_store_path: str = None,
+    image_ids_path: str = None,
     seed: int = 124,
     model_args: dict = {
         "proper_model_args": {},
@@ -106,25 +119,37 @@ def main(
 ):
     random.seed(seed)
     # Instantiate task, generate all possible combinations of attributes, and shuffle.
-    dataset = load_dataset(dataset_path, split="validation")  # .shuffle(seed=seed)
-    images: list[str] = [load_image(i) for i in dataset["image"]]
+    if image_ids_path is not None:
+        # images were already added to the store by preprocess_images.py
+        preprocessed = read_artifact(image_ids_path)
+        if image_store_path is None:
+            image_store_path = preprocessed["image_store"].iloc[0]
+        image_store = ImageStore(image_store_path)
+        image_ids = preprocessed["image_id"].tolist()
+    else:
+        dataset = load_dataset(dataset_path, split="validation")  # .shuffle(seed=seed)
+        # images are only added to the store once they are used, and rows reference them by id
+        if image_store_path is None:
+            image_store_path = Path(output_path).parent / "images"
+        image_store = ImageStore(image_store_path)
+        image_ids = DatasetImages(dataset, image_store)
     # instantiate task object
     task_obj = available_tasks[task]
     # Instantiate model that will be used to generate user prompts.
     model_args["proper_model_args"]["model"] = model_name
+    model_args["sampling_params"]["stop"] = task_obj.stop_sequences.get("meta")
     model = instantiate_model(model_type, model_args)
     if model.model_type() == "vllm":
         simulated_user_prompts = generate_user_prompts_batched(
-            task_obj, images, model, n_prompts
+            task_obj, image_ids, image_store, model, n_prompts
         )
     else:
         simulated_user_prompts = generate_user_prompts_unbatched(
-            task_obj, images, model, n_prompts
+            task_obj, image_ids, image_store, model, n_prompts
         )
+    model.log_run_summary()
     # save prompts for later
-    pd.DataFrame.from_dict(simulated_user_prompts).to_json(
-        output_path, lines=True, orient="records", force_ascii=False
-    )
+    write_artifact(pd.DataFrame.from_dict(simulated_user_prompts), output_path)
 
     return simulated_user_prompts
 
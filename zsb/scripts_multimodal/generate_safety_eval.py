@@ -1,7 +1,10 @@
 import pandas as pd
 from jsonargparse import CLI
 
+from zsb.artifacts import read_artifact, write_artifact
+from zsb.images import MetadataImages
 from zsb.models import instantiate_model
+from zsb.telemetry import metrics_columns
 from zsb.utils import SAFETY_TEMPALTE_VLM, parse_safety_output
 
 
@@ -10,14 +13,16 @@ def main(
     model_type: str,
     data_path: str,
     output_path: str,
+    image_store_path: str = None,
     model_args: dict = {
         "proper_model_args": {},
         "sampling_params": {"temperature": 0, "max_tokens": 8192},
     },
+    save_telemetry: bool = False,
 ):
     # load answers and task
-    data = pd.read_json(data_path, lines=True)
-    imgs = data["metadata"].apply(lambda x: x["image_str"])
+    data = read_artifact(data_path)
+    imgs = MetadataImages(data["metadata"], image_store_path)
     # load judge
     model_args["proper_model_args"]["model"] = model_name
     model_args["system_prompt"] = None
@@ -31,14 +36,15 @@ def main(
     parsed_results, parsed_feedbacks = zip(
         *[parse_safety_output(j) for j in judgements]
     )
+    model.log_run_summary()
     final_data = data.to_dict(orient="list")
     final_data["judgement"] = list(parsed_results)
     final_data["feedback"] = list(parsed_feedbacks)
+    if save_telemetry:
+        final_data.update(metrics_columns(model.last_metrics))
 
     # save
-    pd.DataFrame.from_dict(final_data).to_json(
-        output_path, lines=True, orient="records", force_ascii=False
-    )
+    write_artifact(pd.DataFrame.from_dict(final_data), output_path)
 
     return final_data
 
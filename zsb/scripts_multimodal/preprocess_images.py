@@ -0,0 +1,80 @@
+import itertools
+
+import pandas as pd
+import tqdm
+from datasets import Image as ImageFeature
+from datasets import load_dataset
+from jsonargparse import CLI
+
+from zsb.artifacts import write_artifact
+from zsb.images import (
+    DEFAULT_JPEG_QUALITY,
+    PREPROCESSING_STATS,
+    ImageStore,
+    preprocess_images,
+)
+
+
+def main(
+    dataset_path: str,
+    image_store_path: str,
+    output_path: str,
+    split: str = "validation",
+    image_column: str = "image",
+    n_images: int = None,
+    max_side: int = None,
+    max_pixels: int = None,
+    quality: int = DEFAULT_JPEG_QUALITY,
+    patch_size: int = 28,
+    num_workers: int = None,
+    chunk_size: int = 16,
+    streaming: bool = True,
+):
+    """Decodes, downscales and encodes the images of a HF dataset split in a process pool.
+
+    Images are added to the image store, and their ids and preprocessing stats are saved to
+    output_path, which can be passed to generate_prompts.py as image_ids_path.
+    max_side and max_pixels should match the tiling of the target VLM (patch_size is used to
+    estimate its visual tokens).
+    """
+    # stream undecoded images, so that decoding happens in the workers
+    dataset = load_dataset(dataset_path, split=split, streaming=streaming)
+    dataset = dataset.cast_column(image_column, ImageFeature(decode=False))
+    images = (row[image_column] for row in dataset)
+    if n_images is not None:
+        images = itertools.islice(images, n_images)
+    image_store = ImageStore(image_store_path)
+    rows = []
+    for image_id, stats in tqdm.tqdm(
+        preprocess_images(
+            images,
+            image_store,
+            max_side=max_side,
+            max_pixels=max_pixels,
+            quality=quality,
+            patch_size=patch_size,
+            num_workers=num_workers,
+            chunk_size=chunk_size,
+        ),
+        desc="Preprocessing images...",
+    ):
+        rows.append({"image_id": image_id, **stats})
+    rows = pd.DataFrame(rows, columns=["image_id", *PREPROCESSING_STATS])
+    rows["image_store"] = str(image_store.root)
+    if rows.empty:
+        print("No images to preprocess.")
+    else:
+        print(
+            f"Preprocessed {len(rows)} images ({rows['image_id'].nunique()} unique): "
+            f"{rows['bytes'].mean() / 1024:.1f} KiB per image on average, "
+            f"{rows['orig_visual_tokens'].sum() - rows['visual_tokens'].sum()} estimated visual tokens saved "
+            f"({rows['orig_visual_tokens'].mean():.0f} -> {rows['visual_tokens'].mean():.0f} per image)."
+        )
+    # save image ids and stats
+    write_artifact(rows, output_path)
+
+    return rows
+
+
+if __name__ == "__main__":
+    CLI([main], as_positional=False)
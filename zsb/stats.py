@@ -0,0 +1,151 @@
+from statistics import NormalDist
+
+import numpy as np
+
+
+def z_score(confidence: float) -> float:
+    """Two-sided normal critical value (e.g., 1.96 for 0.95)."""
+    return NormalDist().inv_cdf((1 + confidence) / 2)
+
+
+def clt_mean_ci(scores: np.ndarray, confidence: float = 0.95) -> np.ndarray:
+    """Normal-approximation confidence intervals of the means of the columns of scores.
+
+    Args:
+        scores: (n_items, n_models) matrix of scores.
+    Returns:
+        (n_models, 2) matrix of lower and upper bounds.
+    """
+    means = scores.mean(axis=0)
+    half_widths = (
+        z_score(confidence) * scores.std(axis=0, ddof=1) / np.sqrt(len(scores))
+    )
+    return np.stack([means - half_widths, means + half_widths], axis=1)
+
+
+def bootstrap_means(
+    scores: np.ndarray, n_bootstrap: int = 1000, rng: np.random.Generator = None
+) -> np.ndarray:
+    """Means of the columns of scores over bootstrap resamples of the items.
+
+    Models are resampled on the same items, which keeps their comparisons paired.
+
+    Args:
+        scores: (n_items, n_models) matrix of scores.
+    Returns:
+        (n_bootstrap, n_models) matrix of resampled means.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    indices = rng.integers(0, len(scores), size=(n_bootstrap, len(scores)))
+    return scores[indices].mean(axis=1)
+
+
+def bootstrap_mean_ci(
+    scores: np.ndarray,
+    confidence: float = 0.95,
+    n_bootstrap: int = 1000,
+    rng: np.random.Generator = None,
+) -> np.ndarray:
+    """Percentile bootstrap confidence intervals of the means of the columns of scores.
+
+    Returns:
+        (n_models, 2) matrix of lower and upper bounds.
+    """
+    boot_means = bootstrap_means(scores, n_bootstrap, rng)
+    alpha = (1 - confidence) / 2
+    return np.quantile(boot_means, [alpha, 1 - alpha], axis=0).T
+
+
+def ranking_confidence(
+    scores: np.ndarray, n_bootstrap: int = 1000, rng: np.random.Generator = None
+) -> float:
+    """Fraction of bootstrap resamples of the items that give the same ranking of models.
+
+    Args:
+        scores: (n_items, n_models) matrix of scores.
+    """
+    ranking = np.argsort(-scores.mean(axis=0))
+    boot_rankings = np.argsort(-bootstrap_means(scores, n_bootstrap, rng), axis=1)
+    return float((boot_rankings == ranking).all(axis=1).mean())
+
+
+def bootstrap_counts(
+    n_items: int, n_bootstrap: int = 1000, rng: np.random.Generator = None
+) -> np.ndarray:
+    """Number of times each item is drawn in each bootstrap resample.
+
+    Returns:
+        (n_bootstrap, n_items) matrix of counts, from a single matrix of resample indices.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    indices = rng.integers(0, n_items, size=(n_bootstrap, n_items))
+    indices += n_items * np.arange(n_bootstrap)[:, None]
+    return np.bincount(indices.ravel(), minlength=n_bootstrap * n_items).reshape(
+        n_bootstrap, n_items
+    )
+
+
+def grouped_bootstrap_means(
+    values: np.ndarray, groups: np.ndarray, counts: np.ndarray
+) -> np.ndarray:
+    """Bootstrap means of several columns within several groups of items, in one product.
+
+    Args:
+        values: (n_items, n_columns) values, with NaN where missing.
+        groups: (n_items, n_groups) boolean membership of each item in each group (groups
+            may overlap, e.g., one group per attribute value plus one with all items).
+        counts: (n_bootstrap, n_items) resample counts (see bootstrap_counts).
+    Returns:
+        (n_bootstrap, n_groups, n_columns) matrix of means (NaN for empty resamples).
+    """
+    present = ~np.isnan(values)
+    # (n_items, n_groups * n_columns) sums and sizes of each group and column
+    weights = groups[:, :, None] & present[:, None, :]
+    sums = counts @ (weights * np.nan_to_num(values)[:, None, :]).reshape(
+        len(values), -1
+    )
+    sizes = counts @ weights.reshape(len(values), -1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / sizes
+    return means.reshape(len(counts), groups.shape[1], values.shape[1])
+
+
+def sign_flip_test(
+    differences: np.ndarray,
+    n_permutations: int = 10000,
+    rng: np.random.Generator = None,
+) -> np.ndarray:
+    """Two-sided paired permutation test of a zero mean difference, for several pairs at once.
+
+    Under the null hypothesis, the sign of each item's difference is random, so the observed
+    mean is compared to the means of randomly sign-flipped differences.
+
+    Args:
+        differences: (n_items, n_pairs) paired differences, with NaN where missing.
+    Returns:
+        (n_pairs,) p-values.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    present = ~np.isnan(differences)
+    differences = np.nan_to_num(differences)
+    observed = np.abs(differences.sum(axis=0))
+    signs = rng.choice([-1.0, 1.0], size=(n_permutations, len(differences)))
+    null = np.abs(signs @ differences)
+    # observed sums are compared with a tolerance, since exact ties are common with integer scores
+    extreme = (null >= observed - 1e-9).sum(axis=0)
+    p_values = (extreme + 1) / (n_permutations + 1)
+    return np.where(present.any(axis=0), p_values, np.nan)
+
+
+def holm_adjust(p_values: np.ndarray) -> np.ndarray:
+    """Holm-Bonferroni adjusted p-values, which control the family-wise error rate."""
+    order = np.argsort(p_values)
+    adjusted = np.maximum.accumulate(
+        (len(p_values) - np.arange(len(p_values))) * p_values[order]
+    )
+    result = np.empty_like(adjusted)
+    result[order] = np.minimum(adjusted, 1)
+    return result
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from string import Template
 from typing import Callable
 
@@ -30,6 +30,11 @@ class Task(ABC):
         relative_judge_prompt (dict[str, Template]): Same structure as the da judge prompt, but the goal is to compare two answers to the task.
             The output must be a preferred option (A or B) and an explanation.
             Must have placeholders for "prompt", "answer_A", and "answer_B".
+        stop_sequences (dict[str, list[str]]): Stop sequences of the outputs of the "meta", "da"
+            and "relative" prompts (e.g., the last end tag of the meta prompt output format).
+            Generation stops once one is produced, and the stop sequence is kept in the output so
+            the parsers see the same text. They must not occur anywhere else in the output, which
+            rules out the end of the judges' JSON (e.g., '"}' may appear in the feedback).
 
     Methods:
         parse_meta_prompt_output(output: str) -> dict[str, str]:
@@ -70,6 +75,7 @@ class Task(ABC):
     meta_prompt: dict[str, str | Template]
     da_judge_prompt: dict[str, Template]
     relative_judge_prompt: dict[str, Template]
+    stop_sequences: dict[str, list[str]] = field(default_factory=dict)
 
     @staticmethod
     @abstractmethod
@@ -155,6 +155,11 @@ IMPORTANT: ABIDE STRICTLY BY THE REQUESTED FORMAT AND GENERATED UNTIL THE END OF
             "user_prompt": Template(""""""),
         }
     )
+    stop_sequences: dict[str, list[str]] = field(
+        default_factory=lambda: {
+            "meta": ["<END OF SCORE 5 TRANSLATION FEEDBACK>"],
+        }
+    )
 
     @staticmethod
     def parse_meta_prompt_output(output: str) -> dict[str, str] | bool:
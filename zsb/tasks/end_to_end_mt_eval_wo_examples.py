@@ -109,6 +109,11 @@ IMPORTANT: ABIDE STRICTLY BY THE REQUESTED FORMAT AND KEEP GENERATING UNTIL THE
             "user_prompt": Template(""""""),
         }
     )
+    stop_sequences: dict[str, list[str]] = field(
+        default_factory=lambda: {
+            "meta": ["<END OF SCORE 5 DESCRIPTION>"],
+        }
+    )
 
     @staticmethod
     def parse_meta_prompt_output(output: str) -> dict[str, str] | bool:
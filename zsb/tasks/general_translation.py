@@ -154,6 +154,11 @@ You may proceed to evaluate the translation. Ensure the output is valid JSON, wi
             "user_prompt": Template(""""""),
         }
     )
+    stop_sequences: dict[str, list[str]] = field(
+        default_factory=lambda: {
+            "meta": ["<END OF REFERENCE TRANSLATION>"],
+        }
+    )
 
     @staticmethod
     def parse_meta_prompt_output(output: str) -> dict[str, str] | bool:
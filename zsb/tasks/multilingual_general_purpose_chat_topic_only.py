@@ -203,6 +203,11 @@ You may proceed to evaluate the response. Ensure the output is valid JSON, witho
             ),
         }
     )
+    stop_sequences: dict[str, list[str]] = field(
+        default_factory=lambda: {
+            "meta": ["<END OF REFERENCE>"],
+        }
+    )
 
     @staticmethod
     def parse_meta_prompt_output(output: str) -> dict[str, str] | bool:
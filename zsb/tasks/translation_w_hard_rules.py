@@ -78,6 +78,11 @@ IMPORTANT: Your response should be structured as follows:
             "user_prompt": Template(""""""),
         }
     )
+    stop_sequences: dict[str, list[str]] = field(
+        default_factory=lambda: {
+            "meta": ["<END OF REFERENCE>"],
+        }
+    )
 
     @staticmethod
     def parse_meta_prompt_output(output: str) -> dict[str, str] | bool:
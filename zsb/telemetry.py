@@ -0,0 +1,99 @@
+from collections import Counter
+from dataclasses import dataclass, fields
+
+import numpy as np
+
+TELEMETRY_PREFIX = "telemetry_"
+
+
+@dataclass
+class RequestMetrics:
+    """Metrics of a single generation request. Fields a backend does not report are None.
+
+    Attributes:
+        queue_wait: Seconds between the start of the batch and the start of the request
+            (for vllm, the time the request spent in the scheduler queue).
+        start_time: When the request was sent (for vllm, when it arrived at the engine), in
+            seconds since the epoch.
+        latency: Seconds from the start of the request to its last token.
+        ttft: Seconds from the start of the request to its first token.
+        prompt_tokens: Number of prompt tokens.
+        completion_tokens: Number of generated tokens.
+        finish_reason: Why generation stopped (e.g., "stop" or "length").
+        retries: Number of failed attempts before the request succeeded.
+        cost: Cost of the request in USD, from litellm's pricing.
+    """
+
+    queue_wait: float = None
+    start_time: float = None
+    latency: float = None
+    ttft: float = None
+    prompt_tokens: int = None
+    completion_tokens: int = None
+    finish_reason: str = None
+    retries: int = None
+    cost: float = None
+
+
+def metrics_columns(metrics: list[RequestMetrics]) -> dict[str, list]:
+    """Metrics as columns to attach to output rows, e.g., {"telemetry_latency": [...]}."""
+    return {
+        f"{TELEMETRY_PREFIX}{field.name}": [getattr(m, field.name) for m in metrics]
+        for field in fields(RequestMetrics)
+    }
+
+
+def _values(metrics: list[RequestMetrics], name: str) -> np.ndarray:
+    return np.array(
+        [getattr(m, name) for m in metrics if getattr(m, name) is not None],
+        dtype=float,
+    )
+
+
+def summarize_metrics(metrics: list[RequestMetrics], wall_seconds: float) -> dict:
+    """Latency percentiles, token throughput and total cost of a batch of requests."""
+    summary = {"requests": len(metrics), "wall_seconds": wall_seconds}
+    for name in ["latency", "ttft", "queue_wait"]:
+        values = _values(metrics, name)
+        if len(values):
+            for q in [50, 95, 99]:
+                summary[f"{name}_p{q}"] = float(np.percentile(values, q))
+    for name in ["prompt_tokens", "completion_tokens", "retries", "cost"]:
+        values = _values(metrics, name)
+        if len(values):
+            summary[name] = float(values.sum())
+    if "completion_tokens" in summary and wall_seconds > 0:
+        summary["completion_tokens_per_second"] = (
+            summary["completion_tokens"] / wall_seconds
+        )
+    finish_reasons = Counter(m.finish_reason for m in metrics if m.finish_reason)
+    if finish_reasons:
+        summary["finish_reasons"] = dict(finish_reasons)
+    return summary
+
+
+def format_summary(summary: dict) -> str:
+    lines = [
+        f"{summary['requests']} requests in {summary['wall_seconds']:.1f}s",
+    ]
+    if "latency_p50" in summary:
+        lines.append(
+            "latency p50/p95/p99: "
+            f"{summary['latency_p50']:.2f}/{summary['latency_p95']:.2f}/{summary['latency_p99']:.2f}s"
+        )
+    if "ttft_p50" in summary:
+        lines.append(
+            f"time to first token p50/p95: {summary['ttft_p50']:.2f}/{summary['ttft_p95']:.2f}s"
+        )
+    if "completion_tokens" in summary:
+        lines.append(
+            f"tokens: {summary.get('prompt_tokens', 0):.0f} prompt, {summary['completion_tokens']:.0f} completion "
+            f"({summary.get('completion_tokens_per_second', 0):.1f} completion tokens/s)"
+        )
+    if "finish_reasons" in summary:
+        lines.append(f"finish reasons: {summary['finish_reasons']}")
+    if summary.get("retries"):
+        lines.append(f"retries: {summary['retries']:.0f}")
+    if "cost" in summary:
+        lines.append(f"cost: ${summary['cost']:.4f}")
+    return "\n".join(lines)
@@ -0,0 +1,126 @@
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Iterator
+
+from zsb.utils import PathInput
+
+TRACE_PATH_ENV = "ZSB_TRACE_PATH"
+
+_NULL_SPAN = nullcontext()
+
+
+class Tracer:
+    """Collects spans and exports them as a Chrome trace (viewable in Perfetto or chrome://tracing).
+
+    Spans on the same thread nest by time, so a stage span contains the batch and request spans
+    that ran inside it.
+    """
+
+    def __init__(self, path: PathInput) -> None:
+        self.path = str(path)
+        self.events = []
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+
+    def record(
+        self, name: str, start: float, end: float, tid: int = None, **args
+    ) -> None:
+        """Records a span from start to end (in seconds since the epoch)."""
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": start * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": self.pid,
+            "tid": threading.get_ident() if tid is None else tid,
+            "args": args,
+        }
+        with self.lock:
+            self.events.append(event)
+
+    @contextmanager
+    def span(self, name: str, **args) -> Iterator[None]:
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.time(), **args)
+
+    def export(self) -> None:
+        with self.lock:
+            events = list(self.events)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+_tracer = None
+
+
+def enable_tracing(path: PathInput) -> Tracer:
+    """Starts tracing, exporting the trace to path when the process exits."""
+    global _tracer
+    _tracer = Tracer(path)
+    atexit.register(_tracer.export)
+    return _tracer
+
+
+def get_tracer() -> Tracer | None:
+    return _tracer
+
+
+def span(name: str, **args):
+    """Context manager that traces its body as a span. Does nothing if tracing is disabled."""
+    if _tracer is None:
+        return _NULL_SPAN
+    return _tracer.span(name, **args)
+
+
+def record_span(name: str, start: float, end: float, tid: int = None, **args) -> None:
+    """Records a span that was timed elsewhere (e.g., a request timed by vllm)."""
+    if _tracer is not None:
+        _tracer.record(name, start, end, tid, **args)
+
+
+def record_concurrent_spans(
+    name: str, spans: list[tuple[float, float, dict]], lane_offset: int = 1 << 20
+) -> None:
+    """Records overlapping spans (e.g., requests batched by vllm) on as few lanes as possible.
+
+    Each lane is shown as a separate thread, since spans on a thread must nest.
+    """
+    if _tracer is None:
+        return
+    lane_ends = []
+    for start, end, args in sorted(spans, key=lambda s: s[0]):
+        lane = next((i for i, e in enumerate(lane_ends) if e <= start), len(lane_ends))
+        if lane == len(lane_ends):
+            lane_ends.append(end)
+        lane_ends[lane] = end
+        _tracer.record(name, start, end, tid=lane_offset + lane, **args)
+
+
+def traced(name: str = None) -> Callable:
+    """Decorator that traces each call of a function as a span."""
+
+    def decorator(function: Callable) -> Callable:
+        span_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return function(*args, **kwargs)
+            with _tracer.span(span_name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+if os.environ.get(TRACE_PATH_ENV):
+    enable_tracing(os.environ[TRACE_PATH_ENV])
@@ -1,13 +1,20 @@
 import base64
+import gzip
+import hashlib
 import itertools
 import json
 from io import BytesIO
 from pathlib import Path
 from string import Template
-from typing import Iterable, List, Union
+from typing import Iterable, Iterator, List, TextIO, Union
 
 from PIL import Image
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 PathInput = Union[str, Path]
 
 SAFETY_TEMPALTE = Template(
@@ -197,6 +204,88 @@ def parse_safety_output(output: str) -> tuple[int, str]:
     return judgement, feedback
 
 
+def open_text(path: PathInput, mode: str = "r") -> TextIO:
+    """Opens a text file, transparently (de)compressing .gz and .zst files.
+
+    Args:
+        path: The path to the file.
+        mode: One of "r", "w" or "a".
+    """
+    path = Path(path)
+    if mode != "r":
+        path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == ".gz":
+        return gzip.open(path, f"{mode}t", encoding="utf-8")
+    if path.suffix == ".zst":
+        if zstandard is None:
+            raise ImportError("Reading or writing .zst files requires zstandard.")
+        return zstandard.open(path, f"{mode}t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class LineWriter:
+    """Writes lines to a file one at a time, flushing periodically.
+
+    Lines can be escaped, meaning \n is transformed to \\n.
+    Use as a context manager:
+
+        with LineWriter(path, append=True) as writer:
+            for line in lines:
+                writer.write(line)
+
+    Args:
+        path: The path to the file (.gz and .zst files are compressed).
+        append: Whether to append to the file instead of overwriting it.
+        escape_newline: Whether to escape newlines.
+        escape_return_char: Whether to escape carriage returns.
+        flush_every: Number of lines after which the file is flushed.
+        verbose: Whether to warn about escaped characters.
+    """
+
+    def __init__(
+        self,
+        path: PathInput,
+        append: bool = False,
+        escape_newline: bool = False,
+        escape_return_char: bool = True,
+        flush_every: int = 1000,
+        verbose: bool = True,
+    ) -> None:
+        self.path = path
+        self.append = append
+        self.escape_newline = escape_newline
+        self.escape_return_char = escape_return_char
+        self.flush_every = flush_every
+        self.verbose = verbose
+        self.n_lines = 0
+        self.file = None
+
+    def __enter__(self) -> "LineWriter":
+        self.file = open_text(self.path, "a" if self.append else "w")
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.file.close()
+
+    def write(self, line: str) -> None:
+        self.n_lines += 1
+        if self.escape_return_char:
+            if "\r" in line and self.verbose:
+                print(
+                    f"Detected carriage return in line {self.n_lines} (\\r). This may cause errors downstream. Escaping. This behaviour is the default; you can turn it off with escape_return_char."
+                )
+            line = line.replace("\r", "\\r")
+        if self.escape_newline:
+            if "\n" in line and self.verbose:
+                print(
+                    f"Found new line in line {self.n_lines} (\\n). This may cause errors downstream. Escaping."
+                )
+            line = line.replace("\n", "\\n")
+        self.file.write(f"{line}\n")
+        if self.n_lines % self.flush_every == 0:
+            self.file.flush()
+
+
 def write_lines(
     path: PathInput,
     lines: Iterable[str],
@@ -213,27 +302,38 @@ def write_lines(
         lines: The lines to write.
         escape_newline: Whether to escape newlines.
     """
-    # make dir, if not exists
-    if isinstance(path, str):
-        path = Path(path)
-    path.parent.mkdir(parents=True, exist_ok=True)
-    out_lines = []
-    for i, line in enumerate(lines):
-        if escape_return_char:
-            if "\r" in line and verbose:
-                print(
-                    f"Detected carriage return in line {i + 1} (\\r). This may cause errors downstream. Escaping. This behaviour is the default; you can turn it off with escape_return_char."
-                )
-            line = line.replace("\r", "\\r")
-        if escape_newline:
-            if "\n" in line and verbose:
-                print(
-                    f"Found new line in line {i + 1} (\\n). This may cause errors downstream. Escaping."
-                )
-            line = line.replace("\n", "\\n")
-        out_lines.append(line)
-    with open(path, "w", encoding="utf-8") as f:
-        f.writelines((f"{l}\n" for l in out_lines))
+    with LineWriter(
+        path,
+        escape_newline=escape_newline,
+        escape_return_char=escape_return_char,
+        verbose=verbose,
+    ) as writer:
+        for line in lines:
+            writer.write(line)
+
+
+def iter_lines(path: PathInput, unescape_newline: bool = False) -> Iterator[str]:
+    """Reads lines from a file one at a time.
+    Lines can be unescapped, meaning \\n is transformed to \n.
+    Args:
+        path: The path to the file (.gz and .zst files are decompressed).
+        unescape_newline: Whether to unescape newlines.
+    Yields:
+        The lines in the file."""
+    with open_text(path) as f:
+        for line in f:
+            if line.endswith("\n"):
+                line = line[:-1]
+            if unescape_newline:
+                line = line.replace("\\n", "\n")
+            yield line
+
+
+def iter_jsonl(path: PathInput) -> Iterator[dict]:
+    """Reads the records of a jsonl file one at a time."""
+    for line in iter_lines(path):
+        if line:
+            yield json.loads(line)
 
 
 def read_lines(path: PathInput, unescape_newline: bool = False) -> List[str]:
@@ -244,11 +344,25 @@ def read_lines(path: PathInput, unescape_newline: bool = False) -> List[str]:
         unescape_newline: Whether to unescape newlines.
     Returns:
         The lines in the file."""
-    with open(path, encoding="utf-8") as f:
-        lines = [l[:-1] for l in f.readlines()]
-    if unescape_newline:
-        lines = [l.replace("\\n", "\n") for l in lines]
-    return lines
+    return list(iter_lines(path, unescape_newline))
+
+
+def row_keys(judge_config: dict, *columns: Iterable[str]) -> list[str]:
+    """Stable keys of the rows formed by columns (e.g., prompts and answers) under a judge config.
+
+    Rows get the same key across runs iff their values and the judge config are the same, so
+    the keys can be used to reuse judgements of unchanged rows.
+    """
+    config = json.dumps(judge_config, sort_keys=True, ensure_ascii=False)
+    keys = []
+    for row in zip(*columns):
+        sha256 = hashlib.sha256(config.encode("utf-8"))
+        for value in row:
+            # length-prefix values so that different splits of the same text differ
+            value = str(value).encode("utf-8")
+            sha256.update(f"\0{len(value)}\0".encode("utf-8") + value)
+        keys.append(sha256.hexdigest())
+    return keys
 
 
 def get_all_possible_combinations(task_attributes) -> dict[str, str]:
@@ -0,0 +1,207 @@
+import json
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+from zsb.utils import PathInput
+
+
+class WorkQueue:
+    """Work queue backed by a SQLite file, to be placed on a filesystem shared by all nodes.
+
+    Items are split into chunks that workers lease for a limited time, renewing the lease with
+    heartbeats while they work. Chunks whose lease expired (e.g., because their worker was
+    preempted) are handed out again to other workers, up to max_attempts times, after which
+    they are marked as failed until retry_failed is called. Completing a chunk is idempotent:
+    only the first result committed for a chunk is kept.
+
+    Lease expiry relies on the nodes' clocks being (roughly) synchronized.
+
+    Args:
+        path: Path to the SQLite file.
+        timeout: Seconds to wait for the database lock.
+    """
+
+    def __init__(self, path: PathInput, timeout: float = 60) -> None:
+        self.path = str(path)
+        self.timeout = timeout
+
+    def _connect(self) -> closing[sqlite3.Connection]:
+        return closing(
+            sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        )
+
+    def init(self, n_items: int, chunk_size: int, config: dict) -> None:
+        """Creates the queue with chunks covering n_items. Does nothing if it already exists."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+            )
+            conn.execute("""CREATE TABLE IF NOT EXISTS chunks (
+                    chunk_id INTEGER PRIMARY KEY,
+                    start INTEGER,
+                    end INTEGER,
+                    status TEXT DEFAULT 'pending',
+                    worker_id TEXT,
+                    lease_expires REAL,
+                    attempts INTEGER DEFAULT 0
+                )""")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results (chunk_id INTEGER PRIMARY KEY, value TEXT)"
+            )
+            existing = conn.execute(
+                "SELECT value FROM meta WHERE key = 'config'"
+            ).fetchone()
+            if existing is None:
+                conn.execute(
+                    "INSERT INTO meta VALUES ('config', ?)", (json.dumps(config),)
+                )
+                conn.executemany(
+                    "INSERT INTO chunks (chunk_id, start, end) VALUES (?, ?, ?)",
+                    [
+                        (i, start, min(start + chunk_size, n_items))
+                        for i, start in enumerate(range(0, n_items, chunk_size))
+                    ],
+                )
+            conn.execute("COMMIT")
+
+    def config(self) -> dict:
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'config'").fetchone()
+        return json.loads(row[0])
+
+    def lease(
+        self, worker_id: str, lease_seconds: float, max_attempts: int = 3
+    ) -> dict | None:
+        """Leases a pending chunk, or one whose lease expired.
+
+        Returns:
+            The chunk ({"chunk_id", "start", "end", "attempts"}) or None if none is available.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # chunks that ran out of attempts are given up on
+            conn.execute(
+                """UPDATE chunks SET status = 'failed'
+                WHERE attempts >= ?
+                AND (status = 'pending' OR (status = 'leased' AND lease_expires < ?))""",
+                (max_attempts, now),
+            )
+            row = conn.execute(
+                """SELECT chunk_id, start, end, attempts FROM chunks
+                WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?)
+                ORDER BY attempts, chunk_id LIMIT 1""",
+                (now,),
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    """UPDATE chunks
+                    SET status = 'leased', worker_id = ?, lease_expires = ?, attempts = attempts + 1
+                    WHERE chunk_id = ?""",
+                    (worker_id, now + lease_seconds, row[0]),
+                )
+            conn.execute("COMMIT")
+        if row is None:
+            return None
+        return dict(zip(["chunk_id", "start", "end", "attempts"], row))
+
+    def heartbeat(self, chunk_id: int, worker_id: str, lease_seconds: float) -> bool:
+        """Extends a lease. Returns False if the worker no longer holds it."""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                """UPDATE chunks SET lease_expires = ?
+                WHERE chunk_id = ? AND worker_id = ? AND status = 'leased'""",
+                (time.time() + lease_seconds, chunk_id, worker_id),
+            )
+        return cursor.rowcount > 0
+
+    def release(self, chunk_id: int, worker_id: str) -> None:
+        """Gives a leased chunk back to the queue (e.g., after a failure)."""
+        with self._connect() as conn:
+            conn.execute(
+                """UPDATE chunks SET status = 'pending', worker_id = NULL, lease_expires = NULL
+                WHERE chunk_id = ? AND worker_id = ? AND status = 'leased'""",
+                (chunk_id, worker_id),
+            )
+
+    def complete(self, chunk_id: int, worker_id: str, results: list) -> bool:
+        """Commits the results of a chunk.
+
+        Returns:
+            Whether these results were kept (False if the chunk had already been completed).
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO results VALUES (?, ?)",
+                (chunk_id, json.dumps(results, ensure_ascii=False)),
+            )
+            conn.execute(
+                "UPDATE chunks SET status = 'done', worker_id = ? WHERE chunk_id = ? AND status != 'done'",
+                (worker_id, chunk_id),
+            )
+            conn.execute("COMMIT")
+        return cursor.rowcount > 0
+
+    def retry_failed(self) -> int:
+        """Hands the failed chunks out again, with their attempts reset.
+
+        Returns:
+            The number of chunks reset.
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                """UPDATE chunks
+                SET status = 'pending', worker_id = NULL, lease_expires = NULL, attempts = 0
+                WHERE status = 'failed'"""
+            )
+        return cursor.rowcount
+
+    def progress(self) -> dict[str, int]:
+        """Number of chunks per status (pending, leased, done and failed)."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT status, COUNT(*) FROM chunks GROUP BY status"
+            ).fetchall()
+        return {"pending": 0, "leased": 0, "done": 0, "failed": 0, **dict(rows)}
+
+    def results(self) -> list:
+        """Concatenated results of all completed chunks, in chunk order."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT value FROM results ORDER BY chunk_id"
+            ).fetchall()
+        return [r for (value,) in rows for r in json.loads(value)]
+
+
+class LeaseHeartbeat:
+    """Context manager that keeps renewing a chunk's lease from a background thread."""
+
+    def __init__(
+        self, queue: WorkQueue, chunk_id: int, worker_id: str, lease_seconds: float
+    ) -> None:
+        self.queue = queue
+        self.chunk_id = chunk_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.lease_seconds / 3):
+            if not self.queue.heartbeat(
+                self.chunk_id, self.worker_id, self.lease_seconds
+            ):
+                print(f"Lost the lease of chunk {self.chunk_id}.")
+                return
+
+    def __enter__(self) -> "LeaseHeartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._stop.set()
+        self._thread.join()